@@ -0,0 +1,138 @@
+# admission.py
+import shutil
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict
+
+from config import cfg
+import utils
+import disc_ops
+import job_store
+
+_GB = 1024**3
+
+@dataclass
+class SpaceSnapshot:
+    free_bytes: int            # Free space on raw_directory right now
+    reserved_bytes: int        # Estimated size of rips still in progress
+    pending_bytes: int         # Raw files waiting for (or in) encoding that will be deleted afterwards
+    queue_depth: int           # Jobs waiting for an encoder
+    waiting_bytes: int = 0     # Estimated size of rips paused for space
+
+    @property
+    def projected_free(self) -> int:
+        return self.free_bytes - self.reserved_bytes
+
+    @property
+    def pressure(self) -> bool:
+        """Space is tight: less than twice the floor left once the paused rips are counted too."""
+        return self.projected_free - self.waiting_bytes < int(cfg.raw_min_free_gb * _GB) * 2
+
+    def summary(self) -> str:
+        return (
+            f"raw free {self.free_bytes / _GB:.1f} GB, projected {self.projected_free / _GB:.1f} GB, "
+            f"pending encode {self.pending_bytes / _GB:.1f} GB in {self.queue_depth} job(s)"
+        )
+
+class AdmissionController:
+    """
+    Gate between ripping and encoding based on free space in cfg.raw_directory.
+    Each rip reserves its estimated size (from the scanned title 'Size') before it
+    starts. If the rip would leave less than cfg.raw_min_free_gb free, it waits for
+    encodes to delete raw files (policy 'pause') or only warns (policy 'warn').
+    While space is tight the scheduler is told to encode the largest raw files first.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self._reserved: Dict[str, int] = {}
+        self._waiting: Dict[str, int] = {}    # Rips paused in admit()
+        self._cond = threading.Condition()
+
+    # --- Measurements ---
+    def estimate_rip_bytes(self, title_info: Dict) -> int:
+        return int(disc_ops.parse_size(title_info.get("Size", "")) * (1 + cfg.rip_size_margin))
+
+    def free_bytes(self) -> int:
+        try:
+            utils.ensure_directory(cfg.raw_directory)
+            return shutil.disk_usage(cfg.raw_directory).free
+        except OSError:
+            return 0
+
+    def snapshot(self) -> SpaceSnapshot:
+        """Current space figures; also updates the scheduler's space pressure from them."""
+        store = self.scheduler.store
+        pending_bytes, depth = 0, 0
+        # Only raw files that an encode will free (with keep_raw_files, verified jobs keep theirs)
+        for job in store.jobs(store.raw_pending_states):
+            if job.state == job_store.QUEUED: depth += 1
+            try: pending_bytes += job.input_path.stat().st_size
+            except OSError: pass
+        with self._cond:
+            reserved = sum(self._reserved.values())
+            waiting = sum(self._waiting.values())
+        snap = SpaceSnapshot(self.free_bytes(), reserved, pending_bytes, depth, waiting)
+        self._update_pressure(snap.pressure)
+        return snap
+
+    # --- Admission ---
+    def admit(self, key: str, title_info: Dict, log_path: Path) -> bool:
+        """
+        Reserves space for one rip. Blocks while space is short (pause policy).
+        Returns False if the rip can't fit and no encode is left that could free space.
+        """
+        needed = self.estimate_rip_bytes(title_info)
+        floor = int(cfg.raw_min_free_gb * _GB)
+
+        with self._cond:
+            try:
+                return self._admit(key, title_info, log_path, needed, floor)
+            finally:
+                self._waiting.pop(key, None)
+
+    def _admit(self, key: str, title_info: Dict, log_path: Path, needed: int, floor: int) -> bool:
+        # Counted as waiting until admitted, then as reserved, so the space pressure
+        # the scheduler sees always includes this rip
+        self._waiting[key] = needed
+        warned = False
+        while True:
+            snap = self.snapshot()
+            if snap.projected_free - needed >= floor:
+                self._reserved[key] = needed
+                return True
+
+            msg = (f"Low raw space for {title_info.get('TitleName', key)} "
+                   f"(needs ~{needed / _GB:.1f} GB): {snap.summary()}")
+
+            if cfg.admission_policy == "warn":
+                utils.console(f"WARNING: {msg}")
+                utils.append_log_line(log_path, f"ADMISSION WARN {msg}")
+                self._reserved[key] = needed
+                return True
+
+            if snap.pending_bytes == 0:
+                # Nothing left to encode, so waiting can't free anything
+                utils.console(f"ADMISSION REFUSED: {msg}")
+                utils.append_log_line(log_path, f"ADMISSION REFUSED {msg}")
+                return False
+
+            if not warned:
+                utils.console(f"Paused: {msg}. Waiting for encodes to free space...")
+                utils.append_log_line(log_path, f"ADMISSION PAUSE {msg}")
+                warned = True
+            # Raw deletions happen in other threads/processes, so re-measure periodically
+            self._cond.wait(timeout=15)
+
+    def release(self, key: str) -> None:
+        """Drops a rip's reservation once its file is on disk (it then counts as pending)."""
+        with self._cond:
+            self._reserved.pop(key, None)
+            self._cond.notify_all()
+
+    def _update_pressure(self, pressure: bool) -> None:
+        if pressure != self.scheduler.space_pressure:
+            self.scheduler.space_pressure = pressure
+            utils.console("Raw space is tight: encoding largest raw files first." if pressure
+                          else "Raw space recovered: normal encode order.")
@@ -0,0 +1,237 @@
+# backlog.py
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import cfg
+import utils
+
+# inotify(7) event masks
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_ISDIR = 0x40000000
+_IN_EVENT_HEADER = struct.Struct("iIII")
+
+class BacklogIndex:
+    """
+    Persistent manifest of raw MKVs and encoded MP4s, used by reprocess.py.
+    A folder is only re-listed when its own mtime changed (files added,
+    removed or renamed), so a rescan costs one stat per disc folder instead
+    of one stat per file, which matters most for the encoded folder on a NAS.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.raw: Dict[str, Dict] = {}
+        self.encoded: Dict[str, Dict] = {}
+        # Raw MKVs skipped as duplicates: path -> [size, mtime, archived MP4 it duplicates]
+        self.skipped: Dict[str, List] = {}
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            self.raw = data.get("raw", {})
+            self.encoded = data.get("encoded", {})
+            self.skipped = data.get("skipped", {})
+        except (OSError, ValueError):
+            pass
+
+    def save(self) -> None:
+        try:
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"raw": self.raw, "encoded": self.encoded, "skipped": self.skipped}),
+                           encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            utils.console(f"WARNING: Could not save backlog index: {e}")
+
+    def raw_files(self, disc_folder: Path, force: bool = False) -> Dict[str, List[float]]:
+        """{mkv name: [size, mtime]} for a raw disc folder, re-listed only if it changed."""
+        try:
+            mtime = disc_folder.stat().st_mtime
+        except OSError:
+            self.raw.pop(disc_folder.name, None)
+            return {}
+        entry = self.raw.get(disc_folder.name)
+        if force or not entry or entry["mtime"] != mtime:
+            files = {}
+            for p in disc_folder.glob("*.mkv"):
+                try:
+                    st = p.stat()
+                    files[p.name] = [st.st_size, st.st_mtime]
+                except OSError:
+                    continue
+            entry = {"mtime": mtime, "files": files}
+            self.raw[disc_folder.name] = entry
+        return entry["files"]
+
+    def encoded_stems(self, disc_label: str) -> set:
+        """Stems of the .mp4 files already in the encoded folder for a disc."""
+        folder = cfg.encoded_directory / disc_label
+        try:
+            mtime = folder.stat().st_mtime
+        except OSError:
+            self.encoded.pop(disc_label, None)
+            return set()
+        entry = self.encoded.get(disc_label)
+        if not entry or entry["mtime"] != mtime:
+            entry = {"mtime": mtime, "stems": [p.stem for p in folder.glob("*.mp4")]}
+            self.encoded[disc_label] = entry
+        return set(entry["stems"])
+
+    def is_encoded(self, mkv_path: Path) -> bool:
+        return mkv_path.stem in self.encoded_stems(mkv_path.parent.name)
+
+    def mark_skipped(self, mkv_path: Path, existing: Path) -> None:
+        """Remembers a raw MKV whose content is archived as existing, so later runs don't hash it again."""
+        try:
+            st = mkv_path.stat()
+        except OSError:
+            return
+        self.skipped[str(mkv_path)] = [st.st_size, st.st_mtime, str(existing)]
+
+    def is_skipped(self, mkv_path: Path) -> bool:
+        """True while the file is unchanged since it was skipped and its archived duplicate still exists."""
+        entry = self.skipped.get(str(mkv_path))
+        if not entry: return False
+        # Rewriting a file in place doesn't change its folder's mtime, so stat the file itself
+        return entry[:2] == _file_stat(mkv_path) and Path(entry[2]).exists()
+
+    def pending(self) -> List[Tuple[Path, str]]:
+        """Raw MKVs with no matching encoded file, as (mkv_path, disc_label)."""
+        results = []
+        seen = set()
+        listed = set()
+        for disc_folder in cfg.raw_directory.iterdir():
+            # Dot-folders hold our own state (scan cache etc.), not discs
+            if not disc_folder.is_dir() or disc_folder.name.startswith("."): continue
+            seen.add(disc_folder.name)
+            files = self.raw_files(disc_folder)
+            if not files: continue
+            done = self.encoded_stems(disc_folder.name)
+            for name in sorted(files):
+                mkv_path = disc_folder / name
+                listed.add(str(mkv_path))
+                if Path(name).stem not in done and not self.is_skipped(mkv_path):
+                    results.append((mkv_path, disc_folder.name))
+
+        for gone in set(self.raw) - seen:
+            del self.raw[gone]
+        self.skipped = {p: entry for p, entry in self.skipped.items() if p in listed}
+        self.save()
+        return results
+
+# --- Watch mode ---
+def _file_stat(path: Path) -> Optional[List[float]]:
+    """[size, mtime] of a file, read fresh (appending to a file doesn't change its folder's mtime)."""
+    try:
+        st = path.stat()
+        return [st.st_size, st.st_mtime]
+    except OSError:
+        return None
+
+def watch(index: BacklogIndex, on_new_file: Callable[[Path, str], None]) -> None:
+    """
+    Calls on_new_file(mkv_path, disc_label) for every raw MKV that lands under
+    cfg.raw_directory. Uses inotify on Linux, polling everywhere else. Blocks forever.
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            _watch_inotify(index, on_new_file)
+            return
+        except OSError as e:
+            utils.console(f"inotify unavailable ({e}), falling back to polling.")
+    _watch_polling(index, on_new_file)
+
+def _watch_polling(index: BacklogIndex, on_new_file: Callable[[Path, str], None]) -> None:
+    # A file is only reported once its size/mtime held still for a whole poll interval
+    last_seen: Dict[Path, List[float]] = {}
+    reported = set()
+    while True:
+        time.sleep(cfg.watch_poll_seconds)
+        current = {}
+        for mkv_path, disc_label in index.pending():
+            stat = _file_stat(mkv_path)
+            if stat is None: continue
+            current[mkv_path] = stat
+            if mkv_path not in reported and last_seen.get(mkv_path) == stat:
+                reported.add(mkv_path)
+                on_new_file(mkv_path, disc_label)
+        last_seen = current
+        reported &= set(current)
+
+def _watch_inotify(index: BacklogIndex, on_new_file: Callable[[Path, str], None]) -> None:
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    fd = libc.inotify_init1(os.O_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    watches: Dict[int, Path] = {}
+    # Files found in a new folder (no close event seen yet): path -> [size, mtime] at the last check
+    settling: Dict[Path, Optional[List[float]]] = {}
+    next_settle_check = time.monotonic() + cfg.watch_poll_seconds
+
+    def add_watch(folder: Path, mask: int) -> None:
+        wd = libc.inotify_add_watch(fd, os.fsencode(str(folder)), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+        watches[wd] = folder
+
+    def watch_disc_folder(folder: Path) -> None:
+        # MakeMKV writes in place (close-after-write); copies/moves arrive as a rename
+        add_watch(folder, _IN_CLOSE_WRITE | _IN_MOVED_TO)
+        # Anything that landed before the watch existed may still be open for writing: it is
+        # reported on its close event, or once its size/mtime held still for a poll interval
+        done = index.encoded_stems(folder.name)
+        for name in index.raw_files(folder, force=True):
+            if Path(name).stem not in done:
+                settling[folder / name] = _file_stat(folder / name)
+
+    try:
+        add_watch(cfg.raw_directory, _IN_CREATE | _IN_MOVED_TO)
+        for folder in cfg.raw_directory.iterdir():
+            if folder.is_dir() and not folder.name.startswith("."):
+                add_watch(folder, _IN_CLOSE_WRITE | _IN_MOVED_TO)
+
+        while True:
+            ready, _, _ = select.select([fd], [], [], min(1.0, cfg.watch_poll_seconds))
+            if settling and time.monotonic() >= next_settle_check:
+                next_settle_check = time.monotonic() + cfg.watch_poll_seconds
+                for path, stat in list(settling.items()):
+                    current = _file_stat(path)
+                    if current is None:
+                        del settling[path]
+                    elif current == stat:
+                        del settling[path]
+                        on_new_file(path, path.parent.name)
+                    else:
+                        settling[path] = current
+            if not ready: continue
+            buffer = os.read(fd, 64 * 1024)
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _cookie, length = _IN_EVENT_HEADER.unpack_from(buffer, offset)
+                name = buffer[offset + _IN_EVENT_HEADER.size: offset + _IN_EVENT_HEADER.size + length].rstrip(b"\0")
+                offset += _IN_EVENT_HEADER.size + length
+
+                parent = watches.get(wd)
+                if parent is None or not name: continue
+                path = parent / os.fsdecode(name)
+
+                if parent == cfg.raw_directory:
+                    if mask & _IN_ISDIR and not path.name.startswith("."):
+                        watch_disc_folder(path)
+                elif path.suffix.lower() == ".mkv":
+                    settling.pop(path, None)
+                    index.raw_files(parent, force=True)
+                    if not index.is_encoded(path):
+                        on_new_file(path, parent.name)
+            index.save()
+    finally:
+        os.close(fd)
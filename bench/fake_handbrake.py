@@ -0,0 +1,91 @@
+"""
+Stand-in for HandBrakeCLI used by the benchmark.
+Prints HandBrake-style progress lines for a controlled amount of time and
+writes a small output file whose size follows -q. '--scan' prints a
+1080p H.264 JSON title set. Timing comes from the environment:
+  BENCH_SPEEDUP       media seconds encoded per wall second (default 2000)
+  BENCH_HB_FAIL_RATE  fraction of runs that exit with rc=1 (default 0)
+"""
+import json
+import os
+import random
+import struct
+import sys
+import time
+
+def box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+def minimal_mp4(seconds: float, mdat_bytes: int = 4096) -> bytes:
+    """ftyp + moov (mvhd duration, one video and one audio trak) + a small mdat."""
+    timescale = 1000
+    mvhd = box(b"mvhd", bytes(4) + bytes(8) + struct.pack(">II", timescale, int(seconds * timescale)) + bytes(80))
+    def trak(handler: bytes) -> bytes:
+        hdlr = box(b"hdlr", bytes(4) + bytes(4) + handler + bytes(12) + b"\0")
+        return box(b"trak", box(b"mdia", hdlr))
+    moov = box(b"moov", mvhd + trak(b"vide") + trak(b"soun"))
+    return box(b"ftyp", b"isom" + bytes(4) + b"isomavc1") + moov + box(b"mdat", bytes(mdat_bytes))
+
+def read_seconds(input_path: str) -> float:
+    # Media length comes from the raw stub file (written by fake_makemkvcon / the harness)
+    try:
+        with open(input_path, "r", encoding="utf-8") as f:
+            return float(f.readline().strip() or 0)
+    except (OSError, ValueError):
+        return 60.0
+
+def scan(input_path: str) -> int:
+    seconds = int(read_seconds(input_path))
+    title = {
+        "Geometry": {"Width": 1920, "Height": 1080},
+        "FrameRate": {"Num": 24000, "Den": 1001},
+        "VideoCodec": "h264",
+        "Duration": {"Hours": seconds // 3600, "Minutes": seconds % 3600 // 60, "Seconds": seconds % 60},
+    }
+    print("JSON Title Set: " + json.dumps({"MainFeature": 0, "TitleList": [title]}, indent=4))
+    return 0
+
+def main() -> int:
+    args = sys.argv[1:]
+    if "--scan" in args:
+        return scan(args[args.index("-i") + 1])
+    output = args[args.index("-o") + 1]
+    input_path = args[args.index("-i") + 1]
+
+    seconds = read_seconds(input_path)
+    if "--stop-at" in args:
+        seconds = float(args[args.index("--stop-at") + 1].split(":")[1])
+    elif "--start-at" in args:
+        seconds = max(0.0, seconds - float(args[args.index("--start-at") + 1].split(":")[1]))
+
+    speedup = float(os.environ.get("BENCH_SPEEDUP", "2000"))
+    duration = seconds / speedup
+    print("HandBrake 1.9.0 (bench stub) - x86_64", flush=True)
+
+    start = time.monotonic()
+    while True:
+        elapsed = time.monotonic() - start
+        pct = min(100.0, 100.0 * elapsed / duration) if duration > 0 else 100.0
+        fps = 24.0 * speedup
+        eta = max(0, int(duration - elapsed))
+        sys.stdout.write(
+            f"Encoding: task 1 of 1, {pct:.2f} % ({fps:.2f} fps, avg {fps:.2f} fps, "
+            f"ETA {eta // 3600:02d}h{eta % 3600 // 60:02d}m{eta % 60:02d}s)\r"
+        )
+        sys.stdout.flush()
+        if pct >= 100.0: break
+        time.sleep(min(0.1, duration / 20 or 0.01))
+
+    if random.random() < float(os.environ.get("BENCH_HB_FAIL_RATE", "0")):
+        print("\nEncode failed (bench stub)", flush=True)
+        return 1
+
+    with open(output, "wb") as f:
+        # Roughly halves per +6 RF, like a real encoder; scaled down to keep the files tiny
+        quality = float(args[args.index("-q") + 1]) if "-q" in args else 23.0
+        f.write(minimal_mp4(seconds, int(seconds * 200 * 2 ** ((23 - quality) / 6))))
+    print("\nEncode done!", flush=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Stand-in for makemkvcon used by the benchmark.
+  info  prints robot-mode TINFO/SINFO lines for the titles in BENCH_TITLES
+  mkv   writes a stub MKV for one title, printing PRGV progress while it "reads"
+Environment:
+  BENCH_TITLES        JSON list of title lengths in seconds (default one 2h title)
+  BENCH_SCAN_SECONDS  time an 'info' scan takes (default 0.5)
+  BENCH_RIP_SPEEDUP   media seconds ripped per wall second (default 20000)
+  BENCH_READ_ERRORS   read-error MSG lines printed per progress update (default 0)
+  BENCH_RIP_STALL_AT  progress fraction where the "disc" stops reading (default: never)
+"""
+import json
+import os
+import sys
+import time
+
+def fmt(seconds: int) -> str:
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def titles() -> list:
+    return json.loads(os.environ.get("BENCH_TITLES", "[7200]"))
+
+# Stream table of every title: (type code, type, codec id, codec, language, channels, flags)
+STREAMS = [
+    (6201, "Video", "V_MPEG4/ISO/AVC", "Mpeg4", "", 0, 0),
+    (6202, "Audio", "A_TRUEHD", "TrueHD", "eng", 8, 0),
+    (6202, "Audio", "A_AC3", "AC3", "eng", 6, 2048),     # Core of the TrueHD track
+    (6202, "Audio", "A_AC3", "AC3", "eng", 2, 1),        # Director's comments
+    (6202, "Audio", "A_AC3", "AC3", "fra", 6, 0),
+    (6203, "Subtitles", "S_HDMV/PGS", "PGS", "eng", 0, 0),
+    (6203, "Subtitles", "S_HDMV/PGS", "PGS", "fra", 0, 0),
+]
+
+def info() -> int:
+    time.sleep(float(os.environ.get("BENCH_SCAN_SECONDS", "0.5")))
+    print('MSG:1005,0,1,"MakeMKV v1.17.7 linux(x64-release) started","%1 started","MakeMKV v1.17.7 linux(x64-release)"')
+    for i, seconds in enumerate(titles()):
+        size_gb = seconds * 4_000_000 / 1024**3
+        print(f'TINFO:{i},8,0,"{max(1, seconds // 600)}"')
+        print(f'TINFO:{i},9,0,"{fmt(seconds)}"')
+        print(f'TINFO:{i},10,0,"{size_gb:.1f} GB"')
+        print(f'TINFO:{i},11,0,"{seconds * 4_000_000}"')
+        print(f'TINFO:{i},25,0,"1"')
+        print(f'TINFO:{i},26,0,"{i + 1}"')
+        print(f'TINFO:{i},27,0,"title_t{i:02d}.mkv"')
+        for s, (type_code, kind, codec_id, codec, lang, channels, flags) in enumerate(STREAMS):
+            print(f'SINFO:{i},{s},1,{type_code},"{kind}"')
+            print(f'SINFO:{i},{s},5,0,"{codec_id}"')
+            print(f'SINFO:{i},{s},6,0,"{codec}"')
+            if lang: print(f'SINFO:{i},{s},3,0,"{lang}"')
+            if channels: print(f'SINFO:{i},{s},14,0,"{channels}"')
+            if flags: print(f'SINFO:{i},{s},22,0,"{flags}"')
+    return 0
+
+def mkv(args: list) -> int:
+    title_index, dest = int(args[2]), args[3]
+    seconds = titles()[title_index]
+    duration = seconds / float(os.environ.get("BENCH_RIP_SPEEDUP", "20000"))
+    errors = int(os.environ.get("BENCH_READ_ERRORS", "0"))
+    stall_at = float(os.environ.get("BENCH_RIP_STALL_AT", "2"))
+    start = time.monotonic()
+    while True:
+        frac = min(1.0, (time.monotonic() - start) / duration) if duration > 0 else 1.0
+        frac = min(frac, stall_at)
+        print(f"PRGV:{int(frac * 65536)},{int(frac * 65536)},65536", flush=True)
+        for _ in range(errors):
+            print('MSG:2003,0,3,"Error \'Scsi error - MEDIUM ERROR:L-EC UNCORRECTABLE ERROR\' occurred while reading '
+                  '\'/BDMV/STREAM/00001.m2ts\' at offset \'1048576\'","Error \'%1\' occurred while reading \'%2\' at offset \'%3\'",'
+                  '"Scsi error - MEDIUM ERROR:L-EC UNCORRECTABLE ERROR","/BDMV/STREAM/00001.m2ts","1048576"', flush=True)
+        if frac >= 1.0: break
+        time.sleep(min(0.1, duration / 20 or 0.01))
+    with open(os.path.join(dest, f"title_t{title_index:02d}.mkv"), "w", encoding="utf-8") as f:
+        f.write(f"{seconds}\n")
+    print('MSG:5036,0,1,"Copy complete. 1 titles saved.","Copy complete. %1 titles saved.","1"', flush=True)
+    return 0
+
+def main() -> int:
+    args = [a for a in sys.argv[1:] if not a.startswith("-")]
+    if not args: return 1
+    if args[0] == "info": return info()
+    if args[0] == "mkv": return mkv(args)
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
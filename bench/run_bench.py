@@ -0,0 +1,226 @@
+"""
+Offline benchmark of the rip/encode orchestration layer.
+
+Runs the real disc_ops / EncodeScheduler / EncodeWorker / utils code against
+the stub makemkvcon and HandBrakeCLI in this folder, so it needs no optical
+drive, GPU or licence. The stubs only sleep and print, which means every
+number reported here is orchestration cost and scaling behaviour, not codec
+speed.
+
+    python bench/run_bench.py
+    python bench/run_bench.py --workers 1,4,8 --depth 16,64 --mix episodes,features
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from config import cfg
+import utils
+import disc_ops
+from encoding import EncodeWorker
+from job_store import JobStore
+from scheduler import EncodeScheduler
+
+# Title mixes, as (min, max) lengths in seconds
+MIXES = {
+    "episodes": [(22 * 60, 45 * 60)],
+    "features": [(90 * 60, 180 * 60)],
+    "mixed":    [(22 * 60, 45 * 60), (90 * 60, 180 * 60)],
+}
+
+class LogCallTimer:
+    """Wraps utils._enqueue (every console/log write goes through it) and records how long callers block."""
+
+    def __init__(self, original):
+        self.original = original
+        self._stats_lock = threading.Lock()
+        self.waits: List[float] = []
+
+    def __call__(self, target, payload) -> None:
+        start = time.perf_counter()
+        self.original(target, payload)
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.waits.append(waited)
+
+def write_stub(tmp: Path, name: str, script: str) -> str:
+    """Wraps a stub script in an executable shell launcher (run_stream_log needs an executable)."""
+    launcher = tmp / name
+    launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{BENCH_DIR / script}" "$@"\n', encoding="utf-8")
+    launcher.chmod(0o755)
+    return str(launcher)
+
+def make_titles(mix: str, depth: int, seed: int) -> List[int]:
+    rng = random.Random(seed)
+    ranges = MIXES[mix]
+    return [rng.randint(*ranges[i % len(ranges)]) for i in range(depth)]
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values: return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def run_scenario(mix: str, workers: int, depth: int, opts) -> Dict:
+    with tempfile.TemporaryDirectory(prefix="mkbrake_bench_") as tmp_name:
+        tmp = Path(tmp_name)
+        mkv_bin = write_stub(tmp, "makemkvcon", "fake_makemkvcon.py")
+        hb_bin = write_stub(tmp, "HandBrakeCLI", "fake_handbrake.py")
+
+        titles = make_titles(mix, depth, opts.seed)
+        os.environ["BENCH_TITLES"] = json.dumps(titles)
+        os.environ["BENCH_SPEEDUP"] = str(opts.speedup)
+        os.environ["BENCH_RIP_SPEEDUP"] = str(opts.rip_speedup)
+        os.environ["BENCH_SCAN_SECONDS"] = str(opts.scan_seconds)
+
+        cfg.raw_directory = tmp / "raw"
+        cfg.encoded_directory = tmp / "encoded"
+        cfg.job_database = tmp / "jobs.db"
+        cfg.encoder_lanes = {cfg.video_codec: workers}
+        cfg.adaptive_concurrency = False
+        cfg.progress_report_seconds = 0
+        cfg.keep_raw_files = False
+        cfg.chunked_encoding = False
+
+        log_timer = LogCallTimer(utils._enqueue)
+        utils._enqueue = log_timer
+
+        store = JobStore(cfg.job_database, cleanup_verified=True)
+        scheduler = EncodeScheduler(store)
+
+        # Instrument queue wait (put -> claim) and the scheduler's decision cost
+        put_times: Dict[int, float] = {}
+        claim_times: Dict[int, float] = {}
+        decision_times: List[float] = []
+        original_claim, original_next = store.claim, scheduler._next_job
+
+        def timed_claim(job):
+            claim_times[job.id] = time.perf_counter()
+            return original_claim(job)
+
+        def timed_next_job():
+            start = time.perf_counter()
+            try: return original_next()
+            finally: decision_times.append(time.perf_counter() - start)
+
+        store.claim = timed_claim
+        scheduler._next_job = timed_next_job
+
+        pool = [EncodeWorker(scheduler, hb_bin) for _ in range(scheduler.worker_count)]
+        for w in pool: w.start()
+
+        label = f"BENCH_{mix.upper()}"
+        raw_dir = cfg.raw_directory / label
+        utils.ensure_directory(raw_dir)
+        log_path = raw_dir / "log_bench.txt"
+
+        start = time.perf_counter()
+
+        # Scan once, like a disc insert, then rip (single drive, serial) and queue
+        scan_start = time.perf_counter()
+        output = disc_ops.scan_disc(mkv_bin, "bench0", label)
+        scanned = disc_ops.parse_disc_titles(output or "", label)
+        scan_seconds = time.perf_counter() - scan_start
+
+        rip_seconds = 0.0
+        for title in scanned:
+            if opts.rip:
+                rip_start = time.perf_counter()
+                mkv = disc_ops.rip_title(mkv_bin, "bench0", raw_dir, title, label, log_path)
+                rip_seconds += time.perf_counter() - rip_start
+            else:
+                mkv = raw_dir / f"title_t{title['RawID']:02d}.mkv"
+                mkv.write_text(f"{title['Seconds']}\n", encoding="utf-8")
+            job_id = scheduler.put((mkv, label, log_path, title))
+            if job_id is not None:
+                put_times[job_id] = time.perf_counter()
+
+        scheduler.join()
+        wall = time.perf_counter() - start
+
+        for _ in pool: scheduler.put(None)
+        for w in pool: w.join()
+
+        utils._enqueue = log_timer.original
+        utils.flush_logs()
+        jobs = store.jobs()
+        store.close()
+        waits = [claim_times[i] - put_times[i] for i in put_times if i in claim_times]
+        log_waits = log_timer.waits
+
+        return {
+            "mix": mix,
+            "workers": workers,
+            "depth": depth,
+            "done": sum(1 for j in jobs if j.state == "raw-deleted"),
+            "wall_s": wall,
+            "scan_s": scan_seconds,
+            "rip_s": rip_seconds,
+            "jobs_per_s": len(jobs) / wall if wall else 0.0,
+            "media_x": sum(t["Seconds"] for t in scanned) / wall if wall else 0.0,
+            "wait_avg_s": statistics.mean(waits) if waits else 0.0,
+            "wait_p95_s": percentile(waits, 95),
+            "sched_ms_per_job": 1000 * sum(decision_times) / max(1, len(jobs)),
+            "log_calls": len(log_waits),
+            "log_call_avg_us": 1e6 * statistics.mean(log_waits) if log_waits else 0.0,
+            "log_call_max_ms": 1000 * max(log_waits) if log_waits else 0.0,
+        }
+
+def print_report(results: List[Dict]) -> None:
+    header = (
+        f"{'mix':<9} {'wrk':>3} {'dep':>4} {'done':>4} {'wall s':>7} {'jobs/s':>7} {'media x':>8} "
+        f"{'wait avg':>8} {'wait p95':>8} {'sched ms/job':>12} {'log calls':>9} {'log avg us':>10} {'log max ms':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['mix']:<9} {r['workers']:>3} {r['depth']:>4} {r['done']:>4} {r['wall_s']:>7.2f} {r['jobs_per_s']:>7.2f} "
+            f"{r['media_x']:>8.0f} {r['wait_avg_s']:>8.2f} {r['wait_p95_s']:>8.2f} {r['sched_ms_per_job']:>12.3f} "
+            f"{r['log_calls']:>9} {r['log_call_avg_us']:>10.1f} {r['log_call_max_ms']:>10.2f}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Auto_MKBrake pipeline with stub binaries.")
+    parser.add_argument("--workers", default="1,2,4,8", help="Comma-separated encoder_worker_threads values")
+    parser.add_argument("--depth", default="8,32", help="Comma-separated queue depths (titles per run)")
+    parser.add_argument("--mix", default="episodes,features,mixed", help=f"Title mixes: {', '.join(MIXES)}")
+    parser.add_argument("--speedup", type=float, default=2000, help="Stub encode speed (media s per wall s)")
+    parser.add_argument("--rip-speedup", type=float, default=20000, help="Stub rip speed (media s per wall s)")
+    parser.add_argument("--scan-seconds", type=float, default=0.5, help="Stub disc scan time")
+    parser.add_argument("--no-rip", dest="rip", action="store_false", help="Queue stub MKVs directly, skip the rip stage")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's console output")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", type=Path, help="Also write the raw results to this JSON file")
+    opts = parser.parse_args()
+
+    if sys.platform == "win32":
+        sys.exit("The benchmark stubs need a POSIX shell; run it on Linux or macOS.")
+
+    results = []
+    for mix in opts.mix.split(","):
+        for depth in (int(d) for d in opts.depth.split(",")):
+            for workers in (int(w) for w in opts.workers.split(",")):
+                # Console output still goes through the logging pipeline, it just isn't shown
+                with open(os.devnull, "w") as devnull:
+                    with contextlib.redirect_stdout(sys.stdout if opts.verbose else devnull):
+                        results.append(run_scenario(mix, workers, depth, opts))
+
+    print_report(results)
+    if opts.json:
+        opts.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
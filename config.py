@@ -1,19 +1,43 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 @dataclass
 class Configuration:
     # --- System & Hardware ---
-    drive_letter: str = "D:"
+    # One pipeline per drive; all drives share the encoder pool. e.g. ["D:", "E:", "F:"]
+    drive_letters: List[str] = field(default_factory=lambda: ["D:"])
+    drive_status_seconds: int = 300       # Per-drive status report interval (0 = off)
+    drive_backend: str = "auto"           # "auto", "windows", "linux" (/dev/sr0 style drives) or "fake"
+    drive_poll_seconds: float = 2.0       # Media check interval where there are no change events (Windows)
+    drive_idle_recheck_seconds: float = 5.0  # Linux: re-check even without a udev event, as a safety net
+    drive_label_wait_seconds: float = 10.0   # How long a disc without a volume label yet may take to report one
     # Use raw strings (r"...") for Windows paths
     raw_directory: Path = Path(r"C:\Raw")
     encoded_directory: Path = Path(r"G:\Encoded")
+    # Persistent encode queue. Keep it on a local disk, it survives crashes/restarts.
+    job_database: Path = Path(r"C:\Raw\auto_mkbrake_jobs.db")
+    # Cached disc scans (keyed by disc fingerprint) and license check results
+    scan_cache_dir: Path = Path(r"C:\Raw\.scan_cache")
+    scan_cache_max_entries: int = 200
+    license_cache_hours: float = 24.0     # 0 = check the license on every start
+    # reprocess.py manifest of raw/encoded files, so rescans only touch changed folders
+    backlog_index_path: Path = Path(r"C:\Raw\.backlog_index.json")
+    watch_poll_seconds: int = 30          # reprocess.py --watch polling interval (non-Linux)
     
     # Minimum length in seconds. 
     # 300 = 5 minutes (Recommended to filter junk)
     # 120 = 2 minutes (Use if you want special features)
     min_title_length: int = 480
+    hide_duplicate_titles: bool = True    # Drop playlists whose segment map repeats another title
+
+    # --- Title Selection ---
+    selection_mode: str = "prompt"        # "prompt" (ask the operator) or "auto" (rules only, unattended)
+    selection_timeout_seconds: int = 0    # prompt mode: fall back to the rules after this long (0 = wait forever)
+    default_title_rule: str = "auto"      # "auto", "longest", "episodes", "all" or "none"
+    episode_tolerance: float = 0.10       # "episodes": titles within +-10% of the median length
+    min_episode_titles: int = 3           # "auto": this many similar titles make a TV disc
+    title_rules_path: Optional[Path] = Path(r"C:\Raw\title_rules.json")  # Per-label overrides (JSON)
 
     # --- Binaries (None = Auto-detect) ---
     makemkv_path: Optional[str] = r"C:\Program Files (x86)\MakeMKV\makemkvcon64.exe"
@@ -24,6 +48,131 @@ class Configuration:
     eject_on_completion: bool = True  
     keep_raw_files: bool = False      
 
+    # --- Duplicate Detection (fingerprint index in job_database) ---
+    # Titles/raw files whose content was encoded before: "ask" (prompt mode; otherwise skip),
+    # "skip", "link" (hard link to the archived MP4 under the new name) or "off"
+    duplicate_action: str = "ask"
+    fingerprint_samples: int = 8          # Blocks of a raw MKV hashed for its fingerprint
+    fingerprint_block_kb: int = 256
+
+    # --- Rip Tuning & Read Monitoring ---
+    rip_cache_mb: Optional[int] = 1024    # makemkvcon --cache (MB of read cache; None = MakeMKV default)
+    rip_directio: Optional[bool] = True   # makemkvcon --directio (None = MakeMKV default)
+    # A damaged disc is given up on (makemkvcon killed) when, over the last window, it reads
+    # slower than rip_min_mbps or logs more than rip_max_errors_per_minute read errors,
+    # or once rip_max_read_errors errors were seen in total. 0 disables a check.
+    rip_monitor_window_seconds: int = 600
+    rip_min_mbps: float = 1.0
+    rip_max_errors_per_minute: float = 6.0
+    rip_max_read_errors: int = 200
+    rip_abort_action: str = "eject"       # "eject" (give up on the disc) or "skip" (try its next title)
+
+    # --- Process Placement (rip vs encode child processes) ---
+    # Linux/macOS: nice values (-20..19; lowering below the current value needs CAP_SYS_NICE or
+    # RLIMIT_NICE) and ionice classes ("best-effort", "idle", "realtime" or "" = unchanged).
+    # Windows: encodes start Below Normal; the boost needs psutil.
+    rip_nice: Optional[int] = None        # None = unchanged
+    rip_ionice_class: str = "best-effort"
+    rip_ionice_level: int = 0             # 0 (highest) .. 7
+    encode_nice: Optional[int] = 10
+    encode_ionice_class: str = "best-effort"
+    encode_ionice_level: int = 7
+    boost_idle_encoders: bool = True      # Encodes run at normal priority while no rip is active
+    lane_cpu_affinity: Dict[str, List[int]] = field(default_factory=dict)  # e.g. {"x265": [4, 5, 6, 7]}
+
+    # --- Encode Scheduler ---
+    # Concurrent encodes per encoder, tried in order. Empty = {video_codec: encoder_worker_threads}.
+    # GPU lanes are hard limits (consumer NVENC cards cap sessions), e.g. {"nvenc_h265": 3, "x265": 2}
+    encoder_lanes: Dict[str, int] = field(default_factory=dict)
+    # Per-encoder overrides of video_codec_preset / video_quality for extra lanes
+    encoder_settings: Dict[str, Dict[str, str]] = field(default_factory=lambda: {
+        "x265": {"preset": "medium", "quality": "24"},
+        "x264": {"preset": "medium", "quality": "21"},
+    })
+    job_order: str = "shortest"           # "shortest", "longest" or "fifo"
+    adaptive_concurrency: bool = True     # Shrink/grow CPU lanes with the CPU use of other programs
+    foreign_cpu_load: float = 0.25        # CPU use not caused by our encodes (fraction of all cores) that shrinks lanes
+    load_high_samples: int = 3            # Consecutive samples above foreign_cpu_load before a lane shrinks
+    load_sample_seconds: int = 30
+
+    # --- Encode Verification (before a raw file is deleted) ---
+    verify_require_audio: bool = True
+    verify_tolerance_ratio: float = 0.01      # Allowed duration difference vs the disc scan...
+    verify_min_tolerance_seconds: float = 2.0 # ...but never less than this
+
+    # --- Logging ---
+    log_flush_seconds: float = 0.5        # Log files are written in batches and flushed this often
+    log_max_open_files: int = 32          # Cached log file handles (least recently used are closed)
+
+    # --- Metrics ---
+    # Per-stage timings (scan, select, rip, queue wait, encode, verify, delete) and live gauges
+    metrics_port: int = 0                 # Prometheus endpoint on metrics_bind:metrics_port (0 = off)
+    metrics_bind: str = "127.0.0.1"
+    metrics_path: Optional[Path] = Path(r"C:\Raw\metrics.jsonl")  # Rolling JSONL file (None = off)
+    metrics_interval_seconds: int = 60    # Gauge snapshot + file write interval
+    metrics_max_bytes: int = 10 * 1024**2 # Rotate the file at this size...
+    metrics_backups: int = 3              # ...keeping this many old files (metrics.jsonl.1, .2, ...)
+
+    # --- Encode Monitoring ---
+    encode_stall_seconds: int = 300       # Kill an encode after this long with 0 fps / no progress (0 = off)
+    encode_max_attempts: int = 3          # Stalled jobs are requeued until they used this many attempts
+    progress_report_seconds: int = 60     # Console progress summary interval (0 = off)
+
+    # --- Raw Disk Admission Control ---
+    raw_min_free_gb: float = 20.0         # Free space to keep on raw_directory after each rip
+    rip_size_margin: float = 0.05         # Rip size estimate = scanned title size * (1 + margin)
+    admission_policy: str = "pause"       # "pause" (wait for encodes to free space) or "warn"
+
+    # --- Scratch Encode & Transfer ---
+    # Encode to a fast local disk, then copy finished files to encoded_directory (often a NAS)
+    # with large sequential writes. The raw file is only deleted once the copy is verified.
+    scratch_directory: Optional[Path] = None   # e.g. Path(r"D:\Scratch") (None = encode straight to encoded_directory)
+    transfer_workers: int = 2             # Parallel copies to encoded_directory
+    transfer_buffer_mb: int = 16          # Copy block size
+    transfer_verify: str = "size"         # "size" or "sha256" (reads the copy back)
+    transfer_max_attempts: int = 3
+    transfer_retry_seconds: int = 30
+
+    # --- Chunked Encoding (long titles) ---
+    # Splits long titles into time ranges, encodes them in parallel and
+    # stitches the parts losslessly with ffmpeg. Best for CPU encoders (x265).
+    chunked_encoding: bool = False
+    chunk_min_title_seconds: int = 3600   # Only titles at least this long are split
+    chunk_count: int = 4                  # Parallel parts per title
+    ffmpeg_path: Optional[str] = None     # None = Auto-detect
+
+    # --- Encode Farm ---
+    # Coordinator: main.py / reprocess.py also hand queued jobs to remote farm_agent.py processes.
+    farm_coordinator: bool = False
+    farm_bind: str = "127.0.0.1"          # e.g. "0.0.0.0" for agents on other machines (needs farm_token)
+    farm_port: int = 8765
+    farm_token: str = ""                  # Shared secret, must match on every agent
+    farm_lease_seconds: int = 60          # A lease without a heartbeat for this long is requeued
+    farm_heartbeat_seconds: int = 10
+    # Agent (farm_agent.py): where to lease from, and coordinator path prefixes mapped to paths
+    # the agent can reach, e.g. {r"C:\Raw": r"\\ripper\Raw"}. Point encoded_directory at the shared folder.
+    farm_coordinator_url: str = "http://localhost:8765"
+    farm_path_map: Dict[str, str] = field(default_factory=dict)
+    farm_poll_seconds: int = 15           # Idle agents ask for work this often
+
+    # --- Preset Auto-Tuning ---
+    # Trial-encodes short samples with each candidate and keeps the fastest one whose
+    # output bitrate fits the budget. Results are cached per source class
+    # (resolution, source codec, disc label pattern), so only the first disc pays for it.
+    auto_tune: bool = False
+    tune_candidates: Dict[str, List[Dict[str, str]]] = field(default_factory=lambda: {
+        "nvenc_h265": [{"preset": "p4", "quality": "24"}, {"preset": "p5", "quality": "23"},
+                       {"preset": "p6", "quality": "23"}, {"preset": "p7", "quality": "22"}],
+        "x265": [{"preset": "fast", "quality": "24"}, {"preset": "medium", "quality": "24"},
+                 {"preset": "slow", "quality": "23"}],
+    })
+    # Max total output bitrate (video + audio) per source resolution, in Mbit/s (0 = no limit)
+    tune_max_mbps: Dict[str, float] = field(default_factory=lambda: {"sd": 2.5, "hd": 8.0, "uhd": 20.0})
+    tune_sample_seconds: int = 45         # Length of each sample window
+    tune_sample_windows: int = 3          # Samples spread across the title
+    tune_cache_dir: Path = Path(r"C:\Raw\.tune_cache")
+    tune_cache_max_entries: int = 100
+
     # --- Video Settings ---
     video_codec: str = "nvenc_h265"   # Nvidia GPU. Use "x265" for CPU.
     video_quality: str = "23"         # RF Value
@@ -32,7 +181,20 @@ class Configuration:
     # --- Audio Settings ---
     audio_codec: str = "av_aac"
     audio_quality: str = "0.6"        
-    audio_mixdown: str = "7point1"
+    audio_mixdown: str = "7point1"    # Largest mixdown; with stream selection tracks are never upmixed
+
+    # --- Stream Selection (from the disc scan's SINFO stream table) ---
+    # Opt-in: streams left out of the rip can't be recovered once the disc is ejected
+    select_streams: bool = False          # False = rip every stream and encode with --all-audio
+    audio_languages: List[str] = field(default_factory=list)  # ISO 639-2, output order ([] = all), e.g. ["eng"]
+    audio_tracks_per_language: int = 1    # Best tracks encoded per language (most channels, then codec preference)
+    audio_codec_preference: List[str] = field(default_factory=lambda: [
+        "TrueHD", "DTS-HD MA", "LPCM", "FLAC", "DTS-HD HR", "E-AC3", "DTS", "AC3", "AAC",
+    ])
+    audio_passthrough: List[str] = field(default_factory=list)  # Copied, not re-encoded, e.g. ["copy:ac3", "copy:eac3"]
+    keep_commentary: bool = False         # Rip commentary tracks too
+    rip_core_audio: bool = False          # Rip the AC3/DTS core MakeMKV splits out of TrueHD/DTS-HD tracks
+    subtitle_languages: Optional[List[str]] = None  # Subtitles kept in the raw MKV (None = all; encodes have none)
 
 # Create a singleton instance to be imported by other modules
 cfg = Configuration()
\ No newline at end of file
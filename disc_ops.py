@@ -1,22 +1,45 @@
 import re
-import ctypes
+import hashlib
 import subprocess
 import time
-from typing import List, Dict
+from typing import List, Dict, Optional
 from pathlib import Path
 
 from config import cfg
 import utils
+import drives
+import placement
+import progress
+import metrics
+import streams
+from disk_cache import DiskCache
 
 # Compiled regex for parsing MakeMKV output
 _DURATION_RE = re.compile(r"^\s*(\d{1,2}):(\d{2})(?::(\d{2}))?\s*$")
 _SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([GMK]i?B)\s*$", re.IGNORECASE)
 
+# Disc structure folders whose file tables identify a disc without reading it
+_FINGERPRINT_DIRS = ("BDMV/PLAYLIST", "BDMV/CLIPINF", "BDMV/STREAM", "VIDEO_TS")
+_LICENSE_CACHE_KEY = "makemkv-license"
+
+# TINFO attribute codes (MakeMKV apdefs.h)
+_TINFO_FIELDS = {
+    8: "chapters", 9: "duration", 10: "size", 11: "bytes", 15: "angle",
+    16: "source", 25: "segment_count", 26: "segment_map", 27: "filename",
+}
+
+_scan_cache = DiskCache(cfg.scan_cache_dir, cfg.scan_cache_max_entries)
+
 def verify_license(makemkv_bin: str) -> None:
     """
     Runs a quick drive scan to trigger MakeMKV's license validation.
     Raises RuntimeError if the license is expired or invalid.
+    A passing result is cached for cfg.license_cache_hours.
     """
+    ttl = cfg.license_cache_hours * 3600
+    if ttl > 0 and _scan_cache.get(_LICENSE_CACHE_KEY, max_age_seconds=ttl) == makemkv_bin:
+        return
+
     # 'info' with '-r' scans for drives. This is enough to trigger the license check
     # without needing a disc in the tray.
     cmd = [makemkv_bin, "-r", "info"]
@@ -35,34 +58,34 @@ def verify_license(makemkv_bin: str) -> None:
     if "version is too old" in output_combined.lower():
         raise RuntimeError("MakeMKV version is too old. Please update the application.")
 
+    if ttl > 0:
+        _scan_cache.put(_LICENSE_CACHE_KEY, makemkv_bin)
+
+# --- Drive access (delegates to the platform backend in drives.py) ---
 def get_disc_volume_label(drive_letter: str) -> str:
-    """Gets the volume label (e.g., 'WESTWORLD_S1_D1') using Windows API."""
-    root = f"{drive_letter}\\"
-    volume_name = ctypes.create_unicode_buffer(261)
-    try:
-        ctypes.windll.kernel32.GetVolumeInformationW( # type: ignore
-            ctypes.c_wchar_p(root), volume_name, ctypes.sizeof(volume_name),
-            None, None, None, None, 0
-        )
-        return volume_name.value
-    except Exception:
-        return ""
+    """Gets the volume label (e.g., 'WESTWORLD_S1_D1')."""
+    return drives.backend().volume_label(drive_letter)
+
+def read_disc_label(drive_letter: str, timeout: float) -> str:
+    """
+    The volume label of an inserted disc, polling up to timeout seconds while the
+    drive reports media but no label yet (it is still being read). '' if none came.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        label = get_disc_volume_label(drive_letter)
+        if label or time.monotonic() >= deadline or not is_disc_present(drive_letter): return label
+        time.sleep(min(0.5, max(0.0, deadline - time.monotonic())))
 
 def is_disc_present(drive_letter: str) -> bool:
-    return bool(get_disc_volume_label(drive_letter))
+    return drives.backend().is_disc_present(drive_letter)
+
+def wait_for_disc(drive_letter: str, present: bool = True, timeout: Optional[float] = None) -> bool:
+    """Blocks until a disc is inserted (present=True) or removed (present=False)."""
+    return drives.backend().wait_for_disc(drive_letter, present, timeout)
 
 def eject_disc(drive_letter: str) -> None:
-    """Ejects the tray using PowerShell."""
-    try:
-        subprocess.run(
-            [
-                "powershell", "-NoProfile", "-Command",
-                r"(New-Object -ComObject Shell.Application).NameSpace(17).ParseName('{}').InvokeVerb('Eject')".format(drive_letter)
-            ],
-            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10
-        )
-    except Exception:
-        pass
+    drives.backend().eject(drive_letter)
 
 def parse_duration(value: str) -> int:
     """Converts HH:MM:SS string to total seconds."""
@@ -70,26 +93,79 @@ def parse_duration(value: str) -> int:
     if not match: return 0
     return int(match.group(1))*3600 + int(match.group(2))*60 + int(match.group(3) or 0)
 
-def list_disc_titles(makemkv_bin: str, drive_letter: str) -> List[Dict]:
+def parse_size(value: str) -> int:
+    """Converts MakeMKV size strings (e.g. '31.5 GB') to bytes."""
+    match = _SIZE_RE.fullmatch((value or "").strip())
+    if not match: return 0
+    unit = match.group(2).upper().replace("I", "")
+    return int(float(match.group(1)) * {"KB": 1024, "MB": 1024**2, "GB": 1024**3}[unit])
+
+def disc_fingerprint(drive_letter: str, disc_label: str) -> Optional[str]:
     """
-    Scans the disc, filters internally, and returns a CLEAN, SEQUENTIAL list.
-    The ID returned here (0, 1, 2...) matches exactly what MakeMKV expects
-    when the --minlength flag is used.
+    Identifies a disc from its volume label and the names/sizes of its structure
+    files (playlists, clip info, streams). Only directory metadata is read, so
+    this takes milliseconds. Returns None if the disc structure can't be listed.
     """
-    # 1. Scan EVERYTHING (no filter yet) to get raw data
+    root = drives.backend().mount_root(drive_letter)
+    if root is None: return None
+    digest = hashlib.sha1(disc_label.encode("utf-8"))
+    found = False
+    for folder in _FINGERPRINT_DIRS:
+        try:
+            entries = sorted((p.name, p.stat().st_size) for p in (root / folder).iterdir())
+        except OSError:
+            continue
+        found = True
+        digest.update(folder.encode())
+        for name, size in entries:
+            digest.update(f"{name}:{size};".encode("utf-8"))
+    return f"{disc_label}:{digest.hexdigest()}" if found else None
+
+def scan_disc(makemkv_bin: str, drive_letter: str, disc_label: str) -> Optional[str]:
+    """
+    Returns MakeMKV's raw robot-mode 'info' output for the disc.
+    Results are cached by disc fingerprint, so re-inserting a disc skips the scan.
+    """
+    fingerprint = disc_fingerprint(drive_letter, disc_label)
+    if fingerprint:
+        cached = _scan_cache.get(fingerprint)
+        if cached is not None:
+            utils.console(f"Using cached scan for {disc_label}")
+            return cached
+
     cmd = [makemkv_bin, "-r", "--cache=1", "info", f"dev:{drive_letter}"]
     try:
         result = subprocess.run(cmd, text=True, capture_output=True, check=False)
     except Exception:
-        return []
+        return None
+
+    if result.returncode != 0: return None
 
-    if result.returncode != 0: return []
+    if fingerprint:
+        _scan_cache.put(fingerprint, result.stdout)
+    return result.stdout
 
-    disc_label = get_disc_volume_label(drive_letter)
+def list_disc_titles(makemkv_bin: str, drive_letter: str, disc_label: Optional[str] = None) -> List[Dict]:
+    """
+    Scans the disc, filters internally, and returns a CLEAN, SEQUENTIAL list.
+    The ID returned here (0, 1, 2...) matches exactly what MakeMKV expects
+    when the --minlength flag is used. disc_label overrides the drive's volume label.
+    """
+    # 1. Scan EVERYTHING (no filter yet) to get raw data
+    if disc_label is None: disc_label = get_disc_volume_label(drive_letter)
+    with metrics.registry.span("scan", disc_label, drive=drive_letter) as span:
+        output = scan_disc(makemkv_bin, drive_letter, disc_label)
+        span["ok"] = output is not None
+    if output is None: return []
+    return parse_disc_titles(output, disc_label)
+
+def parse_disc_titles(scan_output: str, disc_label: str) -> List[Dict]:
+    """Builds the filtered title list from MakeMKV robot-mode 'info' output."""
     per_title: Dict[int, Dict] = {}
+    title_streams = streams.parse_sinfo(scan_output)
 
     # 2. Parse raw output
-    for line in result.stdout.splitlines():
+    for line in scan_output.splitlines():
         if line.startswith("TINFO:"):
             parts = line.split(',', 3)
             if len(parts) < 4: continue
@@ -99,9 +175,8 @@ def list_disc_titles(makemkv_bin: str, drive_letter: str) -> List[Dict]:
                 code = int(parts[1])
                 val = parts[3].strip('"')
                 
-                if code == 9: per_title.setdefault(t_source_id, {})["duration"] = val
-                elif code == 10: per_title.setdefault(t_source_id, {})["size"] = val
-                elif code == 27: per_title.setdefault(t_source_id, {})["filename"] = val
+                if code in _TINFO_FIELDS:
+                    per_title.setdefault(t_source_id, {})[_TINFO_FIELDS[code]] = val
             except ValueError: continue
 
     # 3. Build the preliminary list
@@ -110,18 +185,30 @@ def list_disc_titles(makemkv_bin: str, drive_letter: str) -> List[Dict]:
         d = per_title[t_source_id]
         dur = d.get("duration", "")
         size = d.get("size", "")
-        filename = d.get("filename", f"t{t_source_id:02d}.mkv") # Use source ID for filename hint
+        filename = d.get("filename", f"title_t{t_source_id:02d}.mkv") # MakeMKV's default name for the source ID
         
         if _SIZE_RE.match(dur) and _DURATION_RE.match(size): dur, size = size, dur
         
         raw_titles.append({
             "RawID": t_source_id,
             "TitleNameHint": f"{utils.sanitize_filename(disc_label)}_{filename}",
+            "FileName": filename,
             "Length": dur,
             "Size": size,
-            "Seconds": parse_duration(dur)
+            "Bytes": int(d["bytes"]) if d.get("bytes", "").isdigit() else 0,
+            "Seconds": parse_duration(dur),
+            "Chapters": int(d["chapters"]) if d.get("chapters", "").isdigit() else 0,
+            "Angle": d.get("angle", ""),
+            "Source": d.get("source", ""),
+            "Segments": parse_segment_map(d.get("segment_map", "")),
+            "Streams": title_streams.get(t_source_id, []),
         })
 
+    # Flag duplicates/aggregates across ALL titles, so short episodes still explain a long aggregate
+    mark_overlapping_titles(raw_titles)
+    if cfg.hide_duplicate_titles:
+        raw_titles = [t for t in raw_titles if t["DuplicateOf"] is None]
+
     # 4. FILTER and RE-INDEX
     # This simulates exactly what MakeMKV does when --minlength is passed.
     valid_titles = []
@@ -134,12 +221,126 @@ def list_disc_titles(makemkv_bin: str, drive_letter: str) -> List[Dict]:
             t["TitleName"] = t["TitleNameHint"] # Keep the name derived from original ID
             valid_titles.append(t)
             filtered_index += 1
+
+    # The selection table shows the new IDs, so duplicates point at those
+    shown = {t["RawID"]: t["ID"] for t in valid_titles}
+    for t in valid_titles:
+        t["DuplicateOfID"] = shown.get(t["DuplicateOf"])
             
     return valid_titles
 
-def rip_title(mkv_bin: str, drive: str, dest: Path, title_info: Dict, disc_label: str, log: Path) -> Path:
+# --- Playlist Overlap Index ---
+def parse_segment_map(value: str) -> List[int]:
+    """Converts a MakeMKV segment map ('1-3,5') to its ordered list of segment (clip) numbers."""
+    segments = []
+    for part in (value or "").replace(" ", "").split(","):
+        if "-" in part:
+            start, _, end = part.partition("-")
+            if start.isdigit() and end.isdigit():
+                segments.extend(range(int(start), int(end) + 1))
+        elif part.isdigit():
+            segments.append(int(part))
+    return segments
+
+def mark_overlapping_titles(titles: List[Dict]) -> None:
+    """
+    Adds 'DuplicateOf' and 'AggregateOf' to every title, using the segment maps.
+    A duplicate plays the same segments, in the same order and angle, as a lower-numbered
+    title. An aggregate plays two or more other titles back to back (the "play all" /
+    obfuscation playlist) and would read the same sectors again: the parts must not share
+    segments and, joined in order, give exactly its segment sequence. A seamless-branching
+    cut (extended 1-5 vs theatrical 1,2,3,5 plus a bonus 4) is therefore no aggregate.
+    """
+    index: Dict[tuple, int] = {}
+    for t in titles:
+        t["DuplicateOf"], t["AggregateOf"] = None, []
+        if not t["Segments"]: continue
+        key = (tuple(t["Segments"]), t["Angle"])
+        if key in index:
+            t["DuplicateOf"] = index[key]
+        else:
+            index[key] = t["RawID"]
+
+    unique = [t for t in titles if t["Segments"] and t["DuplicateOf"] is None]
+    for t in unique:
+        own = set(t["Segments"])
+        parts = [o for o in unique if o is not t and len(o["Segments"]) < len(t["Segments"])
+                 and set(o["Segments"]) <= own]
+        tiling = _tile_segments(t["Segments"], parts)
+        if tiling is not None and len(tiling) >= 2:
+            t["AggregateOf"] = [o["RawID"] for o in tiling]
+
+def _tile_segments(sequence: List[int], parts: List[Dict]) -> Optional[List[Dict]]:
+    """
+    Titles that, joined in order and without sharing a segment, play exactly sequence.
+    None if there are none. The parts before a position always play sequence[:position],
+    so whether the rest can be tiled depends on the position alone: one pass from the
+    end over the positions, O(len(sequence) * parts), however many playlists overlap.
+    """
+    by_first: Dict[int, List[Dict]] = {}
+    for o in parts:
+        by_first.setdefault(o["Segments"][0], []).append(o)
+
+    n = len(sequence)
+    # rest[i]: (part, next position) of a tiling of sequence[i:], None = none; rest[n] = done
+    rest: List[Optional[tuple]] = [None] * n + [()]
+    for start in range(n - 1, -1, -1):
+        played = None
+        for o in by_first.get(sequence[start], ()):
+            segments = o["Segments"]
+            end = start + len(segments)
+            if end > n or rest[end] is None or sequence[start:end] != segments: continue
+            if played is None: played = set(sequence[:start])
+            if played.isdisjoint(segments):
+                rest[start] = (o, end)
+                break
+
+    tiling, position = [], 0
+    while position < n:
+        if rest[position] is None: return None
+        o, position = rest[position]
+        tiling.append(o)
+    return tiling
+
+def title_note(title: Dict) -> str:
+    """Short marker for the selection table (overlap, then the audio languages)."""
+    notes = []
+    if title.get("DuplicateOf") is not None:
+        if title.get("DuplicateOfID") is not None:
+            notes.append(f"duplicate of track {title['DuplicateOfID']}")
+        else:
+            notes.append(f"duplicate of an unlisted title (source {title['DuplicateOf']})")
+    elif title.get("AggregateOf"):
+        notes.append(f"aggregate of {len(title['AggregateOf'])} tracks")
+    audio = streams.audio_summary(title)
+    if audio: notes.append(f"audio: {audio}")
+    return "; ".join(notes)
+
+# --- Ripping ---
+class RipAborted(RuntimeError):
+    """A rip was stopped by the read monitor (damaged disc); the reason is the message."""
+
+def rip_options() -> List[str]:
+    """makemkvcon read tuning flags from cfg. Raises ValueError for invalid settings."""
+    options = []
+    if cfg.rip_cache_mb is not None:
+        if isinstance(cfg.rip_cache_mb, bool) or not isinstance(cfg.rip_cache_mb, int) or cfg.rip_cache_mb < 1:
+            raise ValueError(f"rip_cache_mb must be a whole number of MB (>= 1) or None, not {cfg.rip_cache_mb!r}")
+        options.append(f"--cache={cfg.rip_cache_mb}")
+    if cfg.rip_directio is not None:
+        if not isinstance(cfg.rip_directio, bool):
+            raise ValueError(f"rip_directio must be True, False or None, not {cfg.rip_directio!r}")
+        options.append(f"--directio={'true' if cfg.rip_directio else 'false'}")
+    if cfg.rip_abort_action not in ("eject", "skip"):
+        raise ValueError(f"rip_abort_action must be 'eject' or 'skip', not {cfg.rip_abort_action!r}")
+    return options
+
+def rip_title(mkv_bin: str, drive: str, dest: Path, title_info: Dict, disc_label: str, log: Path,
+              monitor: Optional[progress.RipProgress] = None) -> Path:
     """
     Rips the specific title using the Raw Source ID to ensure accuracy.
+    Robot-mode output feeds monitor (a RipProgress), which can abort a damaged
+    disc: RipAborted is raised and the partial file removed.
     """
     utils.ensure_directory(dest)
     
@@ -147,26 +348,59 @@ def rip_title(mkv_bin: str, drive: str, dest: Path, title_info: Dict, disc_label
     t_index = title_info['RawID'] 
     
     # CHANGE 2: Remove "--minlength" so MakeMKV uses the absolute index
+    # -r --progress=-same: PRGV progress and MSG lines on stdout, for the read monitor
     args = [
+        "-r", "--progress=-same",
         "mkv", f"dev:{drive}", str(t_index), str(dest), 
         "--decrypt", 
-        "--cache=1024"
-        "--directio=true"
+        *rip_options(),
         # "--minlength" REMOVED to prevent indexing misalignment
     ]
+    if cfg.select_streams and title_info.get('Streams'):
+        # Only the wanted audio/subtitle streams; the plan is kept so the encoder knows the ripped track order
+        plan = streams.rip_plan(title_info)
+        args.insert(2, f"--profile={streams.profile_path(plan['selection'])}")
+        title_info['RippedStreams'] = plan['streams']
+        kept = set(plan['streams'])
+        utils.log_event(log, "RIP STREAMS", plan['selection'], label=disc_label, track=t_index,
+                        kept=[streams.describe(s) for s in title_info['Streams'] if s['Index'] in kept],
+                        dropped=[streams.describe(s) for s in title_info['Streams'] if s['Index'] not in kept])
+    if monitor is None:
+        monitor = progress.RipProgress(f"{disc_label} track {t_index}", parse_size(title_info.get('Size', '')))
     
     # Detailed Console Output
     msg = f"Ripping: {disc_label} Track {t_index} ({title_info['Length']} / {title_info['Size']})"
     utils.console(msg)
-    utils.append_log_line(log, f"RIP START {msg}")
-    
-    rc = utils.run_stream_log(mkv_bin, args, log, low_priority=False)
+    utils.log_event(log, "RIP START", msg, label=disc_label, track=t_index, size=title_info['Size'])
+    started = time.monotonic()
     
-    if rc != 0:
-        raise RuntimeError(f"MakeMKV exited with code {rc}")
-        
-    # Scan for the newest file
-    mkvs = sorted(dest.glob("*.mkv"), key=lambda p: p.stat().st_mtime, reverse=True)
-    
-    if not mkvs: raise FileNotFoundError("Rip finished but file not found")
-    return mkvs[0]
\ No newline at end of file
+    # MakeMKV writes the title under the file name the scan reported
+    mkv = dest / title_info['FileName']
+    try: before = mkv.stat().st_mtime
+    except OSError: before = None
+
+    with metrics.registry.span("rip", disc_label, t_index, drive=drive) as span:
+        rc = utils.run_stream_log(mkv_bin, args, log, role=placement.RIP,
+                                  on_line=monitor.feed, watchdog=monitor.should_abort)
+        stats = dict(label=disc_label, track=t_index, bytes_read=monitor.bytes_read, read_errors=monitor.read_errors,
+                     avg_mbps=round(monitor.average_rate / 1024**2, 2), seconds=round(time.monotonic() - started, 1))
+        span.update(bytes_read=monitor.bytes_read, read_errors=monitor.read_errors)
+
+        if rc != 0 or monitor.abort_reason:
+            # A killed or failed rip leaves a truncated MKV that must never be queued for encoding
+            try:
+                if mkv.stat().st_mtime != before: mkv.unlink()
+            except OSError: pass
+            if monitor.abort_reason:
+                utils.log_event(log, "RIP ABORT", monitor.abort_reason, reason=monitor.abort_reason, **stats)
+                raise RipAborted(monitor.abort_reason)
+            raise RuntimeError(f"MakeMKV exited with code {rc}")
+
+        try: st = mkv.stat()
+        except OSError: st = None
+        if st is None or st.st_mtime == before:
+            raise FileNotFoundError(f"Rip finished but {mkv.name} was not written")
+        stats.update(bytes=st.st_size)
+        span["bytes"] = stats["bytes"]
+    utils.log_event(log, "RIP SUCCESS", mkv.name, **stats)
+    return mkv
\ No newline at end of file
@@ -0,0 +1,63 @@
+# disk_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+class DiskCache:
+    """
+    Small persistent key/value cache: one JSON file per key in a directory.
+    Reads refresh a file's mtime, so eviction (once max_entries is exceeded)
+    drops the least recently used entries first.
+    """
+
+    def __init__(self, directory: Path, max_entries: int = 100):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key: str, max_age_seconds: Optional[float] = None) -> Optional[Any]:
+        path = self._path(key)
+        with self._lock:
+            try:
+                entry = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                return None
+            if entry.get("key") != key:
+                return None
+            if max_age_seconds is not None and time.time() - entry.get("stored", 0) > max_age_seconds:
+                return None
+            try: os.utime(path)
+            except OSError: pass
+            return entry.get("value")
+
+    def put(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        with self._lock:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_suffix(".tmp")
+                tmp.write_text(json.dumps({"key": key, "stored": time.time(), "value": value}), encoding="utf-8")
+                os.replace(tmp, path)
+                self._evict()
+            except OSError:
+                pass
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            try: self._path(key).unlink()
+            except OSError: pass
+
+    def _evict(self) -> None:
+        entries = list(self.directory.glob("*.json"))
+        if len(entries) <= self.max_entries: return
+        entries.sort(key=lambda p: p.stat().st_mtime)
+        for old in entries[:len(entries) - self.max_entries]:
+            try: old.unlink()
+            except OSError: pass
@@ -0,0 +1,329 @@
+# drive_pipeline.py
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import cfg
+import utils
+import disc_ops
+import encoding
+import fingerprint
+import job_store
+import placement
+import progress
+import metrics
+import title_rules
+from title_rules import parse_selection
+
+# One operator, many drives: only one selection prompt may own the console at a time
+_PROMPT_LOCK = threading.Lock()
+
+# Labels the discs in the drives are filed under right now (drive -> label)
+_LABELS_IN_USE: Dict[str, str] = {}
+_LABELS_LOCK = threading.Lock()
+
+def claim_label(drive: str, disc_label: str) -> str:
+    """
+    The label (raw folder, job label) a drive's disc is filed under: disc_label, or
+    disc_label_<drive> while another drive holds a disc with the same (often generic,
+    e.g. DVD_VIDEO) label, so two rips never write the same files.
+    """
+    with _LABELS_LOCK:
+        others = {label for d, label in _LABELS_IN_USE.items() if d != drive}
+        label = disc_label if disc_label not in others else f"{disc_label}_{utils.sanitize_filename(drive)}"
+        _LABELS_IN_USE[drive] = label
+        return label
+
+def release_label(drive: str) -> None:
+    with _LABELS_LOCK:
+        _LABELS_IN_USE.pop(drive, None)
+
+# --- Console answers (a reader thread, so a prompt can time out) ---
+_ANSWERS: "queue.Queue[Optional[str]]" = queue.Queue()
+_READER_STARTED = threading.Event()
+
+def _read_stdin() -> None:
+    for line in sys.stdin:
+        _ANSWERS.put(line.rstrip("\r\n"))
+    _ANSWERS.put(None)  # stdin closed (e.g. running as a service)
+
+def ask(prompt: str, timeout: Optional[float]) -> Optional[str]:
+    """input() with an optional timeout. None = no answer in time (or no console)."""
+    if not _READER_STARTED.is_set():
+        _READER_STARTED.set()
+        threading.Thread(target=_read_stdin, daemon=True, name="stdin").start()
+    # Lines typed while nobody was asking are not answers to this prompt
+    while True:
+        try:
+            if _ANSWERS.get_nowait() is None:
+                _ANSWERS.put(None); return None
+        except queue.Empty:
+            break
+    print(prompt, end="", flush=True)
+    try:
+        answer = _ANSWERS.get(timeout=timeout or None)
+    except queue.Empty:
+        print()
+        return None
+    if answer is None: _ANSWERS.put(None)
+    return answer
+
+class DrivePipeline(threading.Thread):
+    """
+    Detect -> scan -> select -> rip loop for one optical drive.
+    Every drive runs its own pipeline thread and feeds the shared encode queue,
+    so a slow or damaged disc only ever holds up its own drive.
+    """
+
+    def __init__(self, drive: str, mkv_bin: str, encode_queue, admission):
+        super().__init__(daemon=True, name=f"drive-{drive}")
+        self.drive = drive
+        self.mkv_bin = mkv_bin
+        self.queue = encode_queue
+        self.admission = admission
+
+        # --- Status (read by the main thread's status report) ---
+        self.state = "idle"
+        self.disc_label = ""
+        self.rips_pending = 0
+        self.rips_done = 0
+        self.rips_failed = 0
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+        self.last_rate = 0.0
+        self.monitor: Optional[progress.RipProgress] = None   # The rip in progress
+        self.failures: dict = {}                              # RawID -> earlier failed rip of this disc
+        self.duplicates: dict = {}                            # RawID -> archived MP4 of the same content
+
+    def run(self):
+        utils.console(f"[{self.drive}] Waiting for discs...")
+        while True:
+            # --- Wait for a disc (event-driven where the backend supports it) ---
+            try:
+                disc_ops.wait_for_disc(self.drive, present=True)
+            except Exception: time.sleep(2); continue
+
+            try:
+                self.process_disc()
+            except Exception as e:
+                utils.console(f"[{self.drive}] MAIN LOOP ERROR: {e}")
+                disc_ops.eject_disc(self.drive)
+                time.sleep(5)
+            finally:
+                release_label(self.drive)
+
+            self.state = "idle"
+            self.rips_pending = 0
+            disc_ops.wait_for_disc(self.drive, present=False)
+
+    def process_disc(self):
+        # --- Disc Detection ---
+        disc_lbl = disc_ops.read_disc_label(self.drive, cfg.drive_label_wait_seconds)
+        if not disc_lbl:
+            # Never rip into the raw directory root: give the disc a name of its own
+            disc_lbl = f"DISC_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{utils.sanitize_filename(self.drive)}"
+            utils.console(f"[{self.drive}] Disc has no volume label, using {disc_lbl}")
+        filed_as = claim_label(self.drive, disc_lbl)
+        if filed_as != disc_lbl:
+            utils.console(f"[{self.drive}] Another drive holds a {disc_lbl} disc, filing this one as {filed_as}")
+            disc_lbl = filed_as
+        self.disc_label = disc_lbl
+        safe_lbl = utils.sanitize_filename(disc_lbl)
+        raw_dir = cfg.raw_directory / safe_lbl
+        utils.ensure_directory(raw_dir)
+
+        log_path = raw_dir / f"log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+
+        utils.console(f"[{self.drive}] Disc Found: {disc_lbl}")
+        self.state = "scanning"
+        titles = disc_ops.list_disc_titles(self.mkv_bin, self.drive, disc_lbl)
+        valid_ids = [t["ID"] for t in titles]
+
+        if not valid_ids:
+            utils.console(f"[{self.drive}] No valid titles found.")
+            disc_ops.eject_disc(self.drive)
+            time.sleep(5); return
+
+        # Titles that failed on an earlier attempt (e.g. before the disc was cleaned)
+        self.failures = {f["raw_id"]: f for f in self.queue.store.rip_failures(disc_lbl)}
+        if self.failures:
+            utils.console(f"[{self.drive}] {disc_lbl}: track(s) {', '.join(map(str, self.failures))} failed to rip before")
+
+        # Titles whose content was already encoded (re-inserted disc, extras shared across a set)
+        self.duplicates = {}
+        for t in titles:
+            match = fingerprint.find_title(self.queue.store, t)
+            if match is not None: self.duplicates[t["RawID"]] = match
+
+        self.state = "waiting for selection"
+        with metrics.registry.span("select", disc_lbl, drive=self.drive, mode=cfg.selection_mode) as span:
+            chosen = self.prompt_selection(disc_lbl, titles, valid_ids)
+            span["titles"] = len(chosen)
+        utils.log_event(log_path, "SELECTION", ",".join(map(str, chosen)) or "none",
+                        label=disc_lbl, titles=chosen, drive=self.drive)
+
+        # --- Ripping Loop ---
+        if not chosen:
+            utils.console(f"[{self.drive}] Selection skipped.")
+            disc_ops.eject_disc(self.drive)
+            return
+
+        self.rips_pending = len(chosen)
+        for t_index in chosen:
+            try:
+                # Retrieve full info for verbose logging
+                target_title = next(t for t in titles if t['ID'] == t_index)
+
+                if target_title['RawID'] in self.duplicates:
+                    if self.handle_duplicate(disc_lbl, raw_dir, target_title, log_path): continue
+
+                # Ripping again would overwrite a raw file an encoder may be reading
+                if self.queue.store.is_active(raw_dir / target_title['FileName']):
+                    raise RuntimeError(f"{target_title['FileName']} of {disc_lbl} is still queued or encoding")
+
+                # Reserve raw space for the rip (may pause until encodes free some)
+                reservation = f"{self.drive}:{target_title['RawID']}"
+                self.state = "waiting for raw space"
+                if not self.admission.admit(reservation, target_title, log_path):
+                    raise RuntimeError("Not enough free space in the raw directory")
+                self.state = f"ripping track {target_title['RawID']}"
+
+                try:
+                    # Pass full info to ripper
+                    started = time.monotonic()
+                    self.monitor = progress.RipProgress(f"{disc_lbl} track {target_title['RawID']}",
+                                                        disc_ops.parse_size(target_title['Size']))
+                    mkv = disc_ops.rip_title(self.mkv_bin, self.drive, raw_dir, target_title, disc_lbl, log_path,
+                                             monitor=self.monitor)
+                    self.record_read(mkv.stat().st_size, time.monotonic() - started)
+                    self.rips_done += 1
+                    if target_title['RawID'] in self.failures:
+                        self.queue.store.clear_rip_failure(disc_lbl, target_title['RawID'])
+
+                    # Pass full info to encoder
+                    if self.queue.put((mkv, disc_lbl, log_path, target_title)) is None:
+                        raise RuntimeError(f"{mkv} already has an encode job")
+                finally:
+                    self.monitor = None
+                    self.admission.release(reservation)
+            except disc_ops.RipAborted as e:
+                # Damaged disc: remember the title for a retry and, by default, give up on the disc
+                self.rips_failed += 1
+                self.queue.store.record_rip_failure(disc_lbl, target_title, str(e))
+                utils.console(f"[{self.drive}] RIP ABORTED on Track {t_index}: {e}")
+                if cfg.rip_abort_action == "eject":
+                    utils.console(f"[{self.drive}] Giving up on {disc_lbl} ({self.rips_pending - 1} track(s) not ripped). Ejecting...")
+                    self.rips_pending = 0
+                    disc_ops.eject_disc(self.drive)
+                    return
+            except Exception as e:
+                self.rips_failed += 1
+                utils.console(f"[{self.drive}] RIP ERROR on Track {t_index}: {e}")
+                utils.log_event(log_path, "RIP FAIL", f"Track {t_index}: {e}", label=disc_lbl, track=t_index, error=str(e))
+            finally:
+                self.rips_pending = max(0, self.rips_pending - 1)
+
+        if cfg.eject_on_completion:
+            utils.console(f"[{self.drive}] Ripping complete. Ejecting...")
+            self.state = "ejecting"
+            disc_ops.eject_disc(self.drive)
+
+    def handle_duplicate(self, disc_lbl: str, raw_dir: Path, title: dict, log_path: Path) -> bool:
+        """
+        Applies cfg.duplicate_action to a title the fingerprint index already has an encode of.
+        True = handled (skipped or linked), False = rip it again.
+        """
+        existing = self.duplicates[title['RawID']]
+        action = cfg.duplicate_action
+        if action == "ask":
+            action = "skip"
+            if cfg.selection_mode == "prompt":
+                with _PROMPT_LOCK:
+                    answer = ask(f"[{self.drive}] Track {title['ID']} of {disc_lbl} was encoded before as {existing}.\n"
+                                 f"[S]kip, [l]ink it under this disc or [r]ip again? ", cfg.selection_timeout_seconds)
+                action = {"l": "link", "r": "rip"}.get((answer or "").strip().lower()[:1], "skip")
+        if action == "rip": return False
+
+        # Where this title's encode would have gone, as if it had been ripped and encoded
+        job = job_store.Job(0, raw_dir / title['FileName'], disc_lbl, log_path, title, job_store.QUEUED)
+        target = encoding.output_path(job, cfg.encoded_directory)
+        if action == "link" and target != existing and fingerprint.link_output(existing, target, log_path):
+            utils.console(f"[{self.drive}] Track {title['ID']} already encoded: linked {target.name} -> {existing}")
+        else:
+            utils.console(f"[{self.drive}] Track {title['ID']} already encoded as {existing}. Skipped.")
+        utils.log_event(log_path, "RIP DUPLICATE", f"Track {title['ID']}: {existing}", label=disc_lbl,
+                        track=title['RawID'], existing=existing, action=action)
+        return True
+
+    def prompt_selection(self, disc_lbl: str, titles: List[dict], valid_ids: list) -> list:
+        if cfg.selection_mode == "auto":
+            return self.auto_selection(disc_lbl, titles)
+
+        # --- User Interaction ---
+        with _PROMPT_LOCK:
+            # Let queued console output land before drawing the prompt
+            utils.flush_logs()
+            print(f"\n{'='*40}\n DISC: {disc_lbl}  (drive {self.drive})\n{'='*40}")
+            print(f" {'Index':<5} | {'Length':<10} | {'Size':<10} | {'Ch':<3} | Note")
+            print(f" {'-'*5} + {'-'*10} + {'-'*10} + {'-'*3} + {'-'*4}")
+            for t in titles:
+                note = disc_ops.title_note(t)
+                if t["RawID"] in self.duplicates:
+                    note = f"ENCODED BEFORE: {self.duplicates[t['RawID']].name}" + (f"; {note}" if note else "")
+                if t["RawID"] in self.failures:
+                    note = f"FAILED BEFORE: {self.failures[t['RawID']]['reason']}" + (f"; {note}" if note else "")
+                print(f" {t['ID']:<5} | {t['Length']:<10} | {t['Size']:<10} | {t['Chapters'] or '-':<3} | {note}")
+            print(f"{'='*40}")
+            print(f"Tracks are filtered for your convenience. Minimum length to display {cfg.min_title_length//60} minutes.")
+
+            # Aggregates just replay other titles' segments, so 'all' leaves them out
+            all_ids = [t["ID"] for t in titles if not t["AggregateOf"]]
+            if len(all_ids) < len(valid_ids):
+                print("Aggregate tracks replay the other tracks and are left out of 'all'; select them by number if wanted.")
+
+            timeout = cfg.selection_timeout_seconds
+            hint = f", rules apply after {timeout}s" if timeout > 0 else ""
+            sel = ask(f"\n[{self.drive}] Enter selection to rip (e.g. 0,1 or 1-4 or all{hint}): ", timeout)
+
+        if sel is None:
+            utils.console(f"[{self.drive}] No answer, selecting by rules.")
+            return self.auto_selection(disc_lbl, titles)
+        return parse_selection(sel, valid_ids, all_ids)
+
+    def auto_selection(self, disc_lbl: str, titles: List[dict]) -> list:
+        chosen, reason = title_rules.select_titles(disc_lbl, titles)
+        utils.console(f"[{self.drive}] Auto-selected {', '.join(map(str, chosen)) or 'nothing'} for {disc_lbl}: {reason}")
+        return chosen
+
+    # --- Status ---
+    def record_read(self, size: int, seconds: float) -> None:
+        self.bytes_read += size
+        self.read_seconds += seconds
+        self.last_rate = size / seconds if seconds > 0 else 0.0
+        utils.console(f"[{self.drive}] Read {size / 1024**3:.1f} GB in {seconds / 60:.1f} min ({self.last_rate / 1024**2:.1f} MB/s)")
+
+    def status(self) -> str:
+        avg = self.bytes_read / self.read_seconds / 1024**2 if self.read_seconds else 0.0
+        monitor = self.monitor
+        live = f" | {monitor.summary()}" if monitor else ""
+        return (
+            f"[{self.drive}] {self.state:<22} {self.disc_label or '-':<20} "
+            f"pending {self.rips_pending}, done {self.rips_done}, failed {self.rips_failed}, "
+            f"avg read {avg:.1f} MB/s{live}"
+        )
+
+def report_status(pipelines: List[DrivePipeline], encode_queue, admission, transfers=None) -> None:
+    """Prints a per-drive status block every cfg.drive_status_seconds."""
+    while True:
+        time.sleep(cfg.drive_status_seconds)
+        for p in pipelines:
+            utils.console(p.status())
+        utils.console(f"Encoders: {encode_queue.status()}")
+        if transfers is not None and cfg.scratch_directory is not None:
+            utils.console(f"Transfers: {transfers.status()}")
+        utils.console(f"Raw space: {admission.snapshot().summary()}")
+        utils.console(f"Processes: {placement.manager.status()}")
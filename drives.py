@@ -0,0 +1,307 @@
+# drives.py
+import ctypes
+import os
+import select
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from config import cfg
+
+try:
+    import fcntl  # POSIX only: CD-ROM ioctls for the Linux backend
+except ImportError:
+    fcntl = None
+
+class DriveBackend:
+    """
+    Platform access to optical drives: presence, volume label, eject, and a
+    blocking wait for media changes so drive pipelines don't have to poll.
+    Drive names are whatever the platform uses ('D:' on Windows, '/dev/sr0' on Linux).
+    """
+
+    def volume_label(self, drive: str) -> str:
+        raise NotImplementedError
+
+    def is_disc_present(self, drive: str) -> bool:
+        return bool(self.volume_label(drive))
+
+    def eject(self, drive: str) -> None:
+        raise NotImplementedError
+
+    def mount_root(self, drive: str) -> Optional[Path]:
+        """Where the disc's file system can be read (used for fingerprinting), or None."""
+        return None
+
+    def wait_for_disc(self, drive: str, present: bool, timeout: Optional[float] = None) -> bool:
+        """Blocks until a disc is (present=True) or is no longer (present=False) in the drive."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.is_disc_present(drive) != present:
+            if deadline is not None and time.monotonic() >= deadline: return False
+            time.sleep(cfg.drive_poll_seconds)
+        return True
+
+# --- Windows ---
+class WindowsDriveBackend(DriveBackend):
+    """
+    Win32 volume APIs and a direct IOCTL_STORAGE_EJECT_MEDIA instead of a PowerShell process.
+    Media changes are still found by polling: a WM_DEVICECHANGE listener needs a window
+    message loop, and GetVolumeInformationW on an empty drive returns at once.
+    """
+    _GENERIC_READ = 0x80000000
+    _FILE_SHARE_READ_WRITE = 0x1 | 0x2
+    _OPEN_EXISTING = 3
+    _IOCTL_STORAGE_EJECT_MEDIA = 0x2D4808
+    _INVALID_HANDLE = ctypes.c_void_p(-1).value
+
+    def volume_label(self, drive: str) -> str:
+        root = f"{drive}\\"
+        volume_name = ctypes.create_unicode_buffer(261)
+        try:
+            ctypes.windll.kernel32.GetVolumeInformationW( # type: ignore
+                ctypes.c_wchar_p(root), volume_name, ctypes.sizeof(volume_name),
+                None, None, None, None, 0
+            )
+            return volume_name.value
+        except Exception:
+            return ""
+
+    def eject(self, drive: str) -> None:
+        try:
+            kernel32 = ctypes.windll.kernel32 # type: ignore
+            kernel32.CreateFileW.restype = ctypes.c_void_p
+            handle = kernel32.CreateFileW(
+                f"\\\\.\\{drive}", self._GENERIC_READ, self._FILE_SHARE_READ_WRITE,
+                None, self._OPEN_EXISTING, 0, None
+            )
+            if handle and handle != self._INVALID_HANDLE:
+                returned = ctypes.c_ulong()
+                ok = kernel32.DeviceIoControl(ctypes.c_void_p(handle), self._IOCTL_STORAGE_EJECT_MEDIA,
+                                              None, 0, None, 0, ctypes.byref(returned), None)
+                kernel32.CloseHandle(ctypes.c_void_p(handle))
+                if ok: return
+        except Exception:
+            pass
+        # Fallback: the shell verb (slow, but works without raw device access)
+        try:
+            subprocess.run(
+                [
+                    "powershell", "-NoProfile", "-Command",
+                    r"(New-Object -ComObject Shell.Application).NameSpace(17).ParseName('{}').InvokeVerb('Eject')".format(drive)
+                ],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10
+            )
+        except Exception:
+            pass
+
+    def mount_root(self, drive: str) -> Optional[Path]:
+        return Path(f"{drive}\\")
+
+# --- Linux ---
+class LinuxDriveBackend(DriveBackend):
+    """
+    CD-ROM ioctls for presence and eject, the udev database for labels, and
+    kernel/udev uevents (netlink) to wake up on media changes. While idle the
+    pipeline thread sleeps in select() and only wakes on an event or once per
+    cfg.drive_idle_recheck_seconds as a safety net.
+    """
+    _CDROMEJECT = 0x5309
+    _CDROM_DRIVE_STATUS = 0x5326
+    _CDROM_LOCKDOOR = 0x5329
+    _CDSL_CURRENT = 0x7FFFFFFF
+    _CDS_DISC_OK = 4
+    _NETLINK_KOBJECT_UEVENT = 15
+    _UEVENT_GROUPS = 0x1 | 0x2        # kernel events | udev (post-rules) events
+
+    def _status(self, drive: str) -> int:
+        fd = os.open(drive, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            return fcntl.ioctl(fd, self._CDROM_DRIVE_STATUS, self._CDSL_CURRENT)
+        finally:
+            os.close(fd)
+
+    def is_disc_present(self, drive: str) -> bool:
+        try:
+            return self._status(drive) == self._CDS_DISC_OK
+        except OSError:
+            return False
+
+    def volume_label(self, drive: str) -> str:
+        if not self.is_disc_present(drive): return ""
+        # udev may still be probing a disc that was just inserted
+        for _ in range(10):
+            label = self._udev_label(drive) or self._iso9660_label(drive)
+            if label: return label
+            time.sleep(0.5)
+        return ""
+
+    def _udev_label(self, drive: str) -> str:
+        try:
+            rdev = os.stat(drive).st_rdev
+            data = Path(f"/run/udev/data/b{os.major(rdev)}:{os.minor(rdev)}").read_text(encoding="utf-8", errors="replace")
+        except OSError:
+            return ""
+        for line in data.splitlines():
+            if line.startswith("E:ID_FS_LABEL="):
+                return line.split("=", 1)[1].strip()
+        return ""
+
+    def _iso9660_label(self, drive: str) -> str:
+        # Primary volume descriptor at sector 16: type 1, 'CD001', volume id at offset 40
+        try:
+            with open(drive, "rb") as f:
+                f.seek(16 * 2048)
+                pvd = f.read(72)
+        except OSError:
+            return ""
+        if len(pvd) < 72 or pvd[1:6] != b"CD001": return ""
+        return pvd[40:72].decode("ascii", errors="replace").strip()
+
+    def eject(self, drive: str) -> None:
+        try:
+            fd = os.open(drive, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            return
+        try:
+            try: fcntl.ioctl(fd, self._CDROM_LOCKDOOR, 0)
+            except OSError: pass
+            fcntl.ioctl(fd, self._CDROMEJECT, 0)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def mount_root(self, drive: str) -> Optional[Path]:
+        device = os.path.realpath(drive)
+        try:
+            with open("/proc/mounts", encoding="utf-8") as f:
+                for line in f:
+                    source, target = line.split()[:2]
+                    if os.path.realpath(source) == device:
+                        return Path(target.replace("\\040", " "))
+        except OSError:
+            pass
+        return None
+
+    def _uevent_socket(self) -> Optional[socket.socket]:
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, self._NETLINK_KOBJECT_UEVENT)
+            sock.bind((0, self._UEVENT_GROUPS))
+            return sock
+        except (OSError, AttributeError):
+            return None
+
+    @staticmethod
+    def _uevent_device(message: bytes) -> str:
+        """DEVNAME of a kernel ('change@...') or udev ('libudev' header) uevent."""
+        if message.startswith(b"libudev\0"):
+            offset, length = struct.unpack_from("II", message, 16)
+            message = message[offset:offset + length]
+        for field in message.split(b"\0"):
+            if field.startswith(b"DEVNAME="):
+                return os.path.basename(field[8:].decode("utf-8", errors="replace"))
+        return ""
+
+    def wait_for_disc(self, drive: str, present: bool, timeout: Optional[float] = None) -> bool:
+        sock = self._uevent_socket()
+        if sock is None:
+            return super().wait_for_disc(drive, present, timeout)
+
+        name = os.path.basename(os.path.realpath(drive))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            # The socket is open before the first check, so no event can slip in between
+            state = self.is_disc_present(drive)
+            while state != present:
+                wait = cfg.drive_idle_recheck_seconds
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0: return False
+                ready, _, _ = select.select([sock], [], [], wait)
+                if not ready:
+                    state = self.is_disc_present(drive)   # Safety net for missed events
+                    continue
+                # Drain everything queued and only re-check if one was for this drive
+                ours = False
+                while ready:
+                    ours |= self._uevent_device(sock.recv(64 * 1024)) == name
+                    ready, _, _ = select.select([sock], [], [], 0)
+                if ours:
+                    state = self.is_disc_present(drive)
+            return True
+        finally:
+            sock.close()
+
+# --- Fake (tests / benchmarks) ---
+class FakeDriveBackend(DriveBackend):
+    """
+    In-process drives for exercising the detect/scan/rip loop without hardware.
+    insert()/remove() change the media and wake any waiting pipeline at once.
+    """
+
+    def __init__(self):
+        self._discs: Dict[str, str] = {}
+        self._roots: Dict[str, Path] = {}
+        self._cond = threading.Condition()
+        self.ejects: Dict[str, int] = {}
+
+    def insert(self, drive: str, label: str, root: Optional[Path] = None) -> None:
+        with self._cond:
+            self._discs[drive] = label
+            if root: self._roots[drive] = root
+            self._cond.notify_all()
+
+    def remove(self, drive: str) -> None:
+        with self._cond:
+            self._discs.pop(drive, None)
+            self._roots.pop(drive, None)
+            self._cond.notify_all()
+
+    def volume_label(self, drive: str) -> str:
+        with self._cond:
+            return self._discs.get(drive, "")
+
+    def eject(self, drive: str) -> None:
+        with self._cond:
+            self.ejects[drive] = self.ejects.get(drive, 0) + 1
+        self.remove(drive)
+
+    def is_disc_present(self, drive: str) -> bool:
+        # A disc can be present before (or without) a label, like on real drives
+        with self._cond:
+            return drive in self._discs
+
+    def mount_root(self, drive: str) -> Optional[Path]:
+        with self._cond:
+            return self._roots.get(drive)
+
+    def wait_for_disc(self, drive: str, present: bool, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            return self._cond.wait_for(lambda: (drive in self._discs) == present, timeout)
+
+# --- Backend selection ---
+_backend: Optional[DriveBackend] = None
+_backend_lock = threading.Lock()
+
+def backend() -> DriveBackend:
+    """The process-wide backend chosen by cfg.drive_backend ('auto', 'windows', 'linux' or 'fake')."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = cfg.drive_backend
+            if name == "auto":
+                name = "windows" if sys.platform == "win32" else "linux"
+            _backend = {"windows": WindowsDriveBackend, "linux": LinuxDriveBackend,
+                        "fake": FakeDriveBackend}[name]()
+        return _backend
+
+def use(drive_backend: DriveBackend) -> None:
+    """Replaces the process-wide backend (e.g. with a FakeDriveBackend in tests)."""
+    global _backend
+    with _backend_lock:
+        _backend = drive_backend
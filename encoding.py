@@ -1,14 +1,85 @@
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from config import cfg
 import utils
+import job_store
+import progress
+import mp4_verify
+import placement
+import metrics
+import streams
+import fingerprint
+from job_store import Job
+from scheduler import is_gpu_encoder
+
+def resolve_ffmpeg() -> Optional[str]:
+    """Returns the ffmpeg binary used for chunk stitching, or None if chunking is off/unavailable."""
+    if not cfg.chunked_encoding: return None
+    try:
+        return utils.resolve_binary(cfg.ffmpeg_path, "ffmpeg")
+    except FileNotFoundError:
+        utils.console("WARNING: chunked_encoding needs ffmpeg for stitching. Chunking disabled.")
+        return None
+
+def default_settings(encoder: str) -> Dict[str, str]:
+    """Configured preset/quality for an encoder (video_codec uses the top-level settings)."""
+    settings = cfg.encoder_settings.get(encoder, {}) if encoder != cfg.video_codec else {}
+    return {
+        "preset": settings.get("preset", cfg.video_codec_preset),
+        "quality": settings.get("quality", cfg.video_quality),
+    }
+
+def output_path(job: Job, root: Path) -> Path:
+    """Where a job's MP4 goes under root (encoded_directory or scratch_directory): root/<label>/<raw name>.mp4"""
+    return root / utils.sanitize_filename(job.label) / (job.input_path.stem + ".mp4")
+
+def cleanup_raw(queue, job: Job) -> None:
+    """
+    Deletes the raw MKV of a verified job and records that it is gone.
+    A failed delete parks the job as 'raw-delete-failed' (retried on the next start),
+    so workers don't pick the same verified job up again straight away.
+    """
+    if cfg.keep_raw_files: return
+    with metrics.registry.span("delete", **metrics.title_key(job)) as span:
+        try: job.input_path.unlink()
+        except FileNotFoundError: pass
+        except OSError as e:
+            span["ok"] = False
+            utils.console(f"WARNING: Could not delete raw file {job.input_path.name}: {e}. Retried on the next start.")
+            utils.log_event(job.log_path, "RAW DELETE FAIL", f"{job.input_path.name}: {e}", job=job.id, error=str(e))
+            queue.set_state(job, job_store.RAW_DELETE_FAILED, f"raw delete: {e}")
+            return
+    queue.set_state(job, job_store.RAW_DELETED)
+
+def split_ranges(total_seconds: int, chunks: int) -> List[Tuple[int, Optional[int]]]:
+    """
+    Splits a title into (start, duration) ranges in whole seconds.
+    The last range has no duration so it always runs to the real end of the file.
+    """
+    chunks = max(1, min(chunks, total_seconds // 60 or 1))
+    step = total_seconds // chunks
+    ranges = []
+    for i in range(chunks):
+        start = i * step
+        ranges.append((start, step if i < chunks - 1 else None))
+    return ranges
 
 class EncodeWorker(threading.Thread):
-    def __init__(self, queue, handbrake_bin):
+    def __init__(self, queue, handbrake_bin, ffmpeg_bin: Optional[str] = None, tuner=None, transfers=None):
         super().__init__(daemon=True)
         self.queue = queue
         self.hb_bin = handbrake_bin
+        self.ffmpeg_bin = ffmpeg_bin
+        # Shared tuner.PresetTuner (None = always use the configured settings)
+        self.tuner = tuner
+        # Shared transfer.TransferStage; with cfg.scratch_directory set, encodes go there first
+        self.transfers = transfers
+        # Set when a HandBrake run of the current job was killed for making no progress
+        self.stalled = False
+        self.job: Optional[Job] = None
 
     def run(self):
         while True:
@@ -17,58 +88,227 @@ class EncodeWorker(threading.Thread):
                 self.queue.task_done()
                 break
             
+            self.job = job
             try:
-                # Unpack the job. 
-                # We use *job to handle cases where title_info might be missing (legacy/batch scripts)
-                self.process_job(*job)
+                self.process_job(job)
             except Exception as e:
                 # CATCH-ALL: This prevents the thread from dying
-                mkv_path = job[0]
-                log_path = job[2]
-                error_msg = f"CRITICAL WORKER CRASH on {mkv_path.name}: {e}"
+                error_msg = f"CRITICAL WORKER CRASH on {job.input_path.name}: {e}"
                 utils.console(error_msg)
-                utils.append_log_line(log_path, error_msg)
+                utils.log_event(job.log_path, "ENC FAIL", error_msg, job=job.id)
+                self.queue.set_state(job, job_store.FAILED, error_msg)
             finally:
-                self.queue.task_done()
+                self.queue.task_done(job)
+
+    def process_job(self, job: Job):
+        input_path, label, log_path, title_info = job.input_path, job.label, job.log_path, job.title_info
+        # Scratch mode: encode and verify on the local disk, the transfer stage archives it
+        scratch = self.transfers is not None and cfg.scratch_directory is not None
+        output_mp4 = output_path(job, cfg.scratch_directory if scratch else cfg.encoded_directory)
+        utils.ensure_directory(output_mp4.parent)
+
+        # Resumed after a crash between encode and cleanup: only the raw delete is left
+        if job.state == job_store.VERIFIED:
+            utils.console(f"Resuming cleanup: {output_mp4.name}")
+            self.cleanup_raw(job)
+            return
 
-    def process_job(self, input_path: Path, label: str, log_path: Path, title_info: Optional[Dict] = None):
-        dest_dir = cfg.encoded_directory / utils.sanitize_filename(label)
-        utils.ensure_directory(dest_dir)
-        output_mp4 = dest_dir / (input_path.stem + ".mp4")
+        key = metrics.title_key(job)
+        if job.queued_at:
+            metrics.registry.record("queue_wait", max(0.0, time.time() - job.queued_at), file=input_path.name, **key)
+
+        encoder = job.encoder or cfg.video_codec
+        settings = self.tuned_settings(job, encoder)
 
         # Verbose Output
+        tag = f"{encoder} {settings['preset']}/q{settings['quality']}"
         if title_info:
-            msg = f"Encoding: {label} Track {title_info['ID']} ({title_info['Length']} / {title_info['Size']})"
+            msg = f"Encoding: {label} Track {title_info['ID']} ({title_info['Length']} / {title_info['Size']}) [{tag}]"
         else:
-            msg = f"Encoding: {label} ({input_path.name})"
+            msg = f"Encoding: {label} ({input_path.name}) [{tag}]"
 
         utils.console(msg)
-        utils.append_log_line(log_path, f"ENC START {msg}")
+        utils.log_event(log_path, "ENC START", msg, job=job.id, input=input_path, encoder=encoder,
+                        preset=settings['preset'], quality=settings['quality'], attempt=job.attempts)
+        tracks = streams.audio_tracks(title_info)
+        if tracks:
+            audio = [f"{t['track']}: {streams.describe(t['stream'])} -> {t['encoder']}"
+                     + (f" {t['mixdown']}" if t['mixdown'] else "") for t in tracks]
+            utils.console(f"  Audio: {'; '.join(audio)}")
+            utils.log_event(log_path, "ENC STREAMS", "; ".join(audio), job=job.id, audio=audio)
+        started = time.monotonic()
+
+        self.stalled = False
+        with metrics.registry.span("encode", encoder=encoder, attempt=job.attempts, **key) as span:
+            if self.use_chunks(title_info, encoder):
+                rc = self.encode_chunked(job, output_mp4, encoder, settings)
+            else:
+                rc = self.run_handbrake(self.build_args(input_path, output_mp4, encoder, settings=settings,
+                                                        title_info=title_info),
+                                        log_path, str(job.id), f"{label}/{output_mp4.name}")
+            span["ok"] = rc == 0 and not self.stalled
+
+        if self.queue.is_cancelled(job):
+            utils.console(f"Cancelled: {input_path.name} (job was revoked)")
+            utils.append_log_line(log_path, f"ENC CANCELLED job {job.id}")
+            return
+        if self.stalled:
+            self.handle_stall(job)
+            return
+        if rc != 0:
+            utils.console(f"Failed: {input_path.name}")
+            utils.log_event(log_path, "ENC FAIL", f"rc={rc}", job=job.id, rc=rc)
+            self.queue.set_state(job, job_store.FAILED, f"rc={rc}")
+            return
+
+        # Container-level check (moov headers only) before the raw file may be deleted
+        with metrics.registry.span("verify", **key) as span:
+            problem = mp4_verify.verify_output(output_mp4, (title_info or {}).get('Seconds'),
+                                               len(tracks) if tracks else None)
+            span["ok"] = problem is None
+        if problem is None:
+            utils.console(f"Finished: {output_mp4.name}")
+            utils.log_event(log_path, "ENC SUCCESS", job=job.id, output=output_mp4,
+                            bytes=output_mp4.stat().st_size, seconds=round(time.monotonic() - started, 1))
+            if scratch:
+                # The raw file stays until the archive copy is confirmed
+                self.queue.set_state(job, job_store.TRANSFERRING)
+                self.transfers.submit(job)
+            else:
+                # Farm agents have no store; the coordinator indexes the job when it reports 'verified'
+                if hasattr(self.queue, "store"):
+                    fingerprint.remember(self.queue.store, job, output_mp4)
+                self.queue.set_state(job, job_store.VERIFIED)
+                self.cleanup_raw(job)
+        else:
+            utils.console(f"Failed verification: {output_mp4.name} ({problem}). Raw file kept.")
+            utils.log_event(log_path, "ENC FAIL", f"verification: {problem}", job=job.id, output=output_mp4)
+            self.queue.set_state(job, job_store.FAILED, f"verification: {problem}")
+
+    def run_handbrake(self, args: List[str], log_path: Path, key: str, name: str) -> int:
+        """Runs one HandBrakeCLI process with live progress tracking and the stall watchdog."""
+        tracker = progress.EncodeProgress(name)
+        progress.register(key, tracker)
+        try:
+            # Run with LOW priority to protect the Ripping process.
+            # A stall in any chunk of the job also stops its sibling chunks.
+            rc = utils.run_stream_log(
+                self.hb_bin, args, log_path, role=placement.ENCODE,
+                on_line=tracker.feed,
+                watchdog=lambda: tracker.is_stalled() or self.stalled or self.queue.is_cancelled(self.job),
+                lane=self.job.encoder if self.job else None
+            )
+        finally:
+            progress.unregister(key)
 
+        if tracker.stalled:
+            self.stalled = True
+            msg = f"ENC STALL {name}: no progress for {cfg.encode_stall_seconds}s at {tracker.percent:.1f}%, killed"
+            utils.console(msg)
+            utils.append_log_line(log_path, msg)
+        return rc
+
+    def handle_stall(self, job: Job):
+        """Puts a stalled job back in the queue, or fails it once it has used up its attempts."""
+        if job.attempts < cfg.encode_max_attempts:
+            utils.console(f"Requeued: {job.input_path.name} (attempt {job.attempts}/{cfg.encode_max_attempts})")
+            self.queue.set_state(job, job_store.QUEUED, "stalled")
+        else:
+            utils.console(f"Failed: {job.input_path.name} (stalled {job.attempts} times)")
+            utils.log_event(job.log_path, "ENC FAIL", "stalled", job=job.id, attempts=job.attempts)
+            self.queue.set_state(job, job_store.FAILED, "stalled")
+
+    def tuned_settings(self, job: Job, encoder: str) -> Dict[str, str]:
+        """Best-known preset/quality for this job's source class, trial-encoding samples if needed."""
+        if self.tuner is None: return default_settings(encoder)
+
+        def run_sample(trial: Dict[str, str], start: int, duration: int, output: Path) -> int:
+            self.stalled = False
+            extra = ["--start-at", f"seconds:{start}", "--stop-at", f"seconds:{duration}"]
+            return self.run_handbrake(
+                self.build_args(job.input_path, output, encoder, extra, trial, job.title_info), job.log_path,
+                f"{job.id}.tune", f"{job.label}/{job.input_path.stem} tuning {trial['preset']}/q{trial['quality']}"
+            )
+
+        tuned = self.tuner.settings_for(job.input_path, job.label, job.title_info,
+                                        encoder, run_sample, job.log_path)
+        self.stalled = False
+        return tuned or default_settings(encoder)
+
+    def build_args(self, input_path: Path, output_mp4: Path, encoder: str, extra: Optional[List[str]] = None,
+                   settings: Optional[Dict[str, str]] = None, title_info: Optional[Dict] = None) -> List[str]:
+        settings = settings or default_settings(encoder)
         args = [
             "-i", str(input_path),
             "-o", str(output_mp4),
             "-f", "av_mp4",
-            "-e", cfg.video_codec,
-            "-q", cfg.video_quality,
-            "--encoder-preset", cfg.video_codec_preset,
+            "-e", encoder,
+            "-q", settings["quality"],
+            "--encoder-preset", settings["preset"],
             "--optimize", "--auto-anamorphic", "--modulus", "2",
-            "--all-audio",
-            "--mixdown", cfg.audio_mixdown, 
-            "--aencoder", cfg.audio_codec, 
-            "--aq", cfg.audio_quality,
+            *streams.audio_args(title_info),
             "--subtitle", "none"
         ]
+        return args + (extra or [])
 
-        # Run with LOW priority to protect the Ripping process
-        rc = utils.run_stream_log(self.hb_bin, args, log_path, low_priority=True)
+    # --- Chunked Encoding ---
+    def use_chunks(self, title_info: Optional[Dict], encoder: str) -> bool:
+        # GPU encoders are capped by session limits, so only CPU lanes fan out into chunks
+        return bool(
+            self.ffmpeg_bin and title_info and cfg.chunk_count > 1
+            and not is_gpu_encoder(encoder)
+            and title_info.get('Seconds', 0) >= cfg.chunk_min_title_seconds
+        )
 
-        if rc == 0:
-            utils.console(f"Finished: {output_mp4.name}")
-            utils.append_log_line(log_path, "ENC SUCCESS")
-            if not cfg.keep_raw_files and output_mp4.stat().st_size > 1024:
-                try: input_path.unlink()
+    def encode_chunked(self, job: Job, output_mp4: Path, encoder: str, settings: Dict[str, str]) -> int:
+        """
+        Encodes time ranges of one title concurrently, then stream-copies them into output_mp4.
+        Every chunk is a separate encoder run, so each one opens on an IDR frame with a
+        closed GOP and the pieces can be concatenated without re-encoding.
+        Each concurrent chunk beyond the first occupies a free slot of the job's lane, so
+        chunked jobs never run more encoder processes than the lanes allow.
+        """
+        input_path, log_path, total_seconds = job.input_path, job.log_path, job.title_info['Seconds']
+        ranges = split_ranges(total_seconds, cfg.chunk_count)
+        parts = [output_mp4.with_name(f"{output_mp4.stem}.part{i:02d}.mp4") for i in range(len(ranges))]
+
+        def encode_part(index: int) -> int:
+            start, duration = ranges[index]
+            extra = ["--start-at", f"seconds:{start}"]
+            if duration is not None:
+                extra += ["--stop-at", f"seconds:{duration}"]
+            return self.run_handbrake(
+                self.build_args(input_path, parts[index], encoder, extra, settings, job.title_info), log_path,
+                f"{job.id}.{index}", f"{job.label}/{output_mp4.name} part {index + 1}/{len(ranges)}"
+            )
+
+        list_file = output_mp4.with_name(f"{output_mp4.stem}.parts.txt")
+        extra = self.queue.reserve_slots(encoder, len(ranges) - 1)
+        utils.append_log_line(log_path, f"ENC CHUNKED {len(ranges)} parts, {extra + 1} at a time: {ranges}")
+        try:
+            try:
+                with ThreadPoolExecutor(max_workers=extra + 1) as pool:
+                    codes = list(pool.map(encode_part, range(len(ranges))))
+            finally:
+                self.queue.release_slots(encoder, extra)
+            failed = [rc for rc in codes if rc != 0]
+            if failed or self.stalled: return failed[0] if failed else 1
+
+            # ffmpeg concat demuxer: one "file '<path>'" line per part, quotes escaped
+            list_file.write_text(
+                "".join("file '{}'\n".format(str(p).replace("'", "'\\''")) for p in parts),
+                encoding="utf-8"
+            )
+            rc = utils.run_stream_log(self.ffmpeg_bin, [
+                "-hide_banner", "-y", "-f", "concat", "-safe", "0", "-i", str(list_file),
+                "-map", "0", "-c", "copy", "-movflags", "+faststart", str(output_mp4)
+            ], log_path, role=placement.ENCODE, lane=encoder)
+            # The stitched duration is checked by the normal verification stage
+            return rc
+        finally:
+            for p in parts + [list_file]:
+                try: p.unlink()
                 except OSError: pass
-        else:
-            utils.console(f"Failed: {input_path.name}")
-            utils.append_log_line(log_path, f"ENC FAIL rc={rc}")
\ No newline at end of file
+
+    def cleanup_raw(self, job: Job):
+        cleanup_raw(self.queue, job)
\ No newline at end of file
@@ -0,0 +1,341 @@
+# farm.py
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+
+from config import cfg
+import utils
+import job_store
+import progress
+import encoding
+import fingerprint
+from job_store import Job
+from scheduler import configured_lanes
+
+# Coordinator -> agent paths, e.g. {"C:\\Raw": "\\\\ripper\\Raw"} or {"C:\\Raw": "/mnt/raw"}
+def map_path(path: str) -> Path:
+    for prefix, replacement in cfg.farm_path_map.items():
+        if path.lower().startswith(prefix.lower()):
+            rest = path[len(prefix):]
+            if os.sep == "/": rest = rest.replace("\\", "/")
+            return Path(replacement.rstrip("\\/") + rest)
+    return Path(path)
+
+def is_loopback(host: str) -> bool:
+    """True if host (a name or address) only accepts connections from this machine."""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+# --- Coordinator (runs next to the EncodeScheduler in main.py / reprocess.py) ---
+def listen() -> ThreadingHTTPServer:
+    """
+    Checks the coordinator settings and binds farm_bind:farm_port, before any worker starts.
+    Raises RuntimeError for a non-local farm_bind without a farm_token, OSError if the port is taken.
+    """
+    if not cfg.farm_token and not is_loopback(cfg.farm_bind):
+        raise RuntimeError(f"farm_bind {cfg.farm_bind} accepts agents from the network: set a farm_token first")
+    server = ThreadingHTTPServer((cfg.farm_bind, cfg.farm_port), _JsonHandler)
+    server.daemon_threads = True
+    return server
+
+@dataclass
+class Lease:
+    id: str
+    job: Job
+    agent: str
+    expires: float
+    progress: progress.EncodeProgress
+
+class FarmCoordinator:
+    """
+    Hands queued jobs to remote agents over a small JSON/HTTP protocol:
+      POST /lease      {agent, encoder}            -> {lease, job} or 204 when nothing is queued
+      POST /heartbeat  {lease, percent, fps, eta}  -> 200, or 410 once the lease is gone
+      POST /state      {lease, state, error}       -> job state change (verified, failed, ...)
+      POST /complete   {lease}                     -> the agent is done with the job
+    A lease that misses heartbeats for cfg.farm_lease_seconds is dropped and its job
+    requeued (or failed after cfg.encode_max_attempts), like a stalled local encode.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self._leases: Dict[str, Lease] = {}
+        self._lock = threading.Lock()
+
+    def start(self, server: ThreadingHTTPServer) -> None:
+        """Serves the farm API on a server from listen()."""
+        server.coordinator = self
+        threading.Thread(target=server.serve_forever, daemon=True, name="farm-http").start()
+        threading.Thread(target=self._expire_loop, daemon=True, name="farm-leases").start()
+        utils.console(f"Encode farm coordinator listening on {cfg.farm_bind}:{cfg.farm_port}")
+
+    def handle(self, path: str, body: Dict):
+        """Returns (status, payload) for one request."""
+        if path == "/lease":
+            return self.lease(str(body.get("agent", "?")), str(body.get("encoder", cfg.video_codec)))
+
+        with self._lock:
+            lease = self._leases.get(str(body.get("lease")))
+        if lease is None:
+            return 410, {"error": "unknown or expired lease"}
+
+        if path == "/heartbeat":
+            p = lease.progress
+            try:
+                percent, fps = float(body.get("percent", p.percent)), float(body.get("fps", p.fps))
+                eta = body.get("eta", p.eta_seconds)
+                eta = None if eta is None else int(float(eta))
+            except (TypeError, ValueError):
+                return 400, {"error": "percent, fps and eta must be numbers"}
+            lease.expires = time.monotonic() + cfg.farm_lease_seconds
+            p.percent, p.fps, p.eta_seconds = percent, fps, eta
+            return 200, {}
+        if path == "/state":
+            state = body.get("state")
+            if state not in (job_store.QUEUED, job_store.VERIFIED, job_store.RAW_DELETED,
+                             job_store.RAW_DELETE_FAILED, job_store.FAILED):
+                return 400, {"error": f"bad state {state!r}"}
+            if state == job_store.VERIFIED:
+                # Indexed here, before the agent deletes the raw file
+                fingerprint.remember(self.scheduler.store, lease.job,
+                                     encoding.output_path(lease.job, cfg.encoded_directory))
+            error = body.get("error")
+            self.scheduler.set_state(lease.job, state, None if error is None else str(error))
+            return 200, {}
+        if path == "/complete":
+            self._finish(lease)
+            return 200, {}
+        return 404, {"error": f"unknown endpoint {path}"}
+
+    def lease(self, agent: str, encoder: str):
+        job = self.scheduler.lease(agent, encoder)
+        if job is None:
+            return 204, None
+
+        lease = Lease(uuid.uuid4().hex, job, agent, time.monotonic() + cfg.farm_lease_seconds,
+                      progress.EncodeProgress(f"{agent}: {job.label}/{job.input_path.stem}"))
+        with self._lock:
+            self._leases[lease.id] = lease
+        progress.register(f"farm.{lease.id}", lease.progress)
+        utils.console(f"Farm: {job.input_path.name} leased to {agent} [{encoder}]")
+        utils.log_event(job.log_path, "FARM LEASE", agent, job=job.id, agent=agent, encoder=encoder, attempt=job.attempts)
+        return 200, {
+            "lease": lease.id,
+            "job": {
+                "id": job.id, "input_path": str(job.input_path), "label": job.label,
+                "log_path": str(job.log_path), "title_info": job.title_info,
+                "state": job.state, "attempts": job.attempts,
+            },
+        }
+
+    def _finish(self, lease: Lease) -> None:
+        with self._lock:
+            if self._leases.pop(lease.id, None) is None: return
+        progress.unregister(f"farm.{lease.id}")
+        self.scheduler.task_done(lease.job)
+
+    def _expire_loop(self) -> None:
+        while True:
+            time.sleep(max(1, cfg.farm_heartbeat_seconds))
+            now = time.monotonic()
+            with self._lock:
+                expired = [l for l in self._leases.values() if l.expires < now]
+            for lease in expired:
+                job = lease.job
+                if job.state == job_store.ENCODING:
+                    retry = job.attempts < cfg.encode_max_attempts
+                    utils.console(f"Farm: lease on {job.input_path.name} held by {lease.agent} expired, "
+                                  f"{'requeued' if retry else 'failed'}")
+                    utils.log_event(job.log_path, "FARM EXPIRED", lease.agent, job=job.id, agent=lease.agent)
+                    self.scheduler.set_state(job, job_store.QUEUED if retry else job_store.FAILED, "lease expired")
+                self._finish(lease)
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if cfg.farm_token and self.headers.get("X-Farm-Token") != cfg.farm_token:
+            self._reply(403, {"error": "bad token"}); return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._reply(400, {"error": "bad json"}); return
+        if not isinstance(body, dict):
+            self._reply(400, {"error": "body must be a JSON object"}); return
+        status, payload = self.server.coordinator.handle(self.path, body)
+        self._reply(status, payload)
+
+    def _reply(self, status: int, payload: Optional[Dict]) -> None:
+        data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        if data: self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Leases/heartbeats every few seconds would flood the console
+
+# --- Agent side (farm_agent.py) ---
+class RemoteQueue:
+    """
+    Stands in for the EncodeScheduler on a farm agent, so unmodified EncodeWorkers
+    lease their jobs from the coordinator. Paths are translated with cfg.farm_path_map;
+    a background thread sends heartbeats with live progress for every held lease.
+    """
+
+    def __init__(self, coordinator_url: str, agent_name: Optional[str] = None):
+        self.url = coordinator_url.rstrip("/")
+        self.agent = agent_name or socket.gethostname()
+        self.lanes = {codec: slots for codec, slots in configured_lanes().items() if slots > 0}
+        self._active = {codec: 0 for codec in self.lanes}
+        self._leases: Dict[int, str] = {}
+        self._lost: set = set()
+        self._stop_requests = 0
+        self._unreachable = False
+        self._cond = threading.Condition()
+        threading.Thread(target=self._heartbeat_loop, daemon=True, name="farm-heartbeat").start()
+
+    @property
+    def worker_count(self) -> int:
+        return sum(self.lanes.values())
+
+    def _post(self, path: str, body: Dict):
+        """Returns (status, payload). Raises OSError when the coordinator can't be reached."""
+        request = urllib.request.Request(
+            self.url + path, data=json.dumps(body).encode("utf-8"), method="POST",
+            headers={"Content-Type": "application/json", "X-Farm-Token": cfg.farm_token},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                data = response.read()
+                return response.status, json.loads(data) if data else None
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    # --- Queue-compatible interface ---
+    def put(self, job: Optional[tuple]) -> None:
+        if job is not None:
+            raise ValueError("Farm agents only take jobs from the coordinator")
+        with self._cond:
+            self._stop_requests += 1
+            self._cond.notify_all()
+
+    def get(self) -> Optional[Job]:
+        while True:
+            with self._cond:
+                if self._stop_requests:
+                    self._stop_requests -= 1
+                    return None
+                encoder = next((c for c in self.lanes if self._active[c] < self.lanes[c]), None)
+                if encoder: self._active[encoder] += 1
+            if encoder is None:
+                time.sleep(cfg.farm_poll_seconds); continue
+
+            try:
+                status, reply = self._post("/lease", {"agent": self.agent, "encoder": encoder})
+                if self._unreachable:
+                    self._unreachable = False
+                    utils.console("Farm: coordinator reachable again")
+            except OSError as e:
+                # Every idle worker polls, so only report the start of an outage
+                if not self._unreachable:
+                    self._unreachable = True
+                    utils.console(f"Farm: coordinator unreachable ({e}), retrying every {cfg.farm_poll_seconds}s")
+                status, reply = None, None
+            if status == 200 and reply:
+                job = self._to_job(reply["job"], encoder)
+                with self._cond:
+                    self._leases[job.id] = reply["lease"]
+                return job
+
+            with self._cond:
+                self._active[encoder] -= 1
+                if self._stop_requests: continue
+                self._cond.wait(timeout=cfg.farm_poll_seconds)
+
+    def task_done(self, job: Optional[Job] = None) -> None:
+        if job is None: return
+        with self._cond:
+            lease = self._leases.pop(job.id, None)
+            lost = job.id in self._lost
+            self._lost.discard(job.id)
+            if job.encoder in self._active: self._active[job.encoder] -= 1
+            self._cond.notify_all()
+        if lease and not lost:
+            self._send(lease, "/complete", {})
+
+    def reserve_slots(self, codec: str, wanted: int) -> int:
+        """Same as EncodeScheduler.reserve_slots, against this agent's own lanes."""
+        with self._cond:
+            if codec not in self.lanes: return 0
+            count = max(0, min(wanted, self.lanes[codec] - self._active[codec]))
+            self._active[codec] += count
+            return count
+
+    def release_slots(self, codec: str, count: int) -> None:
+        if count <= 0: return
+        with self._cond:
+            if codec in self._active: self._active[codec] -= count
+            self._cond.notify_all()
+
+    def set_state(self, job: Job, state: str, error: Optional[str] = None) -> None:
+        job.state = state
+        with self._cond:
+            lease = self._leases.get(job.id)
+            if lease is None or job.id in self._lost: return
+        self._send(lease, "/state", {"state": state, "error": error})
+
+    def is_cancelled(self, job: Optional[Job]) -> bool:
+        """True once the coordinator dropped this job's lease (the encode is then killed)."""
+        return job is not None and job.id in self._lost
+
+    # --- Internals ---
+    def _to_job(self, data: Dict, encoder: str) -> Job:
+        return Job(
+            id=data["id"], input_path=map_path(data["input_path"]), label=data["label"],
+            log_path=map_path(data["log_path"]), title_info=data["title_info"],
+            state=data["state"], attempts=data["attempts"], encoder=encoder,
+        )
+
+    def _send(self, lease: str, path: str, body: Dict) -> None:
+        try:
+            status, _ = self._post(path, dict(body, lease=lease))
+        except OSError as e:
+            utils.console(f"Farm: could not reach coordinator for {path} ({e})")
+            return
+        if status == 410:
+            utils.console(f"Farm: lease {lease[:8]} no longer valid on the coordinator")
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(cfg.farm_heartbeat_seconds)
+            with self._cond:
+                held = [(job_id, lease) for job_id, lease in self._leases.items() if job_id not in self._lost]
+            for job_id, lease in held:
+                runs = progress.for_job(job_id)
+                body = {
+                    "lease": lease,
+                    "percent": sum(p.percent for p in runs) / len(runs) if runs else 0.0,
+                    "fps": sum(p.fps for p in runs),
+                    "eta": max((p.eta_seconds or 0 for p in runs), default=None),
+                }
+                try:
+                    status, _ = self._post("/heartbeat", body)
+                except OSError:
+                    continue  # The coordinator decides when the lease is lost
+                if status == 410:
+                    utils.console(f"Farm: lease for job {job_id} expired on the coordinator, stopping it")
+                    with self._cond:
+                        self._lost.add(job_id)
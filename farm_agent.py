@@ -0,0 +1,48 @@
+# farm_agent.py
+import argparse
+import time
+
+from config import cfg
+import utils
+import progress
+import metrics
+from encoding import EncodeWorker, resolve_ffmpeg
+from farm import RemoteQueue
+from tuner import PresetTuner
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode jobs leased from an Auto_MKBrake farm coordinator.")
+    parser.add_argument("--coordinator", default=cfg.farm_coordinator_url,
+                        help=f"Coordinator URL (default {cfg.farm_coordinator_url})")
+    parser.add_argument("--name", help="Agent name shown on the coordinator (default: host name)")
+    opts = parser.parse_args()
+
+    # 1. Verify Binaries
+    try:
+        hb_bin = utils.resolve_binary(cfg.handbrake_path, "HandBrakeCLI")
+    except Exception as e:
+        utils.console(f"Setup Error: {e}")
+        return
+
+    # 2. Setup Workers (one per local encoder lane slot, same as the coordinator's own workers)
+    job_queue = RemoteQueue(opts.coordinator, opts.name)
+    ffmpeg_bin = resolve_ffmpeg()
+    tuner = PresetTuner(hb_bin) if cfg.auto_tune else None
+    workers = [EncodeWorker(job_queue, hb_bin, ffmpeg_bin, tuner) for _ in range(job_queue.worker_count)]
+    for w in workers:
+        w.start()
+    progress.start_reporter()
+    metrics.registry.gauge("encode_fps", "Sum of the fps of all running HandBrake processes.", progress.total_fps)
+    metrics.registry.start()
+
+    utils.console(f"Farm agent '{job_queue.agent}' with {job_queue.worker_count} worker(s) "
+                  f"({', '.join(job_queue.lanes)}), pulling from {opts.coordinator}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        utils.console("Stopping... (running encodes are abandoned; their leases expire and are requeued)")
+
+if __name__ == "__main__":
+    main()
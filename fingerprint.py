@@ -0,0 +1,96 @@
+# fingerprint.py
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from config import cfg
+import utils
+from job_store import Job
+
+# Index kinds: scan metadata of a disc title, sampled content of a raw MKV
+TITLE = "title"
+FILE = "file"
+
+_ACTIONS = ("ask", "skip", "link", "off")
+
+def duplicate_action() -> str:
+    """cfg.duplicate_action, validated. Raises ValueError for an unknown action."""
+    if cfg.duplicate_action not in _ACTIONS:
+        raise ValueError(f"duplicate_action must be one of {', '.join(_ACTIONS)}, not {cfg.duplicate_action!r}")
+    return cfg.duplicate_action
+
+# --- Keys ---
+def title_key(title: Optional[Dict]) -> Optional[str]:
+    """
+    Fingerprint of a title from its scan metadata: duration, exact size, segment map,
+    chapters, angle and stream table. The disc label is left out, so the same extras on
+    another disc of a set (or a replacement copy) match. None = too little metadata.
+    """
+    if not title or not title.get("Seconds"): return None
+    if not (title.get("Bytes") or title.get("Segments")): return None
+    stream_table = [[s["Type"], s["CodecId"], s["Language"], s["Channels"]] for s in title.get("Streams", [])]
+    data = [title["Seconds"], title.get("Bytes") or title.get("Size"), title.get("Segments"),
+            title.get("Chapters"), title.get("Angle"), stream_table]
+    return hashlib.sha1(json.dumps(data).encode("utf-8")).hexdigest()
+
+def file_key(path: Path) -> Optional[str]:
+    """
+    Fingerprint of a raw MKV without reading all of it: the file size and
+    cfg.fingerprint_samples blocks at fixed fractions of the file, read through mmap.
+    The first and last blocks are skipped; the MKV header carries a random segment
+    UID and the mux date. None if the file can't be read.
+    """
+    block = max(1, cfg.fingerprint_block_kb) * 1024
+    samples = max(1, cfg.fingerprint_samples)
+    try:
+        size = path.stat().st_size
+        if size == 0: return None
+        digest = hashlib.sha1(str(size).encode("ascii"))
+        with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for i in range(1, samples + 1):
+                offset = size * i // (samples + 1)
+                digest.update(buf[offset:offset + block])
+        return digest.hexdigest()
+    except (OSError, ValueError):
+        return None
+
+# --- Index (fingerprints table of the job store) ---
+def remember(store, job: Job, output: Path) -> None:
+    """Indexes a verified encode under its title and raw file fingerprints (call before the raw is deleted)."""
+    for kind, key in ((TITLE, title_key(job.title_info)), (FILE, file_key(job.input_path))):
+        if key: store.record_fingerprint(kind, key, output, job.label)
+
+def find(store, kind: str, key: Optional[str]) -> Optional[Path]:
+    """The archived MP4 indexed under key, if it still exists."""
+    if not key or cfg.duplicate_action == "off": return None
+    match = store.find_fingerprint(kind, key)
+    if match is None: return None
+    output = Path(match["output"])
+    return output if output.exists() else None
+
+def find_title(store, title: Dict) -> Optional[Path]:
+    return find(store, TITLE, title_key(title))
+
+def find_file(store, path: Path) -> Optional[Path]:
+    # Sampling the file costs reads; skip them when nothing would be done with a match
+    if cfg.duplicate_action == "off": return None
+    return find(store, FILE, file_key(path))
+
+def link_output(existing: Path, target: Path, log: Path) -> bool:
+    """
+    Makes target point at an already archived MP4: a hard link, or a symbolic
+    link where hard links are not possible (e.g. another volume). False on failure.
+    """
+    if target.exists(): return target.samefile(existing)
+    try:
+        utils.ensure_directory(target.parent)
+        try: os.link(existing, target)
+        except OSError: os.symlink(existing, target)
+    except OSError as e:
+        utils.console(f"WARNING: Could not link {target} to {existing}: {e}")
+        return False
+    utils.log_event(log, "DUP LINK", target.name, existing=existing, target=target)
+    return True
@@ -0,0 +1,305 @@
+# job_store.py
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Job lifecycle. A job only ever moves forward through these states, except
+# that an interrupted 'encoding' job is put back to 'queued' on restart.
+# 'transferring' (verified in the scratch directory, not yet copied to the
+# archive) is only used when cfg.scratch_directory is set. A 'raw-delete-failed'
+# job (raw file locked or read-only) is parked until the next start, which
+# makes it 'verified' again for one more delete attempt. Likewise a
+# 'transfer-failed' job (archive copy failed, scratch copy and raw file kept)
+# is made 'transferring' again on the next start, so only the copy is retried.
+QUEUED = "queued"
+ENCODING = "encoding"
+TRANSFERRING = "transferring"
+TRANSFER_FAILED = "transfer-failed"
+VERIFIED = "verified"
+RAW_DELETED = "raw-deleted"
+RAW_DELETE_FAILED = "raw-delete-failed"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_path  TEXT NOT NULL,
+    label       TEXT NOT NULL,
+    log_path    TEXT NOT NULL,
+    title_info  TEXT,
+    state       TEXT NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    error       TEXT,
+    created_at  REAL NOT NULL,
+    updated_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state);
+CREATE INDEX IF NOT EXISTS jobs_input ON jobs(input_path);
+CREATE TABLE IF NOT EXISTS rip_failures (
+    label       TEXT NOT NULL,
+    raw_id      INTEGER NOT NULL,
+    title_info  TEXT,
+    reason      TEXT,
+    attempts    INTEGER NOT NULL DEFAULT 1,
+    failed_at   REAL NOT NULL,
+    PRIMARY KEY (label, raw_id)
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    kind        TEXT NOT NULL,
+    key         TEXT NOT NULL,
+    output      TEXT NOT NULL,
+    label       TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+"""
+
+@dataclass
+class Job:
+    id: int
+    input_path: Path
+    label: str
+    log_path: Path
+    title_info: Optional[Dict]
+    state: str
+    attempts: int = 0
+    # Wall-clock time the job last entered its current state (for a queued job: when it was queued)
+    queued_at: Optional[float] = None
+    # Runtime only (not persisted): encoder lane the scheduler assigned
+    encoder: Optional[str] = None
+    # Runtime only: farm agent holding the job's lease (None = local worker)
+    agent: Optional[str] = None
+
+def _placeholders(values: tuple) -> str:
+    return ",".join("?" * len(values))
+
+def _row_to_job(row: sqlite3.Row) -> Job:
+    return Job(
+        id=row["id"],
+        input_path=Path(row["input_path"]),
+        label=row["label"],
+        log_path=Path(row["log_path"]),
+        title_info=json.loads(row["title_info"]) if row["title_info"] else None,
+        state=row["state"],
+        attempts=row["attempts"],
+        queued_at=row["updated_at"],
+    )
+
+class JobStore:
+    """
+    Durable replacement for the in-memory encode queue.
+    Every job is a row in a SQLite database, so a crash loses nothing: on the
+    next start, interrupted encodes are re-queued and verified encodes only
+    have their raw cleanup finished. Exposes the same put/get/task_done/join
+    calls the workers used on queue.Queue.
+    """
+
+    def __init__(self, db_path: Path, cleanup_verified: bool = True):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        # Verified jobs still need work only if their raw file is to be deleted
+        self._waiting_states = (QUEUED, VERIFIED) if cleanup_verified else (QUEUED,)
+        # Failed transfers stay active (parked), so the raw file isn't queued for a second encode
+        self._active_states = self._waiting_states + (ENCODING, TRANSFERRING, TRANSFER_FAILED)
+        # Jobs whose raw file is still going to be deleted (verified ones only with cleanup on)
+        self.raw_pending_states = (QUEUED, ENCODING, TRANSFERRING, TRANSFER_FAILED) + ((VERIFIED,) if cleanup_verified else ())
+
+        self._cond = threading.Condition()
+        self._stop_requests = 0
+        self._claimed: set = set()
+        self.cleanup_verified = cleanup_verified
+        self.resumed = self._recover()
+
+    # --- Internal helpers ---
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._cond:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _recover(self) -> int:
+        """Puts jobs that were mid-encode when the process died back in the queue."""
+        now = time.time()
+        self._query(
+            "UPDATE jobs SET state=?, updated_at=? WHERE state=?",
+            (QUEUED, now, ENCODING),
+        )
+        # Archive copies that failed last run are retried from the kept scratch copy
+        self._query(
+            "UPDATE jobs SET state=?, updated_at=? WHERE state=?",
+            (TRANSFERRING, now, TRANSFER_FAILED),
+        )
+        if self.cleanup_verified:
+            # Raw deletes that failed last run (e.g. a file held open) get one more try
+            self._query(
+                "UPDATE jobs SET state=?, updated_at=? WHERE state=?",
+                (VERIFIED, now, RAW_DELETE_FAILED),
+            )
+        rows = self._query(
+            f"SELECT COUNT(*) FROM jobs WHERE state IN ({_placeholders(self._active_states)})",
+            self._active_states,
+        )
+        return rows[0][0]
+
+    # --- Queue-compatible interface ---
+    def put(self, job: Optional[tuple]) -> Optional[int]:
+        """
+        Adds a job tuple (input_path, label, log_path[, title_info]).
+        None is a shutdown request for one worker and is never persisted.
+        Returns the job id, or None if the file already has an active job.
+        """
+        with self._cond:
+            if job is None:
+                self._stop_requests += 1
+                self._cond.notify()
+                return None
+
+            input_path, label, log_path = job[0], job[1], job[2]
+            title_info = job[3] if len(job) > 3 else None
+
+            existing = self._conn.execute(
+                f"SELECT id FROM jobs WHERE input_path=? AND state IN ({_placeholders(self._active_states)})",
+                (str(input_path),) + self._active_states,
+            ).fetchone()
+            if existing:
+                return None
+
+            now = time.time()
+            cur = self._conn.execute(
+                "INSERT INTO jobs (input_path, label, log_path, title_info, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(input_path), label, str(log_path),
+                 json.dumps(title_info) if title_info else None, QUEUED, now, now),
+            )
+            self._cond.notify()
+            return cur.lastrowid
+
+    def get(self) -> Optional[Job]:
+        """Blocks until a job is available, claims it and returns it (None = stop)."""
+        with self._cond:
+            while True:
+                if self._stop_requests:
+                    self._stop_requests -= 1
+                    return None
+                waiting = self.waiting()
+                if waiting:
+                    return self.claim(waiting[0])
+                self._cond.wait()
+
+    def task_done(self, job: Optional[Job] = None) -> None:
+        with self._cond:
+            if job is not None:
+                self._claimed.discard(job.id)
+            self._cond.notify_all()
+
+    def join(self) -> None:
+        """Blocks until no job is waiting or being worked on (transfers included)."""
+        with self._cond:
+            while self._claimed or self._count_waiting() or self._count_transferring():
+                self._cond.wait()
+
+    # --- State tracking ---
+    def waiting(self) -> List[Job]:
+        """Unclaimed jobs that need a worker, verified (cleanup-only) jobs first, then FIFO."""
+        rows = self._query(
+            f"SELECT * FROM jobs WHERE state IN ({_placeholders(self._waiting_states)}) "
+            "ORDER BY state=? DESC, id",
+            self._waiting_states + (VERIFIED,),
+        )
+        return [_row_to_job(r) for r in rows if r["id"] not in self._claimed]
+
+    def claim(self, job: Job) -> Job:
+        """Marks a waiting job as taken by a worker (queued jobs move to 'encoding')."""
+        with self._cond:
+            self._claimed.add(job.id)
+            if job.state == QUEUED:
+                job.state = ENCODING
+                job.attempts += 1
+                self._conn.execute(
+                    "UPDATE jobs SET state=?, attempts=?, updated_at=? WHERE id=?",
+                    (ENCODING, job.attempts, time.time(), job.id),
+                )
+            return job
+
+    def _count_waiting(self) -> int:
+        # Claimed verified jobs are counted via self._claimed instead
+        rows = self._conn.execute(
+            f"SELECT id FROM jobs WHERE state IN ({_placeholders(self._waiting_states)})",
+            self._waiting_states,
+        ).fetchall()
+        return sum(1 for r in rows if r["id"] not in self._claimed)
+
+    def _count_transferring(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE state=?", (TRANSFERRING,)).fetchone()[0]
+
+    def set_state(self, job: Job, state: str, error: Optional[str] = None) -> None:
+        with self._cond:
+            job.state = state
+            self._conn.execute(
+                "UPDATE jobs SET state=?, error=?, updated_at=? WHERE id=?",
+                (state, error, time.time(), job.id),
+            )
+            self._cond.notify_all()
+
+    def is_active(self, input_path: Path) -> bool:
+        rows = self._query(
+            f"SELECT 1 FROM jobs WHERE input_path=? AND state IN ({_placeholders(self._active_states)})",
+            (str(input_path),) + self._active_states,
+        )
+        return bool(rows)
+
+    def jobs(self, states: Optional[tuple] = None) -> List[Job]:
+        if states:
+            rows = self._query(
+                f"SELECT * FROM jobs WHERE state IN ({_placeholders(states)}) ORDER BY id",
+                tuple(states),
+            )
+        else:
+            rows = self._query("SELECT * FROM jobs ORDER BY id")
+        return [_row_to_job(r) for r in rows]
+
+    # --- Failed rips (titles to retry with a cleaned disc or another drive) ---
+    def record_rip_failure(self, label: str, title_info: Dict, reason: str) -> None:
+        self._query(
+            "INSERT INTO rip_failures (label, raw_id, title_info, reason, failed_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(label, raw_id) DO UPDATE SET reason=excluded.reason, title_info=excluded.title_info, "
+            "attempts=attempts+1, failed_at=excluded.failed_at",
+            (label, title_info["RawID"], json.dumps(title_info), reason, time.time()),
+        )
+
+    def clear_rip_failure(self, label: str, raw_id: int) -> None:
+        self._query("DELETE FROM rip_failures WHERE label=? AND raw_id=?", (label, raw_id))
+
+    def rip_failures(self, label: Optional[str] = None) -> List[Dict]:
+        """Failed titles (all discs, or one label) as {label, raw_id, title_info, reason, attempts, failed_at}."""
+        if label is None:
+            rows = self._query("SELECT * FROM rip_failures ORDER BY failed_at")
+        else:
+            rows = self._query("SELECT * FROM rip_failures WHERE label=? ORDER BY raw_id", (label,))
+        return [
+            dict(r, title_info=json.loads(r["title_info"]) if r["title_info"] else None)
+            for r in rows
+        ]
+
+    # --- Fingerprint index (titles and raw files that already have an encode, see fingerprint.py) ---
+    def record_fingerprint(self, kind: str, key: str, output: Path, label: str) -> None:
+        self._query(
+            "INSERT OR REPLACE INTO fingerprints (kind, key, output, label, recorded_at) VALUES (?, ?, ?, ?, ?)",
+            (kind, key, str(output), label, time.time()),
+        )
+
+    def find_fingerprint(self, kind: str, key: str) -> Optional[Dict]:
+        """{kind, key, output, label, recorded_at} of an indexed encode, or None."""
+        rows = self._query("SELECT * FROM fingerprints WHERE kind=? AND key=?", (kind, key))
+        return dict(rows[0]) if rows else None
+
+    def close(self) -> None:
+        with self._cond:
+            self._conn.close()
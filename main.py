@@ -1,27 +1,22 @@
+import threading
 import time
-import queue
-from datetime import datetime
-from pathlib import Path
 
 from config import cfg
 import utils
+import progress
 import disc_ops
-from encoding import EncodeWorker
-
-def parse_selection(selection: str, valid_ids: list) -> list:
-    s = selection.lower().replace(" ", "")
-    if s == "all": return valid_ids
-    if not s: return []
-    res = set()
-    for part in s.split(','):
-        if '-' in part:
-            try:
-                start, end = map(int, part.split('-'))
-                res.update(range(start, end + 1))
-            except ValueError: pass
-        elif part.isdigit():
-            res.add(int(part))
-    return sorted(list(res.intersection(valid_ids)))
+import fingerprint
+import metrics
+import placement
+import title_rules
+from encoding import EncodeWorker, resolve_ffmpeg
+from farm import FarmCoordinator, listen
+from tuner import PresetTuner
+from transfer import TransferStage
+from job_store import JobStore
+from scheduler import EncodeScheduler
+from admission import AdmissionController
+from drive_pipeline import DrivePipeline, report_status
 
 def main():
     try:
@@ -31,86 +26,52 @@ def main():
         utils.console("Checking MakeMKV license status...")
         disc_ops.verify_license(mkv_bin)
         utils.console("License check passed.")
+        disc_ops.rip_options()  # Fail now, not at the first rip, on bad rip tuning settings
+        fingerprint.duplicate_action()
+        title_rules.check_settings()
+        # Bind the farm port now: a bad farm setting stops here, before any worker starts
+        farm_server = listen() if cfg.farm_coordinator else None
         
     except Exception as e:
         utils.console(f"Setup Error: {e}"); return
 
-    q = queue.Queue()
-    workers = [EncodeWorker(q, hb_bin) for _ in range(cfg.encoder_worker_threads)]
+    placement.manager.check_boost()
+    store = JobStore(cfg.job_database, cleanup_verified=not cfg.keep_raw_files)
+    if store.resumed:
+        utils.console(f"Resuming {store.resumed} unfinished encode job(s) from {cfg.job_database}")
+    for f in store.rip_failures():
+        utils.console(f"Earlier failed rip: {f['label']} track {f['raw_id']} ({f['reason']}, {f['attempts']} attempt(s))")
+    q = EncodeScheduler(store)
+    ffmpeg_bin = resolve_ffmpeg()
+    tuner = PresetTuner(hb_bin) if cfg.auto_tune else None
+    transfers = TransferStage(q)
+    workers = [EncodeWorker(q, hb_bin, ffmpeg_bin, tuner, transfers) for _ in range(q.worker_count)]
     for w in workers: w.start()
+    progress.start_reporter()
+    if farm_server is not None:
+        FarmCoordinator(q).start(farm_server)
 
-    utils.console(f"Auto_MKBrake Active. Waiting for discs in {cfg.drive_letter}...")
-
-    try:
-        while True:
-            # --- Polling Loop ---
-            try:
-                while not disc_ops.is_disc_present(cfg.drive_letter): 
-                    time.sleep(2)
-            except KeyboardInterrupt: raise
-            except Exception: time.sleep(2); continue 
-            
-            try:
-                # --- Disc Detection ---
-                disc_lbl = disc_ops.get_disc_volume_label(cfg.drive_letter)
-                safe_lbl = utils.sanitize_filename(disc_lbl)
-                raw_dir = cfg.raw_directory / safe_lbl
-                utils.ensure_directory(raw_dir)
-                
-                log_path = raw_dir / f"log_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-
-                utils.console(f"Disc Found: {disc_lbl}")
-                titles = disc_ops.list_disc_titles(mkv_bin, cfg.drive_letter)
-                valid_ids = [t["ID"] for t in titles]
+    admission = AdmissionController(q)
+    utils.console(f"Raw space: {admission.snapshot().summary()}")
+    drives = [DrivePipeline(drive, mkv_bin, q, admission) for drive in cfg.drive_letters]
+    for d in drives: d.start()
+    if cfg.drive_status_seconds > 0:
+        threading.Thread(target=report_status, args=(drives, q, admission, transfers), daemon=True).start()
 
-                if not valid_ids:
-                    utils.console("No valid titles found.")
-                    disc_ops.eject_disc(cfg.drive_letter)
-                    time.sleep(5); continue
+    # Gauges for the metrics endpoint / JSONL file (stage spans are recorded by the pipelines and workers)
+    metrics.watch_scheduler(q)
+    metrics.registry.gauge("raw_free_bytes", "Free space on the raw directory.", admission.free_bytes)
+    for d in drives:
+        metrics.registry.gauge("rip_read_bytes_per_second", "Current read speed of a running rip.",
+                               lambda d=d: d.monitor.current_rate if d.monitor else 0.0, drive=d.drive)
+    metrics.registry.start()
 
-                # --- User Interaction ---
-                print(f"\n{'='*40}\n DISC: {disc_lbl}\n{'='*40}")
-                print(f" {'Index':<5} | {'Length':<10} | {'Size':<10}")
-                print(f" {'-'*5} + {'-'*10} + {'-'*10}")
-                for t in titles:
-                    print(f" {t['ID']:<5} | {t['Length']:<10} | {t['Size']:<10}")
-                print(f"{'='*40}")
-                print(f"Tracks are filtered for your convenience. Minimum length to display {cfg.min_title_length//60} minutes.\n")
-                print("""You may find that there is one long track either at the first or last index, that is a total time of all titles on the disc.
-                      This is usually an attempt at obfuscation and is difficult to filter out, you should avoid ripping it.""")
-                
-                sel = input("\nEnter selection to rip (e.g. 0,1 or 1-4 or all): ")
-                chosen = parse_selection(sel, valid_ids)
+    utils.console(f"Auto_MKBrake Active. Waiting for discs in {', '.join(cfg.drive_letters)}...")
 
-                # --- Ripping Loop ---
-                if chosen:
-                    for t_index in chosen:
-                        try:
-                            # Retrieve full info for verbose logging
-                            target_title = next(t for t in titles if t['ID'] == t_index)
-                            
-                            # Pass full info to ripper
-                            mkv = disc_ops.rip_title(mkv_bin, cfg.drive_letter, raw_dir, target_title, disc_lbl, log_path)
-                            
-                            # Pass full info to encoder
-                            q.put((mkv, disc_lbl, log_path, target_title))
-                        except Exception as e:
-                            utils.console(f"RIP ERROR on Track {t_index}: {e}")
-                            utils.append_log_line(log_path, f"RIP FAIL Track {t_index}: {e}")
-                    
-                    if cfg.eject_on_completion:
-                        utils.console("Ripping complete. Ejecting...")
-                        disc_ops.eject_disc(cfg.drive_letter)
-                else:
-                    utils.console("Selection skipped.")
-                    disc_ops.eject_disc(cfg.drive_letter)
-
-            except Exception as e:
-                utils.console(f"MAIN LOOP ERROR: {e}")
-                disc_ops.eject_disc(cfg.drive_letter)
-                time.sleep(5)
-
-            while disc_ops.is_disc_present(cfg.drive_letter): time.sleep(2)
+    try:
+        # Drive pipelines run on their own threads; the main thread only waits for Ctrl+C
+        while True:
+            time.sleep(1)
 
     except KeyboardInterrupt:
         utils.console("Stopping...")
@@ -118,4 +79,4 @@ def main():
         for w in workers: w.join()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,211 @@
+# metrics.py
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import cfg
+import utils
+import job_store
+import progress
+
+class Metrics:
+    """
+    Stage timings and live gauges for capacity planning.
+    Spans (scan, select, rip, queue_wait, encode, verify, transfer, delete) are keyed by disc
+    label and title RawID. Each span becomes one record in the rolling JSONL file
+    (cfg.metrics_path), and the per-stage totals are summed up for the Prometheus
+    endpoint (cfg.metrics_port). Gauges are read when they are scraped, and every
+    cfg.metrics_interval_seconds for the JSONL file.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[Tuple[str, bool], List[float]] = {}  # (stage, ok) -> [count, total seconds]
+        self._gauges: Dict[Tuple[str, Tuple], Tuple[str, Callable[[], float]]] = {}
+        self._pending: List[Dict] = []       # Records not yet written to the JSONL file
+        self._writing = False                # Only collect records once the writer runs
+        self._started = False
+
+    # --- Recording ---
+    def record(self, stage: str, seconds: float, label: str, raw_id=None, ok: bool = True, **fields) -> None:
+        record = {
+            "time": datetime.now().isoformat(timespec="milliseconds"), "type": "span",
+            "stage": stage, "label": label, "raw_id": raw_id, "seconds": round(seconds, 3), "ok": ok,
+        }
+        record.update(fields)
+        with self._lock:
+            totals = self._stages.setdefault((stage, ok), [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            if self._writing:
+                self._pending.append(record)
+
+    @contextmanager
+    def span(self, stage: str, label: str, raw_id=None, **fields) -> Iterator[Dict]:
+        """
+        Times the with-block as one stage of one title. The yielded dict takes extra
+        fields (e.g. bytes) and ok=False for failures that don't raise; an exception
+        marks the span as failed and is re-raised.
+        """
+        started = time.monotonic()
+        ok = True
+        try:
+            yield fields
+        except BaseException as e:
+            ok = False
+            fields.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            self.record(stage, time.monotonic() - started, label, raw_id, ok=fields.pop("ok", ok), **fields)
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float], **labels) -> None:
+        """Registers a value read on demand, e.g. gauge("queue_depth", "...", lambda: 3)."""
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = (help_text, read)
+
+    # --- Output ---
+    def read_gauges(self) -> List[Tuple[str, Tuple, str, Optional[float]]]:
+        with self._lock:
+            gauges = list(self._gauges.items())
+        values = []
+        for (name, labels), (help_text, read) in gauges:
+            try: value = float(read())
+            except Exception: value = None   # A gauge must never take the endpoint down
+            values.append((name, labels, help_text, value))
+        return values
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = [
+            "# HELP mkbrake_stage_seconds Wall-clock time spent per pipeline stage.",
+            "# TYPE mkbrake_stage_seconds summary",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+        for (stage, ok), (count, total) in stages:
+            tags = f'stage="{stage}",ok="{str(ok).lower()}"'
+            lines.append(f"mkbrake_stage_seconds_sum{{{tags}}} {total:.3f}")
+            lines.append(f"mkbrake_stage_seconds_count{{{tags}}} {count}")
+
+        described = set()
+        for name, labels, help_text, value in sorted(self.read_gauges(), key=lambda g: g[:2]):
+            if value is None: continue
+            metric = f"mkbrake_{name}"
+            if metric not in described:
+                described.add(metric)
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            tags = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+            lines.append(f"{metric}{{{tags}}} {value:g}" if tags else f"{metric} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def start(self) -> None:
+        """Starts the endpoint (cfg.metrics_port > 0) and the JSONL writer (cfg.metrics_path set)."""
+        if self._started: return
+        self._started = True
+        if cfg.metrics_port > 0:
+            registry = self
+
+            class Handler(_MetricsHandler):
+                def render(self) -> str:
+                    return registry.prometheus()
+
+            try:
+                server = ThreadingHTTPServer((cfg.metrics_bind, cfg.metrics_port), Handler)
+            except OSError as e:
+                utils.console(f"WARNING: Metrics endpoint not started on {cfg.metrics_bind}:{cfg.metrics_port}: {e}")
+            else:
+                server.daemon_threads = True
+                threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+                utils.console(f"Metrics: http://{cfg.metrics_bind}:{cfg.metrics_port}/metrics")
+        if cfg.metrics_path is not None:
+            self._writing = True
+            threading.Thread(target=self._write_loop, daemon=True, name="metrics-jsonl").start()
+
+    # --- Rolling JSONL file ---
+    def _write_loop(self) -> None:
+        while True:
+            time.sleep(max(1, cfg.metrics_interval_seconds))
+            self.flush()
+
+    def flush(self, gauges: bool = True) -> None:
+        """Writes pending spans (and a gauge snapshot) to cfg.metrics_path, rotating it when full."""
+        path = cfg.metrics_path
+        if path is None: return
+        with self._lock:
+            records, self._pending = self._pending, []
+        if gauges:
+            values = {_gauge_key(name, labels): value for name, labels, _, value in self.read_gauges()}
+            if values:
+                records.append({"time": datetime.now().isoformat(timespec="milliseconds"),
+                                "type": "gauges", "values": values})
+        if not records: return
+        try:
+            utils.ensure_directory(path.parent)
+            _rotate(path)
+            with open(path, "a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, default=str) + "\n")
+        except OSError as e:
+            utils.console(f"WARNING: Could not write metrics to {path}: {e}")
+
+def _rotate(path: Path) -> None:
+    """metrics.jsonl -> metrics.jsonl.1 -> ... once it reaches cfg.metrics_max_bytes."""
+    try:
+        if path.stat().st_size < cfg.metrics_max_bytes: return
+    except OSError:
+        return
+    if cfg.metrics_backups <= 0:
+        path.unlink(); return
+    for i in range(cfg.metrics_backups - 1, 0, -1):
+        older = path.with_name(f"{path.name}.{i}")
+        if older.exists(): older.replace(path.with_name(f"{path.name}.{i + 1}"))
+    path.replace(path.with_name(f"{path.name}.1"))
+
+def _gauge_key(name: str, labels: Tuple) -> str:
+    return name + "".join(f".{v}" for _, v in labels)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404); return
+        data = self.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Scraped every few seconds
+
+# --- Standard gauges ---
+def watch_scheduler(scheduler) -> None:
+    """Queue depth, active encodes, raw bytes waiting for encoding and total encode fps."""
+    store = scheduler.store
+    registry.gauge("queue_depth", "Jobs waiting for an encoder.",
+                   lambda: sum(1 for j in store.waiting() if j.state == job_store.QUEUED))
+    registry.gauge("active_encodes", "Jobs being encoded (local workers and farm agents).",
+                   lambda: len(store.jobs((job_store.ENCODING,))))
+    registry.gauge("raw_pending_bytes", "Raw MKV bytes not yet encoded and deleted.",
+                   lambda: sum(scheduler.raw_bytes(j) for j in store.jobs(store.raw_pending_states)))
+    registry.gauge("transferring", "Encodes verified in scratch and waiting for (or in) the archive copy.",
+                   lambda: len(store.jobs((job_store.TRANSFERRING,))))
+    registry.gauge("encode_fps", "Sum of the fps of all running HandBrake processes.", progress.total_fps)
+    for lane in scheduler.lanes:
+        registry.gauge("lane_active", "Running encodes per encoder lane.", lambda l=lane: l.active, lane=lane.codec)
+        registry.gauge("lane_limit", "Current concurrency limit per encoder lane.", lambda l=lane: l.limit, lane=lane.codec)
+
+def title_key(job) -> Dict:
+    """Span key fields (label, raw_id) of an encode job; raw_id is None for backlog files."""
+    return {"label": job.label, "raw_id": (job.title_info or {}).get("RawID")}
+
+# Process-wide instance
+registry = Metrics()
@@ -0,0 +1,106 @@
+# mp4_verify.py
+import mmap
+import struct
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from config import cfg
+
+# Containers we descend into on the way to the track handlers
+_CONTAINERS = {b"moov", b"trak", b"mdia"}
+
+@dataclass
+class Mp4Info:
+    duration: float = 0.0                               # seconds, from mvhd
+    handlers: List[str] = field(default_factory=list)   # one per trak: 'vide', 'soun', 'sbtl', ...
+
+    @property
+    def video_tracks(self) -> int:
+        return self.handlers.count("vide")
+
+    @property
+    def audio_tracks(self) -> int:
+        return self.handlers.count("soun")
+
+def _boxes(buf, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """Yields (type, payload_start, box_end) for each box in buf[start:end]. Only headers are read."""
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", buf, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end: return
+            size = struct.unpack_from(">Q", buf, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end: return
+        yield box_type, offset + header, offset + size
+        offset += size
+
+def _parse_mvhd(buf, start: int) -> float:
+    version = buf[start]
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", buf, start + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", buf, start + 12)
+    return duration / timescale if timescale else 0.0
+
+def _walk(buf, start: int, end: int, info: Mp4Info) -> None:
+    for box_type, payload, box_end in _boxes(buf, start, end):
+        if box_type == b"mvhd":
+            info.duration = _parse_mvhd(buf, payload)
+        elif box_type == b"hdlr" and payload + 12 <= box_end:
+            # version/flags (4) + pre_defined (4) + handler_type (4)
+            info.handlers.append(bytes(buf[payload + 8:payload + 12]).decode("latin-1"))
+        elif box_type in _CONTAINERS:
+            _walk(buf, payload, box_end, info)
+
+def read_mp4_info(path: Path) -> Optional[Mp4Info]:
+    """
+    Reads duration and track handlers from an MP4's moov box via mmap.
+    Only the box headers and the moov metadata are touched, never the media
+    data, so this costs a few page reads even on a network share.
+    Returns None if the file is not a readable MP4.
+    """
+    try:
+        with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            for box_type, payload, box_end in _boxes(buf, 0, len(buf)):
+                if box_type == b"moov":
+                    info = Mp4Info()
+                    _walk(buf, payload, box_end, info)
+                    return info
+    except (OSError, ValueError, struct.error):
+        return None
+    return None
+
+def verify_output(path: Path, expected_seconds: Optional[float] = None,
+                  expected_audio: Optional[int] = None) -> Optional[str]:
+    """
+    Checks that an encode is complete enough to delete its source.
+    expected_audio is the number of audio tracks the encode was asked for (None = unknown).
+    Returns None if it passes, or a short reason if it doesn't.
+    """
+    try:
+        if path.stat().st_size <= 1024:
+            return "output is empty"
+    except OSError:
+        return "output is missing"
+
+    info = read_mp4_info(path)
+    if info is None:
+        return "no moov box (truncated or not an MP4)"
+    if info.video_tracks < 1:
+        return "no video track"
+    if cfg.verify_require_audio and info.audio_tracks < 1:
+        return "no audio track"
+    if expected_audio is not None and info.audio_tracks != expected_audio:
+        return f"{info.audio_tracks} audio track(s), expected {expected_audio}"
+    if info.duration <= 0:
+        return "zero duration"
+    if expected_seconds:
+        tolerance = max(cfg.verify_min_tolerance_seconds, expected_seconds * cfg.verify_tolerance_ratio)
+        if abs(info.duration - expected_seconds) > tolerance:
+            return f"duration {info.duration:.1f}s, expected {expected_seconds}s"
+    return None
@@ -0,0 +1,193 @@
+# placement.py
+import ctypes
+import ctypes.util
+import os
+import platform
+import sys
+import threading
+from typing import Dict, List, Optional, Set
+
+from config import cfg
+import utils
+
+try:
+    import psutil  # Optional: priority/affinity changes of running processes on Windows
+except ImportError:
+    psutil = None
+
+# Roles passed to utils.run_stream_log
+RIP = "rip"
+ENCODE = "encode"
+
+# ioprio_set(2)
+_IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+_CAP_SYS_NICE = 23
+_SYS_IOPRIO_SET = {"x86_64": 251, "amd64": 251, "i386": 289, "i686": 289, "aarch64": 30, "arm64": 30, "armv7l": 314}
+
+class ProcessPlacement:
+    """
+    Applies nice, ionice and CPU affinity to child processes by role.
+    Rips get cfg.rip_nice / rip_ionice_*. Encodes get cfg.encode_nice / encode_ionice_*
+    and the CPU set of their lane (cfg.lane_cpu_affinity). With cfg.boost_idle_encoders,
+    running encodes go back to normal priority whenever no rip is active and are
+    demoted again the moment one starts.
+    Settings are per thread on Linux, so every thread of a running process is updated.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rips: Set[int] = set()
+        self._encoders: Dict[int, Optional[str]] = {}    # pid -> encoder lane
+        self._warned: Set[str] = set()
+        self._boost = cfg.boost_idle_encoders
+        self._ioprio_nr = _SYS_IOPRIO_SET.get(platform.machine().lower())
+        self._libc = None
+        if sys.platform.startswith("linux") and self._ioprio_nr:
+            try: self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            except OSError: pass
+
+    # --- Called by utils.run_stream_log ---
+    def started(self, pid: int, role: Optional[str], lane: Optional[str] = None) -> None:
+        with self._lock:
+            if role == RIP:
+                self._rips.add(pid)
+                self._apply(pid, cfg.rip_nice, cfg.rip_ionice_class, cfg.rip_ionice_level)
+                if len(self._rips) == 1 and self._boost:
+                    for encoder in self._encoders: self._place_encoder(encoder, boosted=False)
+            elif role == ENCODE:
+                self._encoders[pid] = lane
+                cpus = cfg.lane_cpu_affinity.get(lane or "")
+                if cpus: self._set_affinity(pid, cpus)
+                self._place_encoder(pid, boosted=self._boosted())
+
+    def finished(self, pid: int) -> None:
+        with self._lock:
+            self._encoders.pop(pid, None)
+            if pid in self._rips:
+                self._rips.discard(pid)
+                if not self._rips and self._boost:
+                    for encoder in self._encoders: self._place_encoder(encoder, boosted=True)
+
+    def check_boost(self) -> bool:
+        """
+        Turns cfg.boost_idle_encoders off (with a warning) where a demoted encode could never be
+        raised again: raising a nice value needs CAP_SYS_NICE or an RLIMIT_NICE allowance on
+        Linux, psutil on Windows. Call once at startup. Returns whether boosting is on.
+        """
+        with self._lock:
+            if not self._boost: return False
+            problem = _boost_problem()
+            if problem:
+                self._boost = False
+                utils.console(f"WARNING: boost_idle_encoders is off: {problem}. Encodes stay at background priority.")
+            return self._boost
+
+    def encoder_pids(self) -> List[int]:
+        with self._lock:
+            return list(self._encoders)
+
+    def status(self) -> str:
+        with self._lock:
+            mode = "boosted" if self._boosted() and self._encoders else "background"
+            return f"{len(self._rips)} rip(s), {len(self._encoders)} encode(s) [{mode}]"
+
+    # --- Internals (called with the lock held) ---
+    def _boosted(self) -> bool:
+        return self._boost and not self._rips
+
+    def _place_encoder(self, pid: int, boosted: bool) -> None:
+        if boosted:
+            # "Normal" means whatever this process itself runs at
+            self._apply(pid, _own_nice(), "best-effort", 4, windows_low=False)
+        else:
+            self._apply(pid, cfg.encode_nice, cfg.encode_ionice_class, cfg.encode_ionice_level, windows_low=True)
+
+    def _apply(self, pid: int, nice: Optional[int], io_class: str, io_level: int, windows_low: bool = False) -> None:
+        if sys.platform == "win32":
+            # Encodes start BELOW_NORMAL via creation flags; psutil lets us change that later
+            if psutil is None: return
+            try:
+                psutil.Process(pid).nice(psutil.BELOW_NORMAL_PRIORITY_CLASS if windows_low else psutil.NORMAL_PRIORITY_CLASS)
+            except (psutil.Error, OSError):
+                pass
+            return
+
+        for tid in _threads(pid):
+            if nice is not None:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, tid, nice)
+                except PermissionError:
+                    self._warn("nice", f"Cannot set nice {nice} (lowering it needs CAP_SYS_NICE or a "
+                                       "RLIMIT_NICE allowance); CPU priority stays as it is.")
+                except OSError:
+                    pass
+            if io_class:
+                self._set_ionice(tid, io_class, io_level)
+
+    def _set_ionice(self, tid: int, io_class: str, level: int) -> None:
+        if self._libc is None or io_class not in _IOPRIO_CLASSES: return
+        value = (_IOPRIO_CLASSES[io_class] << _IOPRIO_CLASS_SHIFT) | (0 if io_class == "idle" else max(0, min(7, level)))
+        if self._libc.syscall(self._ioprio_nr, _IOPRIO_WHO_PROCESS, tid, value) != 0:
+            err = ctypes.get_errno()
+            if err in (1, 13):  # EPERM / EACCES
+                self._warn("ionice", f"Cannot set I/O class {io_class} ({os.strerror(err)}).")
+
+    def _set_affinity(self, pid: int, cpus: List[int]) -> None:
+        try:
+            if hasattr(os, "sched_setaffinity"):
+                for tid in _threads(pid): os.sched_setaffinity(tid, cpus)
+            elif psutil is not None:
+                psutil.Process(pid).cpu_affinity(list(cpus))
+        except ProcessLookupError:
+            pass
+        except (OSError, ValueError) as e:
+            self._warn("affinity", f"Cannot set CPU affinity {cpus}: {e}")
+        except Exception:
+            pass
+
+    def _warn(self, kind: str, message: str) -> None:
+        if kind in self._warned: return
+        self._warned.add(kind)
+        utils.console(f"WARNING: {message}")
+
+def _threads(pid: int) -> List[int]:
+    """All thread ids of a process (Linux), or just the pid elsewhere."""
+    try:
+        return [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except (OSError, ValueError):
+        return [pid]
+
+def _boost_problem() -> Optional[str]:
+    """Why encodes demoted during a rip could not be raised back to our priority, or None."""
+    if sys.platform == "win32":
+        return None if psutil is not None else "changing the priority of running encodes needs psutil"
+    own = _own_nice()
+    if cfg.encode_nice is None or own is None or cfg.encode_nice <= own: return None
+    if hasattr(os, "geteuid") and os.geteuid() == 0: return None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("CapEff:") and int(line.split()[1], 16) & (1 << _CAP_SYS_NICE):
+                    return None
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        soft = resource.getrlimit(resource.RLIMIT_NICE)[0]
+        # RLIMIT_NICE n allows nice values down to 20 - n
+        if soft == resource.RLIM_INFINITY or 20 - soft <= own: return None
+    except (ImportError, AttributeError, OSError, ValueError):
+        pass
+    return (f"raising encodes from nice {cfg.encode_nice} back to {own} needs CAP_SYS_NICE or a nice "
+            f"allowance (ulimit -e / LimitNICE=)")
+
+def _own_nice() -> Optional[int]:
+    try:
+        return os.getpriority(os.PRIO_PROCESS, 0)
+    except (AttributeError, OSError):
+        return None
+
+# Process-wide instance used by utils.run_stream_log
+manager = ProcessPlacement()
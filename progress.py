@@ -0,0 +1,197 @@
+# progress.py
+import re
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import cfg
+import utils
+
+# "Encoding: task 1 of 1, 45.67 % (123.45 fps, avg 120.11 fps, ETA 00h12m34s)"
+# The bracketed part is missing for the first second or so of every encode.
+_HB_PROGRESS_RE = re.compile(
+    r"Encoding: task (\d+) of (\d+), (\d+(?:\.\d+)?) %"
+    r"(?: \((\d+(?:\.\d+)?) fps, avg (\d+(?:\.\d+)?) fps, ETA (\d+)h(\d+)m(\d+)s\))?"
+)
+
+class EncodeProgress:
+    """
+    Live state of one HandBrakeCLI run, fed line by line from its stdout.
+    A run counts as stalled once it has gone cfg.encode_stall_seconds without
+    a non-zero fps reading or a rise in percent complete.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.task = 1
+        self.task_count = 1
+        self.percent = 0.0
+        self.fps = 0.0
+        self.avg_fps = 0.0
+        self.eta_seconds: Optional[int] = None
+        self.started = time.monotonic()
+        self.last_advance = self.started
+        self.stalled = False
+
+    def feed(self, line: str) -> None:
+        match = _HB_PROGRESS_RE.search(line)
+        if not match: return
+        task, count, percent = int(match.group(1)), int(match.group(2)), float(match.group(3))
+        now = time.monotonic()
+
+        if (task, percent) > (self.task, self.percent):
+            self.last_advance = now
+        self.task, self.task_count, self.percent = task, count, percent
+
+        if match.group(4) is not None:
+            self.fps = float(match.group(4))
+            self.avg_fps = float(match.group(5))
+            self.eta_seconds = int(match.group(6))*3600 + int(match.group(7))*60 + int(match.group(8))
+            if self.fps > 0:
+                self.last_advance = now
+
+    def is_stalled(self) -> bool:
+        """Watchdog for utils.run_stream_log: True kills the encode."""
+        if cfg.encode_stall_seconds <= 0: return False
+        if time.monotonic() - self.last_advance > cfg.encode_stall_seconds:
+            self.stalled = True
+        return self.stalled
+
+    def summary(self) -> str:
+        eta = time.strftime("%H:%M:%S", time.gmtime(self.eta_seconds)) if self.eta_seconds is not None else "--:--:--"
+        task = f" task {self.task}/{self.task_count}" if self.task_count > 1 else ""
+        return f"{self.name}{task} {self.percent:5.1f}% {self.fps:6.1f} fps ETA {eta}"
+
+# MakeMKV robot mode (-r --progress=-same): "PRGV:current,total,max" and
+# 'MSG:code,flags,count,"text",...'. Read errors are reported as MSG lines like
+# "Error 'Scsi error - MEDIUM ERROR:L-EC UNCORRECTABLE ERROR' occurred while reading ...".
+_MKV_PRGV_RE = re.compile(r"^PRGV:(\d+),(\d+),(\d+)")
+_MKV_READ_ERROR_RE = re.compile(r"occurred while reading|medium error|uncorrectable|read error", re.IGNORECASE)
+
+class RipProgress:
+    """
+    Live read telemetry of one makemkvcon rip, fed line by line from its robot-mode
+    output. Bytes read are estimated from the overall progress (PRGV) and the scanned
+    title size. The rip is aborted when, over the last cfg.rip_monitor_window_seconds,
+    throughput stays below cfg.rip_min_mbps or read errors come faster than
+    cfg.rip_max_errors_per_minute, or once cfg.rip_max_read_errors errors were seen.
+    """
+
+    def __init__(self, name: str, expected_bytes: int):
+        self.name = name
+        self.expected_bytes = expected_bytes
+        self.fraction = 0.0
+        self.read_errors = 0
+        self.started = time.monotonic()
+        self.abort_reason: Optional[str] = None
+        self._samples: Deque[Tuple[float, int]] = deque([(self.started, 0)])
+        self._errors: Deque[float] = deque()
+        self._lock = threading.Lock()   # feed() runs on the output reader thread
+
+    @property
+    def bytes_read(self) -> int:
+        return int(self.expected_bytes * self.fraction)
+
+    def feed(self, line: str) -> None:
+        now = time.monotonic()
+        match = _MKV_PRGV_RE.match(line)
+        with self._lock:
+            if match:
+                total, maximum = int(match.group(2)), int(match.group(3))
+                if maximum > 0:
+                    self.fraction = max(self.fraction, min(1.0, total / maximum))
+                    self._samples.append((now, self.bytes_read))
+            elif line.startswith("MSG:") and _MKV_READ_ERROR_RE.search(line):
+                self.read_errors += 1
+                self._errors.append(now)
+            self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        # Keep one sample at or before the window start, so the window rate spans the full window
+        start = now - cfg.rip_monitor_window_seconds
+        while len(self._samples) > 1 and self._samples[1][0] <= start:
+            self._samples.popleft()
+        while self._errors and self._errors[0] < start:
+            self._errors.popleft()
+
+    def rate(self, seconds: float) -> float:
+        """Bytes/s over (roughly) the last `seconds`. No progress lines at all counts as 0."""
+        with self._lock:
+            now = time.monotonic()
+            base = self._samples[0]
+            for sample in self._samples:
+                if sample[0] > now - seconds: break
+                base = sample
+            elapsed = now - base[0]
+            return (self.bytes_read - base[1]) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def current_rate(self) -> float:
+        return self.rate(10)
+
+    @property
+    def average_rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.bytes_read / elapsed if elapsed > 0 else 0.0
+
+    def should_abort(self) -> bool:
+        """Watchdog for utils.run_stream_log: True kills the rip (the reason is kept in abort_reason)."""
+        if self.abort_reason: return True
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            recent_errors = len(self._errors)
+        window = cfg.rip_monitor_window_seconds
+
+        if cfg.rip_max_read_errors > 0 and self.read_errors >= cfg.rip_max_read_errors:
+            self.abort_reason = f"{self.read_errors} read errors"
+        elif now - self.started >= window > 0:
+            # Only judged once a full window has passed, so MakeMKV's initial analysis isn't "slow"
+            per_minute = recent_errors * 60 / window
+            mbps = self.rate(window) / 1024**2
+            if cfg.rip_max_errors_per_minute > 0 and per_minute > cfg.rip_max_errors_per_minute:
+                self.abort_reason = f"{per_minute:.1f} read errors/min over the last {window}s"
+            elif cfg.rip_min_mbps > 0 and self.fraction < 1.0 and mbps < cfg.rip_min_mbps:
+                self.abort_reason = f"read speed {mbps:.2f} MB/s over the last {window}s (minimum {cfg.rip_min_mbps})"
+        return self.abort_reason is not None
+
+    def summary(self) -> str:
+        return (f"{self.name} {self.fraction * 100:5.1f}% {self.current_rate / 1024**2:5.1f} MB/s "
+                f"(avg {self.average_rate / 1024**2:.1f}), {self.read_errors} read error(s)")
+
+# --- Registry of running encodes (read by the console reporter and the scheduler) ---
+_ACTIVE: Dict[str, EncodeProgress] = {}
+_ACTIVE_LOCK = threading.Lock()
+
+def register(key: str, progress: EncodeProgress) -> None:
+    with _ACTIVE_LOCK:
+        _ACTIVE[key] = progress
+
+def unregister(key: str) -> None:
+    with _ACTIVE_LOCK:
+        _ACTIVE.pop(key, None)
+
+def snapshot() -> List[EncodeProgress]:
+    with _ACTIVE_LOCK:
+        return list(_ACTIVE.values())
+
+def for_job(job_id: int) -> List[EncodeProgress]:
+    """Runs belonging to one job: the whole encode, its chunks ('id.N') or tuning samples."""
+    prefix = f"{job_id}."
+    with _ACTIVE_LOCK:
+        return [p for k, p in _ACTIVE.items() if k == str(job_id) or k.startswith(prefix)]
+
+def total_fps() -> float:
+    return sum(p.fps for p in snapshot())
+
+def _report_loop() -> None:
+    while True:
+        time.sleep(cfg.progress_report_seconds)
+        for p in snapshot():
+            utils.console(f"Progress: {p.summary()}")
+
+def start_reporter() -> None:
+    """Prints a progress line per running encode every cfg.progress_report_seconds."""
+    if cfg.progress_report_seconds > 0:
+        threading.Thread(target=_report_loop, daemon=True).start()
@@ -1,15 +1,60 @@
 # process_raw_backlog.py
-import queue
+import argparse
 import time
 from pathlib import Path
+from typing import Optional
 from datetime import datetime
 
 # Import from your existing project files
 from config import cfg
 import utils
-from encoding import EncodeWorker
+import progress
+import metrics
+import fingerprint
+import job_store
+from backlog import BacklogIndex, watch
+from encoding import EncodeWorker, resolve_ffmpeg, output_path
+from farm import FarmCoordinator, listen
+from tuner import PresetTuner
+from transfer import TransferStage
+from job_store import JobStore
+from scheduler import EncodeScheduler, configured_lanes, is_gpu_encoder
+
+def queue_raw_file(job_queue, mkv_path: Path, disc_label: str, index: Optional[BacklogIndex] = None) -> bool:
+    """
+    Queues one raw MKV. False if the job store already tracks it or its content was encoded before.
+    Skipped duplicates are recorded in index, so later scans don't sample them again.
+    """
+    # Create a specific log file for this batch run
+    log_path = mkv_path.parent / f"batch_encode_{datetime.now().strftime('%Y%m%d')}.log"
+
+    # Same content already archived (e.g. a second rip of the disc): skip or link instead of encoding
+    if not job_queue.store.is_active(mkv_path):
+        existing = fingerprint.find_file(job_queue.store, mkv_path)
+        if existing is not None:
+            target = output_path(job_store.Job(0, mkv_path, disc_label, log_path, None, job_store.QUEUED),
+                                 cfg.encoded_directory)
+            if cfg.duplicate_action == "link" and target != existing and fingerprint.link_output(existing, target, log_path):
+                utils.console(f"Linked: {disc_label} / {mkv_path.name} -> {existing}")
+            else:
+                utils.console(f"Skipping: {disc_label} / {mkv_path.name} (encoded before as {existing})")
+                if index is not None: index.mark_skipped(mkv_path, existing)
+            utils.log_event(log_path, "ENC DUPLICATE", mkv_path.name, input=mkv_path, existing=existing,
+                            action=cfg.duplicate_action)
+            return False
+
+    # The job store ignores files it already tracks
+    if job_queue.put((mkv_path, disc_label, log_path)) is None:
+        return False
+    utils.console(f"Queuing: {disc_label} / {mkv_path.name}")
+    return True
 
 def main():
+    parser = argparse.ArgumentParser(description="Batch-encode raw MKVs that have no encoded MP4 yet.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and queue new raw files as they land in the raw directory.")
+    opts = parser.parse_args()
+
     # 1. Verify Binaries
     try:
         hb_bin = utils.resolve_binary(cfg.handbrake_path, "HandBrakeCLI")
@@ -18,56 +63,66 @@ def main():
         return
 
     # 2. Check if GPU is actually enabled (Safety check based on your issue)
-    if "nvenc" not in cfg.video_codec and "vce" not in cfg.video_codec:
-        print(f"\nWARNING: video_codec is set to '{cfg.video_codec}'.")
+    if not any(is_gpu_encoder(codec) for codec in configured_lanes()):
+        print(f"\nWARNING: encoder lanes are {list(configured_lanes())}.")
         print("This will use the CPU. If you want GPU, check config.py now.")
         print("Waiting 5 seconds before starting...\n")
         time.sleep(5)
 
     # 3. Setup Workers
-    job_queue = queue.Queue()
-    workers = [EncodeWorker(job_queue, hb_bin) for _ in range(cfg.encoder_worker_threads)]
+    try:
+        fingerprint.duplicate_action()
+        # Bind the farm port now: a bad farm setting stops here, before any worker starts
+        farm_server = listen() if cfg.farm_coordinator else None
+    except (ValueError, RuntimeError, OSError) as e:
+        utils.console(f"Setup Error: {e}")
+        return
+    store = JobStore(cfg.job_database, cleanup_verified=not cfg.keep_raw_files)
+    if store.resumed:
+        utils.console(f"Resuming {store.resumed} unfinished encode job(s) from {cfg.job_database}")
+    job_queue = EncodeScheduler(store)
+    ffmpeg_bin = resolve_ffmpeg()
+    tuner = PresetTuner(hb_bin) if cfg.auto_tune else None
+    transfers = TransferStage(job_queue)
+    workers = [EncodeWorker(job_queue, hb_bin, ffmpeg_bin, tuner, transfers) for _ in range(job_queue.worker_count)]
     for w in workers: 
         w.start()
+    progress.start_reporter()
+    if farm_server is not None:
+        FarmCoordinator(job_queue).start(farm_server)
+    metrics.watch_scheduler(job_queue)
+    metrics.registry.start()
 
     utils.console(f"Scanning {cfg.raw_directory} for un-encoded files...")
 
     # 4. Scan Raw Directory
     # Structure is usually: Raw / DiscLabel / title_t00.mkv
-    found_jobs = 0
-    
     if not cfg.raw_directory.exists():
         utils.console(f"Error: Raw directory not found at {cfg.raw_directory}")
         return
 
-    # Walk through all subfolders in Raw
-    for disc_folder in cfg.raw_directory.iterdir():
-        if disc_folder.is_dir():
-            disc_label = disc_folder.name
-            
-            # Find all MKVs in this folder
-            for mkv_path in disc_folder.glob("*.mkv"):
-                # Check if the encoded file already exists
-                encoded_folder = cfg.encoded_directory / disc_label
-                expected_mp4 = encoded_folder / (mkv_path.stem + ".mp4")
+    # The index only re-lists folders that changed since the last run
+    index = BacklogIndex(cfg.backlog_index_path)
+    found_jobs = 0
+    for mkv_path, disc_label in index.pending():
+        if queue_raw_file(job_queue, mkv_path, disc_label, index):
+            found_jobs += 1
+    index.save()
 
-                if expected_mp4.exists():
-                    # Skip it if it's already done
-                    continue
-                
-                # It's missing! Queue it up.
-                found_jobs += 1
-                
-                # Create a specific log file for this batch run
-                log_path = disc_folder / f"batch_encode_{datetime.now().strftime('%Y%m%d')}.log"
-                
-                utils.console(f"Queuing: {disc_label} / {mkv_path.name}")
-                job_queue.put((mkv_path, disc_label, log_path))
+    if opts.watch:
+        utils.console(f"Queued {found_jobs} new + {store.resumed} resumed files. Watching {cfg.raw_directory} for new rips...")
+        try:
+            watch(index, lambda mkv_path, disc_label: queue_raw_file(job_queue, mkv_path, disc_label, index))
+        except KeyboardInterrupt:
+            utils.console("Stopping...")
+            for _ in workers: job_queue.put(None)
+            for w in workers: w.join()
+        return
 
-    if found_jobs == 0:
+    if found_jobs == 0 and not store.resumed:
         utils.console("No pending raw files found. Everything looks encoded!")
     else:
-        utils.console(f"Queued {found_jobs} files. Processing...")
+        utils.console(f"Queued {found_jobs} new + {store.resumed} resumed files. Processing...")
         
         # Wait for queue to empty
         job_queue.join()
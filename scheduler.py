@@ -0,0 +1,295 @@
+# scheduler.py
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from config import cfg
+import utils
+import disc_ops
+import job_store
+import placement
+import progress
+from job_store import Job, JobStore
+
+try:
+    import psutil  # Optional: only used for CPU load on Windows
+except ImportError:
+    psutil = None
+
+# Fallback cost for jobs without scan info (reprocess.py): ~24 Mbit/s Blu-ray average
+_ASSUMED_BYTES_PER_SECOND = 3_000_000
+_GPU_PREFIXES = ("nvenc_", "vce_", "qsv_", "vt_", "mf_")
+
+def is_gpu_encoder(codec: str) -> bool:
+    return codec.startswith(_GPU_PREFIXES)
+
+# --- Host CPU use ---
+def host_cpu_times() -> Optional[Tuple[float, float]]:
+    """(busy, total) CPU seconds of the host since boot, summed over all cores, or None if unknown."""
+    try:
+        with open("/proc/stat") as f:
+            values = [int(v) for v in f.readline().split()[1:]]
+        ticks = os.sysconf("SC_CLK_TCK")
+        idle = values[3] + (values[4] if len(values) > 4 else 0)   # idle + iowait
+        total = sum(values[:8])                                     # guest time is already in user
+        return (total - idle) / ticks, total / ticks
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if psutil is not None:
+        t = psutil.cpu_times()
+        total = sum(t)
+        return total - t.idle - getattr(t, "iowait", 0.0), total
+    return None
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """User + system CPU seconds a process has used, or None if it is gone."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")   # utime, stime
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if psutil is not None:
+        try:
+            t = psutil.Process(pid).cpu_times()
+            return t.user + t.system
+        except (psutil.Error, OSError):
+            pass
+    return None
+
+class ForeignLoad:
+    """
+    CPU use of everything except our own encode processes, as a 0..1 fraction of all
+    cores, between two sample() calls. Busy encoders are what the CPU lanes are for,
+    so only this remainder (a game, a backup, other services) should shrink them.
+    """
+
+    def __init__(self):
+        self._host: Optional[Tuple[float, float]] = None
+        self._encoders: Dict[int, float] = {}    # pid -> CPU seconds at the last sample
+
+    def sample(self) -> Optional[float]:
+        host = host_cpu_times()
+        if host is None: return None
+        current = {}
+        for pid in placement.manager.encoder_pids():
+            seconds = process_cpu_seconds(pid)
+            if seconds is not None: current[pid] = seconds
+        # An encode that ended since the last sample loses its final interval (counted as
+        # foreign); cfg.load_high_samples keeps that one reading from shrinking a lane
+        encoder_seconds = sum(seconds - self._encoders.get(pid, 0.0) for pid, seconds in current.items())
+        previous, self._host, self._encoders = self._host, host, current
+        if previous is None: return None
+        busy, total = host[0] - previous[0], host[1] - previous[1]
+        if total <= 0: return None
+        return max(0.0, busy - encoder_seconds) / total
+
+@dataclass
+class Lane:
+    codec: str
+    max_slots: int
+    limit: int
+    active: int = 0
+
+    @property
+    def adaptive(self) -> bool:
+        # GPU lanes are hard session limits. Only CPU lanes follow host load.
+        return not is_gpu_encoder(self.codec)
+
+def configured_lanes() -> Dict[str, int]:
+    return dict(cfg.encoder_lanes) or {cfg.video_codec: cfg.encoder_worker_threads}
+
+class EncodeScheduler:
+    """
+    Sits between the job producers (main.py / reprocess.py) and the EncodeWorkers.
+    Jobs are ordered by estimated length (cfg.job_order) and each one is handed
+    out together with an encoder lane that still has a free slot. CPU lanes grow
+    or shrink with the CPU use of other programs; GPU lanes keep their fixed limits.
+    Exposes the same put/get/task_done/join calls as the JobStore.
+    """
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self.lanes: List[Lane] = [
+            Lane(codec, slots, slots) for codec, slots in configured_lanes().items() if slots > 0
+        ]
+        self._cond = threading.Condition()
+        self._stop_requests = 0
+        self._costs: Dict[int, float] = {}
+        self._raw_sizes: Dict[int, int] = {}
+        # Set by the admission controller while raw disk space is tight
+        self.space_pressure = False
+
+        if cfg.adaptive_concurrency and any(l.adaptive for l in self.lanes):
+            threading.Thread(target=self._monitor_load, daemon=True).start()
+
+    @property
+    def worker_count(self) -> int:
+        """One worker thread per lane slot."""
+        return sum(l.max_slots for l in self.lanes)
+
+    # --- Queue-compatible interface ---
+    def put(self, job: Optional[tuple]) -> Optional[int]:
+        with self._cond:
+            if job is None:
+                self._stop_requests += 1
+            else:
+                job_id = self.store.put(job)
+            self._cond.notify_all()
+            return None if job is None else job_id
+
+    def get(self) -> Optional[Job]:
+        with self._cond:
+            while True:
+                if self._stop_requests:
+                    self._stop_requests -= 1
+                    return None
+                job = self._next_job()
+                if job:
+                    return job
+                # Woken by put/task_done; the timeout also catches jobs added by other processes
+                self._cond.wait(timeout=5)
+
+    def task_done(self, job: Optional[Job] = None) -> None:
+        with self._cond:
+            if job is not None and job.encoder:
+                # Farm jobs run on the agent's own lanes
+                lane = self._lane(job.encoder) if job.agent is None else None
+                if lane: lane.active -= 1
+                self._costs.pop(job.id, None)
+                self._raw_sizes.pop(job.id, None)
+            self.store.task_done(job)
+            self._cond.notify_all()
+
+    def join(self) -> None:
+        self.store.join()
+
+    def reserve_slots(self, codec: str, wanted: int) -> int:
+        """
+        Takes up to wanted more free slots of a lane for a job that runs several encoder
+        processes (chunked encoding). Returns how many it got, possibly 0; never blocks.
+        """
+        with self._cond:
+            lane = self._lane(codec)
+            if lane is None: return 0
+            count = max(0, min(wanted, lane.limit - lane.active))
+            lane.active += count
+            return count
+
+    def release_slots(self, codec: str, count: int) -> None:
+        if count <= 0: return
+        with self._cond:
+            lane = self._lane(codec)
+            if lane: lane.active -= count
+            self._cond.notify_all()
+
+    def set_state(self, job: Job, state: str, error: Optional[str] = None) -> None:
+        self.store.set_state(job, state, error)
+        with self._cond:
+            self._cond.notify_all()
+
+    def is_cancelled(self, job: Optional[Job]) -> bool:
+        # Local jobs are never revoked (farm agents lose theirs when a lease expires)
+        return False
+
+    def lease(self, agent: str, encoder: str) -> Optional[Job]:
+        """Non-blocking get for a remote farm agent: the next queued job, in the usual order."""
+        with self._cond:
+            queued = [j for j in self.store.waiting() if j.state == job_store.QUEUED]
+            if not queued: return None
+            job = self.store.claim(self.order(queued)[0])
+            job.encoder, job.agent = encoder, agent
+            return job
+
+    # --- Scheduling ---
+    def _lane(self, codec: str) -> Optional[Lane]:
+        return next((l for l in self.lanes if l.codec == codec), None)
+
+    def _free_lane(self) -> Optional[Lane]:
+        # Lanes are tried in configuration order, so list the preferred encoder first
+        return next((l for l in self.lanes if l.active < l.limit), None)
+
+    def job_cost(self, job: Job) -> float:
+        """Estimated title length in seconds, used for ordering."""
+        if job.id in self._costs: return self._costs[job.id]
+        info = job.title_info or {}
+        cost = float(info.get("Seconds") or 0)
+        if not cost:
+            size = disc_ops.parse_size(info.get("Size", ""))
+            if not size:
+                try: size = job.input_path.stat().st_size
+                except OSError: size = 0
+            cost = size / _ASSUMED_BYTES_PER_SECOND
+        self._costs[job.id] = cost
+        return cost
+
+    def raw_bytes(self, job: Job) -> int:
+        if job.id not in self._raw_sizes:
+            try: self._raw_sizes[job.id] = job.input_path.stat().st_size
+            except OSError: self._raw_sizes[job.id] = 0
+        return self._raw_sizes[job.id]
+
+    def order(self, jobs: List[Job]) -> List[Job]:
+        # Low raw space: the jobs that free the most space once encoded go first
+        if self.space_pressure:
+            return sorted(jobs, key=self.raw_bytes, reverse=True)
+        if cfg.job_order == "shortest":
+            return sorted(jobs, key=self.job_cost)
+        if cfg.job_order == "longest":
+            return sorted(jobs, key=self.job_cost, reverse=True)
+        return jobs
+
+    def _next_job(self) -> Optional[Job]:
+        waiting = self.store.waiting()
+        if not waiting: return None
+
+        # Cleanup-only jobs don't run an encoder, so they never wait for a lane
+        cleanup = [j for j in waiting if j.state == job_store.VERIFIED]
+        if cleanup:
+            return self.store.claim(cleanup[0])
+
+        lane = self._free_lane()
+        if lane is None: return None
+        job = self.store.claim(self.order(waiting)[0])
+        job.encoder = lane.codec
+        lane.active += 1
+        return job
+
+    def _monitor_load(self) -> None:
+        sampler = ForeignLoad()
+        sampler.sample()
+        high = 0
+        while True:
+            time.sleep(cfg.load_sample_seconds)
+            load = sampler.sample()
+            if load is None: continue
+            high = high + 1 if load > cfg.foreign_cpu_load else 0
+            self.adjust_lanes(load, high)
+            if high >= cfg.load_high_samples: high = 0   # The next step down needs a new run of readings
+
+    def adjust_lanes(self, load: float, high_samples: int) -> None:
+        """
+        One step of adaptive concurrency from the foreign (non-encoder) CPU load: shrink after
+        cfg.load_high_samples readings in a row above cfg.foreign_cpu_load, grow once it is
+        clearly below it again (idle margin), so a single spike doesn't move the lanes.
+        """
+        with self._cond:
+            for lane in self.lanes:
+                if not lane.adaptive: continue
+                if high_samples >= cfg.load_high_samples and lane.limit > 1:
+                    lane.limit -= 1
+                    utils.console(f"Scheduler: other programs use {load:.0%} CPU, {lane.codec} lane down to {lane.limit}")
+                elif load < cfg.foreign_cpu_load - 0.10 and lane.limit < lane.max_slots:
+                    lane.limit += 1
+                    utils.console(f"Scheduler: other programs use {load:.0%} CPU, {lane.codec} lane up to {lane.limit}")
+            self._cond.notify_all()
+
+    def status(self) -> str:
+        lanes = ", ".join(f"{l.codec} {l.active}/{l.limit}" for l in self.lanes)
+        return f"{lanes} | {progress.total_fps():.0f} fps total"
+
+    def running(self) -> List[progress.EncodeProgress]:
+        """Live progress (percent, fps, ETA) of every running encode."""
+        return progress.snapshot()
@@ -0,0 +1,224 @@
+# streams.py
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import cfg
+import utils
+
+# SINFO attribute codes (MakeMKV apdefs.h)
+_SINFO_FIELDS = {
+    1: "type", 2: "name", 3: "lang", 4: "lang_name", 5: "codec_id",
+    6: "codec", 14: "channels", 19: "video_size", 21: "frame_rate", 22: "flags",
+}
+# ap_iaType message codes, so the (localised) type text doesn't matter
+_STREAM_TYPES = {6201: "Video", 6202: "Audio", 6203: "Subtitles"}
+
+# ap_iaStreamFlags bits
+_FLAG_COMMENTARY = 0x1 | 0x2     # Director's / alternate director's comments
+_FLAG_DERIVED = 0x800            # Core of a TrueHD/DTS-HD track that MakeMKV lists as its own stream
+
+# HandBrake passthrough encoder per Matroska codec id
+_COPY_ENCODERS = {
+    "A_AC3": "copy:ac3", "A_EAC3": "copy:eac3", "A_DTS": "copy:dts", "A_TRUEHD": "copy:truehd",
+    "A_AAC": "copy:aac", "A_FLAC": "copy:flac", "A_MPEG/L3": "copy:mp3",
+}
+
+# HandBrake mixdowns from smallest to largest; a track is never mixed up beyond its own channels
+_MIXDOWNS = ["mono", "stereo", "dpl2", "5point1", "6point1", "7point1"]
+
+# --- Stream table ---
+def parse_sinfo(scan_output: str) -> Dict[int, List[Dict]]:
+    """Stream tables of all titles (RawID -> streams in index order) from robot-mode SINFO lines."""
+    fields: Dict[int, Dict[int, Dict[str, str]]] = {}   # title -> stream index -> fields
+    type_codes: Dict[tuple, int] = {}
+    for line in scan_output.splitlines():
+        if not line.startswith("SINFO:"): continue
+        # SINFO:title,stream,attribute,code,"value"
+        parts = line.split(',', 4)
+        if len(parts) < 5: continue
+        try:
+            title, index = int(parts[0].split(':')[1]), int(parts[1])
+            attr, code = int(parts[2]), int(parts[3])
+        except ValueError: continue
+        if attr == 1: type_codes[(title, index)] = code
+        if attr in _SINFO_FIELDS:
+            fields.setdefault(title, {}).setdefault(index, {})[_SINFO_FIELDS[attr]] = parts[4].strip('"')
+    return {
+        title: [build_stream(i, f, type_codes.get((title, i))) for i, f in sorted(per_title.items())]
+        for title, per_title in fields.items()
+    }
+
+def build_stream(index: int, fields: Dict[str, str], type_code: Optional[int]) -> Dict:
+    """One SINFO stream as a dict: Index, Type, Codec, CodecId, Language, Channels, Flags, Name, VideoSize, FrameRate."""
+    def number(key: str) -> int:
+        value = fields.get(key, "")
+        return int(value) if value.isdigit() else 0
+
+    return {
+        "Index": index,
+        "Type": _STREAM_TYPES.get(type_code) or fields.get("type", ""),
+        "Codec": fields.get("codec", ""),
+        "CodecId": fields.get("codec_id", ""),
+        "Language": fields.get("lang", "").lower(),
+        "Channels": number("channels"),
+        "Flags": number("flags"),
+        "Name": fields.get("name", "") or fields.get("video_size", ""),
+        "VideoSize": fields.get("video_size", ""),      # e.g. '1920x1080'
+        "FrameRate": fields.get("frame_rate", ""),      # e.g. '23.976 (24000/1001)'
+    }
+
+def is_commentary(stream: Dict) -> bool:
+    return bool(stream["Flags"] & _FLAG_COMMENTARY)
+
+def is_derived(stream: Dict) -> bool:
+    return bool(stream["Flags"] & _FLAG_DERIVED)
+
+def describe(stream: Dict) -> str:
+    """Short text for logs and the selection table, e.g. 'eng TrueHD 8ch'."""
+    parts = [stream["Language"] or "und", stream["Codec"] or stream["CodecId"]]
+    if stream["Channels"]: parts.append(f"{stream['Channels']}ch")
+    if is_commentary(stream): parts.append("commentary")
+    if is_derived(stream): parts.append("core")
+    return " ".join(p for p in parts if p)
+
+def audio_summary(title: Dict) -> str:
+    """'eng, fra (+1 commentary)' style summary of a title's audio languages."""
+    audio = [s for s in title.get("Streams", []) if s["Type"] == "Audio" and not is_derived(s)]
+    langs = list(dict.fromkeys(s["Language"] or "und" for s in audio if not is_commentary(s)))
+    extra = sum(1 for s in audio if is_commentary(s))
+    return ", ".join(langs) + (f" (+{extra} commentary)" if extra else "")
+
+# --- Rip selection (MakeMKV) ---
+def _wanted_audio(stream: Dict, languages: List[str]) -> bool:
+    if is_commentary(stream) and not cfg.keep_commentary: return False
+    if is_derived(stream) and not cfg.rip_core_audio: return False
+    return not languages or (stream["Language"] or "und") in languages
+
+def rip_plan(title: Dict) -> Dict:
+    """
+    Decides which streams of a title to rip: {'selection': MakeMKV selection string,
+    'streams': kept SINFO indexes}. Audio is limited to cfg.audio_languages (all
+    languages if the title has none of them), subtitles to cfg.subtitle_languages (None = all).
+    The selection string uses MakeMKV's own conditions, and 'streams' mirrors it
+    so the encoder knows the track order in the ripped file.
+    """
+    all_streams = title.get("Streams", [])
+    audio = [s for s in all_streams if s["Type"] == "Audio"]
+    languages = [l.lower() for l in cfg.audio_languages]
+    if languages and not any(_wanted_audio(s, languages) for s in audio):
+        languages = []   # e.g. a foreign film: keep its own language(s) rather than no audio at all
+    subtitle_languages = None if cfg.subtitle_languages is None else [l.lower() for l in cfg.subtitle_languages]
+
+    rules = ["-sel:all", "+sel:video", "-sel:mvcvideo"]
+    lang_rule = "|".join(l if l != "und" else "nolang" for l in languages)
+    rules.append(f"+sel:audio&({lang_rule})" if lang_rule else "+sel:audio")
+    if not cfg.keep_commentary: rules.append("-sel:audio&special")
+    if not cfg.rip_core_audio: rules.append("-sel:audio&core")
+    if subtitle_languages is None:
+        rules.append("+sel:subtitle")
+    elif subtitle_languages:
+        sub_rule = "|".join(l if l != "und" else "nolang" for l in subtitle_languages)
+        rules.append(f"+sel:subtitle&({sub_rule})")
+
+    kept = []
+    for s in all_streams:
+        if s["Type"] == "Video":
+            keep = "MVC" not in s["CodecId"].upper()
+        elif s["Type"] == "Audio":
+            keep = _wanted_audio(s, languages)
+        elif s["Type"] == "Subtitles":
+            keep = subtitle_languages is None or (s["Language"] or "und") in subtitle_languages
+        else:
+            keep = False
+        if keep: kept.append(s["Index"])
+    return {"selection": ",".join(rules), "streams": kept}
+
+# Based on MakeMKV's default.mmcp.xml, with the selection string replaced
+_PROFILE_TEMPLATE = """<?xml version="1.0" encoding="utf-8"?>
+<profile>
+    <name lang="eng">Auto_MKBrake</name>
+    <mkvSettings ignoreForcedSubtitlesFlag="true" useISO639Type2T="false"
+        setFirstSubtitleTrackAsDefault="false" setFirstForcedSubtitleTrackAsDefault="true"
+        setFirstAudioTrackAsDefault="true" />
+    <profileSettings app_DefaultSelectionString="{selection}" />
+    <outputSettings name="copy" outputFormat="directCopy">
+        <description lang="eng">Copy track as is</description>
+    </outputSettings>
+    <trackSettings input="default">
+        <output outputSettingsName="copy" defaultSelection="$app_DefaultSelectionString" />
+    </trackSettings>
+</profile>
+"""
+
+def profile_path(selection: str) -> Path:
+    """A MakeMKV conversion profile (--profile) for a selection string, written once and reused."""
+    name = hashlib.sha1(selection.encode("utf-8")).hexdigest()[:12]
+    path = cfg.raw_directory / ".profiles" / f"{name}.mmcp.xml"
+    if not path.exists():
+        utils.ensure_directory(path.parent)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(_PROFILE_TEMPLATE.format(selection=selection.replace("&", "&amp;")), encoding="utf-8")
+        tmp.replace(path)
+    return path
+
+# --- Encode selection (HandBrake) ---
+def ripped_audio(title_info: Optional[Dict]) -> Optional[List[Dict]]:
+    """Audio streams in the raw file, in track order, or None when the rip didn't record them."""
+    if not title_info or "RippedStreams" not in title_info or "Streams" not in title_info: return None
+    kept = set(title_info["RippedStreams"])
+    return [s for s in title_info["Streams"] if s["Type"] == "Audio" and s["Index"] in kept]
+
+def _mixdown(channels: int) -> str:
+    own = "mono" if channels == 1 else "stereo" if channels == 2 else "5point1" if channels <= 6 else "7point1"
+    cap = cfg.audio_mixdown if cfg.audio_mixdown in _MIXDOWNS else "7point1"
+    return own if _MIXDOWNS.index(own) <= _MIXDOWNS.index(cap) else cap
+
+def _codec_rank(stream: Dict) -> int:
+    preference = [c.lower() for c in cfg.audio_codec_preference]
+    codec = stream["Codec"].lower()
+    return preference.index(codec) if codec in preference else len(preference)
+
+def audio_tracks(title_info: Optional[Dict]) -> Optional[List[Dict]]:
+    """
+    The audio tracks to encode: per language in cfg.audio_languages order, the best
+    cfg.audio_tracks_per_language tracks (most channels, then cfg.audio_codec_preference).
+    Each is {'track': HandBrake track number, 'stream', 'encoder', 'mixdown'}.
+    None = no stream data (backlog files), which keeps the legacy --all-audio behaviour.
+    """
+    audio = ripped_audio(title_info)
+    if not audio: return None
+
+    by_language: Dict[str, List[int]] = {}
+    for position, s in enumerate(audio):
+        by_language.setdefault(s["Language"] or "und", []).append(position)
+    # None of the preferred languages ripped (see rip_plan): every language, in disc order
+    order = [l.lower() for l in cfg.audio_languages if l.lower() in by_language] or list(by_language)
+
+    tracks = []
+    for lang in order:
+        ranked = sorted(by_language[lang], key=lambda p: (-audio[p]["Channels"], _codec_rank(audio[p]), p))
+        for position in ranked[:max(1, cfg.audio_tracks_per_language)]:
+            s = audio[position]
+            copy = _COPY_ENCODERS.get(s["CodecId"])
+            passthrough = copy is not None and copy in cfg.audio_passthrough
+            tracks.append({
+                "track": position + 1, "stream": s,
+                "encoder": copy if passthrough else cfg.audio_codec,
+                "mixdown": None if passthrough else _mixdown(s["Channels"] or 2),
+            })
+    return tracks
+
+def audio_args(title_info: Optional[Dict]) -> List[str]:
+    """HandBrakeCLI audio options: explicit per-track lists, or the legacy all-audio settings."""
+    tracks = audio_tracks(title_info)
+    if not tracks:
+        return ["--all-audio", "--mixdown", cfg.audio_mixdown, "--aencoder", cfg.audio_codec, "--aq", cfg.audio_quality]
+    return [
+        "--audio", ",".join(str(t["track"]) for t in tracks),
+        "--aencoder", ",".join(t["encoder"] for t in tracks),
+        # Passthrough tracks ignore mixdown/quality, but the lists must stay aligned
+        "--mixdown", ",".join(t["mixdown"] or "none" for t in tracks),
+        "--aq", ",".join(cfg.audio_quality for _ in tracks),
+        "--aname", ",".join(describe(t["stream"]).replace(",", " ") for t in tracks),
+    ]
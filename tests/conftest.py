@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import cfg
+
+@pytest.fixture
+def tmp_cfg(tmp_path, monkeypatch):
+    """cfg with every directory and database under tmp_path; restored after the test."""
+    for name, value in {
+        "raw_directory": tmp_path / "raw",
+        "encoded_directory": tmp_path / "encoded",
+        "job_database": tmp_path / "jobs.db",
+        "scratch_directory": None,
+        "metrics_path": None,
+        "metrics_port": 0,
+    }.items():
+        monkeypatch.setattr(cfg, name, value)
+    return cfg
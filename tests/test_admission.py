@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+import job_store
+import utils
+from admission import AdmissionController
+from job_store import JobStore
+from scheduler import EncodeScheduler
+
+_GB = 1024**3
+
+@pytest.fixture
+def space(tmp_cfg, monkeypatch):
+    monkeypatch.setattr(tmp_cfg, "raw_min_free_gb", 10)
+    monkeypatch.setattr(tmp_cfg, "rip_size_margin", 0.0)
+    monkeypatch.setattr(tmp_cfg, "admission_policy", "pause")
+    monkeypatch.setattr(AdmissionController, "free_bytes", lambda self: 30 * _GB)
+    messages = []
+    monkeypatch.setattr(utils, "console", messages.append)
+    return messages
+
+def _controller(tmp_cfg, cleanup_verified=True):
+    store = JobStore(tmp_cfg.job_database, cleanup_verified=cleanup_verified)
+    return AdmissionController(EncodeScheduler(store)), store
+
+def _verified_raw(store, tmp_path):
+    raw = tmp_path / "raw" / "DISC" / "title_t00.mkv"
+    raw.parent.mkdir(parents=True)
+    raw.write_bytes(b"x" * 1024)
+    store.put((raw, "DISC", tmp_path / "log.txt"))
+    job = store.get()
+    store.set_state(job, job_store.VERIFIED)
+    store.task_done(job)
+
+def _admit_in_thread(controller, tmp_path, size="25 GB"):
+    result = []
+    t = threading.Thread(target=lambda: result.append(
+        controller.admit("d:0", {"Size": size, "TitleName": "t00"}, tmp_path / "log.txt")), daemon=True)
+    t.start()
+    t.join(timeout=5)
+    return result
+
+def test_kept_raw_files_of_verified_jobs_are_not_pending(space, tmp_cfg, tmp_path):
+    controller, store = _controller(tmp_cfg, cleanup_verified=False)   # keep_raw_files
+    _verified_raw(store, tmp_path)
+
+    assert controller.snapshot().pending_bytes == 0
+    # Refused instead of pausing forever for a delete that never happens
+    assert _admit_in_thread(controller, tmp_path) == [False]
+
+def test_verified_raw_files_are_pending_when_cleanup_is_on(space, tmp_cfg, tmp_path):
+    controller, store = _controller(tmp_cfg)
+    _verified_raw(store, tmp_path)
+    assert controller.snapshot().pending_bytes == 1024
+
+def test_pressure_does_not_flip_between_admit_and_snapshot(space, tmp_cfg, tmp_path):
+    controller, _ = _controller(tmp_cfg)
+    # 30 GB free, 15 GB rip, 10 GB floor: fits, but leaves less than twice the floor
+    assert _admit_in_thread(controller, tmp_path, "15 GB") == [True]
+    controller.snapshot()
+    controller.snapshot()
+    assert controller.scheduler.space_pressure
+    assert [m for m in space if m.startswith("Raw space")] == [
+        "Raw space is tight: encoding largest raw files first."
+    ]
+
+    controller.release("d:0")
+    controller.snapshot()
+    assert not controller.scheduler.space_pressure
@@ -0,0 +1,59 @@
+import sys
+import threading
+import time
+
+import pytest
+
+import backlog
+from backlog import BacklogIndex
+
+@pytest.fixture
+def watched(tmp_cfg, tmp_path, monkeypatch):
+    monkeypatch.setattr(tmp_cfg, "watch_poll_seconds", 0.3)
+    tmp_cfg.raw_directory.mkdir()
+    return BacklogIndex(tmp_path / "backlog.json")
+
+def _start(target, index):
+    reported = []
+    threading.Thread(target=target, args=(index, lambda path, label: reported.append(path)), daemon=True).start()
+    time.sleep(0.5)
+    return reported
+
+def _write_slowly(path, seconds, keep_open=False):
+    """Appends to path for a while (as MakeMKV does) without changing its folder's mtime."""
+    f = path.open("ab")
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        f.write(b"x" * 4096); f.flush()
+        time.sleep(0.05)
+    if keep_open: return f
+    f.close()
+
+def _wait_for(reported, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not reported and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+def test_polling_waits_for_a_growing_file(watched, tmp_cfg):
+    folder = tmp_cfg.raw_directory / "DISC"
+    folder.mkdir()
+    mkv = folder / "title_t00.mkv"
+    mkv.write_bytes(b"")
+    reported = _start(backlog._watch_polling, watched)
+
+    _write_slowly(mkv, 1.5)
+    assert reported == []
+    _wait_for(reported)
+    assert reported == [mkv]
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify")
+def test_new_folder_files_wait_until_closed(watched, tmp_cfg):
+    reported = _start(backlog._watch_inotify, watched)
+    folder = tmp_cfg.raw_directory / "DISC"
+    folder.mkdir()
+    mkv = folder / "title_t00.mkv"
+    f = _write_slowly(mkv, 1.5, keep_open=True)
+    assert reported == []
+    f.close()
+    _wait_for(reported)
+    assert reported == [mkv]
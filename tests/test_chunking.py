@@ -0,0 +1,50 @@
+import threading
+import time
+
+import utils
+from encoding import EncodeWorker
+from job_store import JobStore
+from scheduler import EncodeScheduler
+
+def _scheduler(tmp_cfg, monkeypatch, slots):
+    monkeypatch.setattr(tmp_cfg, "encoder_lanes", {"x265": slots})
+    monkeypatch.setattr(tmp_cfg, "adaptive_concurrency", False)
+    return EncodeScheduler(JobStore(tmp_cfg.job_database))
+
+def _claim(scheduler, tmp_path, seconds=7200):
+    raw = tmp_path / "raw" / "DISC" / "title_t00.mkv"
+    raw.parent.mkdir(parents=True)
+    raw.write_bytes(b"x")
+    scheduler.put((raw, "DISC", tmp_path / "log.txt", {"ID": 0, "Seconds": seconds}))
+    return scheduler.get()
+
+def test_reserve_slots_takes_only_free_lane_slots(tmp_cfg, tmp_path, monkeypatch):
+    scheduler = _scheduler(tmp_cfg, monkeypatch, 3)
+    _claim(scheduler, tmp_path)
+    assert scheduler.reserve_slots("x265", 5) == 2
+    assert scheduler.reserve_slots("x265", 1) == 0
+    scheduler.release_slots("x265", 2)
+    assert scheduler.lanes[0].active == 1
+
+def test_chunks_run_no_wider_than_the_lane(tmp_cfg, tmp_path, monkeypatch):
+    scheduler = _scheduler(tmp_cfg, monkeypatch, 2)
+    monkeypatch.setattr(tmp_cfg, "chunk_count", 4)
+    monkeypatch.setattr(utils, "run_stream_log", lambda *args, **kwargs: 0)   # ffmpeg stitching
+    job = _claim(scheduler, tmp_path)
+
+    running, peak, lock = 0, 0, threading.Lock()
+    def run_handbrake(args, log_path, key, name):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock: running -= 1
+        return 0
+
+    worker = EncodeWorker(scheduler, "HandBrakeCLI", "ffmpeg")
+    worker.job = job
+    monkeypatch.setattr(worker, "run_handbrake", run_handbrake)
+    assert worker.encode_chunked(job, tmp_path / "out.mp4", job.encoder, {"preset": "slow", "quality": "20"}) == 0
+    assert peak == 2
+    assert scheduler.lanes[0].active == 1
@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import encoding
+import job_store
+from job_store import JobStore
+
+def _verified_job(store: JobStore, tmp_path: Path):
+    raw = tmp_path / "raw" / "DISC" / "title_t00.mkv"
+    raw.parent.mkdir(parents=True)
+    raw.write_bytes(b"mkv")
+    store.put((raw, "DISC", tmp_path / "log.txt"))
+    job = store.get()
+    store.set_state(job, job_store.VERIFIED)
+    return job
+
+def _locked(self, *args, **kwargs):
+    raise PermissionError("file is in use")
+
+def test_failed_delete_is_parked_not_reclaimed(tmp_cfg, tmp_path, monkeypatch):
+    store = JobStore(tmp_cfg.job_database)
+    job = _verified_job(store, tmp_path)
+
+    calls = []
+    def locked(self, *args, **kwargs):
+        calls.append(self)
+        _locked(self)
+    monkeypatch.setattr(Path, "unlink", locked)
+
+    encoding.cleanup_raw(store, job)
+    store.task_done(job)
+
+    assert len(calls) == 1
+    assert job.state == job_store.RAW_DELETE_FAILED
+    assert store.waiting() == []
+    store.join()  # Returns: nothing left to do this run
+
+def test_failed_delete_retried_on_next_start(tmp_cfg, tmp_path, monkeypatch):
+    store = JobStore(tmp_cfg.job_database)
+    job = _verified_job(store, tmp_path)
+    with monkeypatch.context() as m:
+        m.setattr(Path, "unlink", _locked)
+        encoding.cleanup_raw(store, job)
+    store.task_done(job)
+    store.close()
+
+    store = JobStore(tmp_cfg.job_database)
+    waiting = store.waiting()
+    assert [j.state for j in waiting] == [job_store.VERIFIED]
+    retry = store.get()
+    encoding.cleanup_raw(store, retry)
+    assert retry.state == job_store.RAW_DELETED
+    assert not retry.input_path.exists()
+
+def test_failed_delete_kept_when_raw_files_are_kept(tmp_cfg, tmp_path, monkeypatch):
+    store = JobStore(tmp_cfg.job_database)
+    job = _verified_job(store, tmp_path)
+    monkeypatch.setattr(Path, "unlink", _locked)
+    encoding.cleanup_raw(store, job)
+    store.close()
+
+    # keep_raw_files: no cleanup work, so the parked job stays parked
+    store = JobStore(tmp_cfg.job_database, cleanup_verified=False)
+    assert store.jobs((job_store.RAW_DELETE_FAILED,))[0].id == job.id
@@ -0,0 +1,84 @@
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import drives
+import utils
+from admission import AdmissionController
+from drive_pipeline import DrivePipeline
+from job_store import JobStore
+from scheduler import EncodeScheduler
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the makemkvcon stub is a shell launcher")
+
+_STUB = Path(__file__).resolve().parent.parent / "bench" / "fake_makemkvcon.py"
+
+@pytest.fixture
+def rig(tmp_cfg, tmp_path, monkeypatch):
+    """A pipeline on a fake drive, ripping with the benchmark's makemkvcon stub."""
+    launcher = tmp_path / "makemkvcon"
+    launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{_STUB}" "$@"\n', encoding="utf-8")
+    launcher.chmod(0o755)
+    monkeypatch.setenv("BENCH_TITLES", json.dumps([1500, 1560]))
+    monkeypatch.setenv("BENCH_SCAN_SECONDS", "0")
+    monkeypatch.setenv("BENCH_RIP_SPEEDUP", "1000000")
+    monkeypatch.setattr(tmp_cfg, "selection_mode", "auto")
+    monkeypatch.setattr(tmp_cfg, "default_title_rule", "all")
+    monkeypatch.setattr(tmp_cfg, "drive_label_wait_seconds", 0.2)
+    monkeypatch.setattr(tmp_cfg, "progress_report_seconds", 0)
+    monkeypatch.setattr(AdmissionController, "free_bytes", lambda self: 1024**4)
+    monkeypatch.setattr(utils, "console", lambda message: None)
+
+    fake = drives.FakeDriveBackend()
+    monkeypatch.setattr(drives, "_backend", drives._backend)   # restored after the test
+    drives.use(fake)
+    store = JobStore(tmp_cfg.job_database)
+    scheduler = EncodeScheduler(store)
+    admission = AdmissionController(scheduler)
+    for drive in ("fake0", "fake1"):
+        DrivePipeline(drive, str(launcher), scheduler, admission).start()
+    return fake, store
+
+def _wait(condition, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+def test_inserted_disc_is_ripped_queued_and_ejected(rig, tmp_cfg):
+    fake, store = rig
+    fake.insert("fake0", "SHOW_S1_D1")
+    _wait(lambda: fake.ejects.get("fake0"))
+
+    jobs = store.jobs()
+    assert sorted(j.input_path.name for j in jobs) == ["title_t00.mkv", "title_t01.mkv"]
+    assert {j.label for j in jobs} == {"SHOW_S1_D1"}
+    assert all(j.input_path.parent == tmp_cfg.raw_directory / "SHOW_S1_D1" for j in jobs)
+
+def test_disc_without_label_gets_a_folder_of_its_own(rig, tmp_cfg):
+    fake, store = rig
+    fake.insert("fake0", "")
+    _wait(lambda: fake.ejects.get("fake0"))
+
+    jobs = store.jobs()
+    assert len(jobs) == 2
+    label = jobs[0].label
+    assert label.startswith("DISC_")
+    assert all(j.input_path.parent == tmp_cfg.raw_directory / label for j in jobs)
+    assert not list(tmp_cfg.raw_directory.glob("*.mkv"))
+
+def test_same_label_in_two_drives_rips_into_separate_folders(rig, tmp_cfg, monkeypatch):
+    fake, store = rig
+    monkeypatch.setenv("BENCH_RIP_SPEEDUP", "3000")   # Both rips overlap
+    fake.insert("fake0", "DVD_VIDEO")
+    fake.insert("fake1", "DVD_VIDEO")
+    _wait(lambda: fake.ejects.get("fake0") and fake.ejects.get("fake1"))
+
+    jobs = store.jobs()
+    assert len(jobs) == 4
+    assert len({j.input_path for j in jobs}) == 4
+    assert {j.label for j in jobs} in ({"DVD_VIDEO", "DVD_VIDEO_fake1"}, {"DVD_VIDEO", "DVD_VIDEO_fake0"})
+    assert all(j.input_path.parent.name == j.label for j in jobs)
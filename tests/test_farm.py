@@ -0,0 +1,68 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import farm
+from farm import FarmCoordinator, is_loopback
+from job_store import JobStore
+from scheduler import EncodeScheduler
+
+def test_loopback_addresses():
+    assert is_loopback("127.0.0.1")
+    assert is_loopback("localhost")
+    assert not is_loopback("0.0.0.0")
+    assert not is_loopback("")
+
+def test_network_coordinator_needs_a_token(tmp_cfg, monkeypatch):
+    monkeypatch.setattr(tmp_cfg, "farm_bind", "0.0.0.0")
+    monkeypatch.setattr(tmp_cfg, "farm_token", "")
+    with pytest.raises(RuntimeError, match="farm_token"):
+        farm.listen()
+
+def test_port_in_use_is_an_os_error(tmp_cfg, monkeypatch):
+    monkeypatch.setattr(tmp_cfg, "farm_bind", "127.0.0.1")
+    monkeypatch.setattr(tmp_cfg, "farm_port", 0)
+    first = farm.listen()
+    try:
+        monkeypatch.setattr(tmp_cfg, "farm_port", first.server_address[1])
+        with pytest.raises(OSError):
+            farm.listen()
+    finally:
+        first.server_close()
+
+@pytest.fixture
+def coordinator(tmp_cfg, tmp_path, monkeypatch):
+    monkeypatch.setattr(tmp_cfg, "farm_bind", "127.0.0.1")
+    monkeypatch.setattr(tmp_cfg, "farm_port", 0)
+    monkeypatch.setattr(tmp_cfg, "farm_token", "")
+    monkeypatch.setattr(farm.utils, "console", lambda message: None)
+    scheduler = EncodeScheduler(JobStore(tmp_cfg.job_database))
+    raw = tmp_path / "raw" / "DISC" / "title_t00.mkv"
+    raw.parent.mkdir(parents=True)
+    raw.write_bytes(b"x")
+    scheduler.put((raw, "DISC", tmp_path / "log.txt"))
+    server = farm.listen()
+    FarmCoordinator(scheduler).start(server)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def _post(url, path, body):
+    request = urllib.request.Request(url + path, data=json.dumps(body).encode("utf-8"), method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            data = response.read()
+            return response.status, json.loads(data) if data else None
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+def test_bad_requests_get_a_400(coordinator):
+    assert _post(coordinator, "/heartbeat", ["not", "an", "object"])[0] == 400
+    status, reply = _post(coordinator, "/lease", {"agent": "a", "encoder": "x265"})
+    assert status == 200
+    lease = reply["lease"]
+    assert _post(coordinator, "/heartbeat", {"lease": lease, "percent": "ten"})[0] == 400
+    assert _post(coordinator, "/heartbeat", {"lease": lease, "fps": [1]})[0] == 400
+    assert _post(coordinator, "/heartbeat", {"lease": lease, "percent": 10, "fps": 24.5, "eta": 60})[0] == 200
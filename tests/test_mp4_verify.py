@@ -0,0 +1,61 @@
+import struct
+
+import pytest
+
+import mp4_verify
+
+def _box(kind, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+def _mvhd(seconds, timescale=1000):
+    # version 0: version/flags, creation, modification, timescale, duration, then the rest of the box
+    return _box(b"mvhd", struct.pack(">IIIII", 0, 0, 0, timescale, int(seconds * timescale)) + bytes(80))
+
+def _trak(handler):
+    hdlr = _box(b"hdlr", struct.pack(">II4s", 0, 0, handler) + bytes(12))
+    return _box(b"trak", _box(b"mdia", hdlr))
+
+def _mp4(path, seconds=3600, handlers=(b"vide", b"soun"), moov=True, cut=0):
+    """A minimal MP4 (moov after mdat, as HandBrake writes it without --optimize)."""
+    data = _box(b"ftyp", b"isom" + bytes(4)) + _box(b"mdat", bytes(4096))
+    if moov:
+        data += _box(b"moov", _mvhd(seconds) + b"".join(_trak(h) for h in handlers))
+    path.write_bytes(data[:len(data) - cut])
+    return path
+
+@pytest.fixture
+def settings(tmp_cfg, monkeypatch):
+    monkeypatch.setattr(tmp_cfg, "verify_require_audio", True)
+    monkeypatch.setattr(tmp_cfg, "verify_tolerance_ratio", 0.02)
+    monkeypatch.setattr(tmp_cfg, "verify_min_tolerance_seconds", 5)
+    return tmp_cfg
+
+def test_complete_file_passes(settings, tmp_path):
+    path = _mp4(tmp_path / "ok.mp4")
+    info = mp4_verify.read_mp4_info(path)
+    assert info.duration == 3600 and info.video_tracks == 1 and info.audio_tracks == 1
+    assert mp4_verify.verify_output(path, 3600, expected_audio=1) is None
+
+def test_truncated_file_fails(settings, tmp_path):
+    path = _mp4(tmp_path / "cut.mp4", cut=40)
+    assert mp4_verify.read_mp4_info(path) is None
+    assert "moov" in mp4_verify.verify_output(path, 3600)
+
+def test_missing_moov_fails(settings, tmp_path):
+    path = _mp4(tmp_path / "no_moov.mp4", moov=False)
+    assert "moov" in mp4_verify.verify_output(path, 3600)
+
+def test_wrong_duration_fails(settings, tmp_path):
+    path = _mp4(tmp_path / "short.mp4", seconds=1800)
+    assert "duration" in mp4_verify.verify_output(path, 3600)
+    assert mp4_verify.verify_output(path, 1810) is None   # Within verify_min_tolerance_seconds
+
+def test_missing_tracks_fail(settings, tmp_path):
+    assert mp4_verify.verify_output(_mp4(tmp_path / "a.mp4", handlers=(b"soun",)), 3600) == "no video track"
+    assert mp4_verify.verify_output(_mp4(tmp_path / "v.mp4", handlers=(b"vide",)), 3600) == "no audio track"
+
+def test_audio_track_count_must_match_the_plan(settings, tmp_path):
+    path = _mp4(tmp_path / "two.mp4", handlers=(b"vide", b"soun", b"soun"))
+    assert mp4_verify.verify_output(path, 3600, expected_audio=2) is None
+    assert mp4_verify.verify_output(path, 3600, expected_audio=3) == "2 audio track(s), expected 3"
+    assert mp4_verify.verify_output(path, 3600) is None   # Nothing planned (backlog files)
@@ -0,0 +1,64 @@
+import time
+
+import disc_ops
+from disc_ops import mark_overlapping_titles
+
+def _titles(*segment_maps):
+    return [{"RawID": i, "Segments": list(s), "Angle": ""} for i, s in enumerate(segment_maps)]
+
+def _marks(titles):
+    return [(t["DuplicateOf"], t["AggregateOf"]) for t in titles]
+
+def test_play_all_playlist_is_an_aggregate():
+    titles = _titles([1, 2, 3], [1], [2], [3])
+    mark_overlapping_titles(titles)
+    assert _marks(titles) == [(None, [1, 2, 3]), (None, []), (None, []), (None, [])]
+
+def test_seamless_branching_cut_is_not_an_aggregate():
+    # Extended cut, theatrical cut (skips segment 4) and the extra scene on its own
+    titles = _titles([1, 2, 3, 4, 5], [1, 2, 3, 5], [4])
+    mark_overlapping_titles(titles)
+    assert _marks(titles) == [(None, []), (None, []), (None, [])]
+
+def test_parts_must_follow_the_aggregate_order():
+    titles = _titles([1, 2, 3, 4], [3, 4], [1, 2])
+    mark_overlapping_titles(titles)
+    assert titles[0]["AggregateOf"] == [2, 1]
+
+    titles = _titles([1, 2, 3, 4], [4, 3], [1, 2])
+    mark_overlapping_titles(titles)
+    assert titles[0]["AggregateOf"] == []
+
+def test_overlapping_parts_are_not_an_aggregate():
+    titles = _titles([1, 2, 3], [1, 2], [2, 3])
+    mark_overlapping_titles(titles)
+    assert titles[0]["AggregateOf"] == []
+
+def test_duplicates_are_marked():
+    titles = _titles([1, 2], [1, 2], [3])
+    mark_overlapping_titles(titles)
+    assert _marks(titles) == [(None, []), (0, []), (None, [])]
+
+def _obfuscated(clips, trailing_uncovered):
+    """A "play all" title over per-clip playlists plus overlapping two-clip playlists."""
+    covered = list(range(1, clips + 1))
+    play_all = covered + [clips + 1] if trailing_uncovered else covered
+    return _titles(play_all, *([c] for c in covered), *([c, c + 1] for c in covered[:-1]))
+
+def test_large_segment_maps_are_fast():
+    for trailing_uncovered in (True, False):
+        titles = _obfuscated(400, trailing_uncovered)
+        started = time.monotonic()
+        mark_overlapping_titles(titles)
+        assert time.monotonic() - started < 5
+        assert (titles[0]["AggregateOf"] == []) == trailing_uncovered
+
+def test_duplicate_note_uses_the_displayed_id(monkeypatch):
+    monkeypatch.setattr(disc_ops.cfg, "min_title_length", 600)
+    monkeypatch.setattr(disc_ops.cfg, "hide_duplicate_titles", False)
+    lines = []
+    for raw_id, (length, segments) in enumerate([("0:01:00", "9"), ("1:00:00", "1-3"), ("1:00:00", "1-3")]):
+        lines += [f'TINFO:{raw_id},9,0,"{length}"', f'TINFO:{raw_id},26,0,"{segments}"']
+    titles = disc_ops.parse_disc_titles("\n".join(lines), "DISC")
+    assert [(t["RawID"], t["ID"]) for t in titles] == [(1, 0), (2, 1)]
+    assert disc_ops.title_note(titles[1]) == "duplicate of track 0"
@@ -0,0 +1,33 @@
+import io
+import os
+import sys
+
+import pytest
+
+import placement
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="nice/RLIMIT_NICE probe is Linux only")
+
+@pytest.fixture
+def unprivileged(monkeypatch):
+    resource = pytest.importorskip("resource")
+    monkeypatch.setattr(placement.cfg, "boost_idle_encoders", True)
+    monkeypatch.setattr(placement.cfg, "encode_nice", 10)
+    monkeypatch.setattr(placement, "_own_nice", lambda: 0)
+    monkeypatch.setattr(os, "geteuid", lambda: 1000)
+    monkeypatch.setattr(placement, "open", lambda path: io.StringIO("CapEff:\t0000000000000000\n"), raising=False)
+    monkeypatch.setattr(placement.utils, "console", lambda message: None)
+    return resource
+
+def test_boost_is_turned_off_without_a_nice_allowance(unprivileged, monkeypatch):
+    monkeypatch.setattr(unprivileged, "getrlimit", lambda which: (0, 0))
+    manager = placement.ProcessPlacement()
+    assert "CAP_SYS_NICE" in placement._boost_problem()
+    assert manager.check_boost() is False
+    assert not manager._boosted()
+
+def test_boost_stays_on_with_a_nice_allowance(unprivileged, monkeypatch):
+    monkeypatch.setattr(unprivileged, "getrlimit", lambda which: (20, 20))   # Down to nice 0
+    manager = placement.ProcessPlacement()
+    assert manager.check_boost() is True
+    assert manager._boosted()
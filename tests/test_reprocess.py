@@ -0,0 +1,50 @@
+import pytest
+
+import fingerprint
+import reprocess
+import utils
+from backlog import BacklogIndex
+from job_store import JobStore
+from scheduler import EncodeScheduler
+
+@pytest.fixture
+def backlog(tmp_cfg, tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "console", lambda message: None)
+    raw = tmp_cfg.raw_directory / "DISC_B" / "title_t00.mkv"
+    raw.parent.mkdir(parents=True)
+    raw.write_bytes(b"x" * 300_000)
+    archived = tmp_cfg.encoded_directory / "DISC_A" / "title_t00.mp4"
+    archived.parent.mkdir(parents=True)
+    archived.write_bytes(b"mp4")
+    store = JobStore(tmp_cfg.job_database)
+    store.record_fingerprint(fingerprint.FILE, fingerprint.file_key(raw), archived, "DISC_A")
+    return EncodeScheduler(store), BacklogIndex(tmp_path / "backlog.json"), raw
+
+def _count_hashes(monkeypatch):
+    calls = []
+    original = fingerprint.file_key
+    monkeypatch.setattr(fingerprint, "file_key", lambda path: calls.append(path) or original(path))
+    return calls
+
+def test_skipped_duplicate_is_not_hashed_again(backlog, tmp_cfg, monkeypatch):
+    scheduler, index, raw = backlog
+    monkeypatch.setattr(tmp_cfg, "duplicate_action", "skip")
+    calls = _count_hashes(monkeypatch)
+
+    assert index.pending() == [(raw, "DISC_B")]
+    assert reprocess.queue_raw_file(scheduler, raw, "DISC_B", index) is False
+    assert calls == [raw]
+    index.save()
+
+    assert BacklogIndex(index.path).pending() == []
+    index = BacklogIndex(index.path)
+    index.pending()                   # Caches the folder listing
+    raw.write_bytes(b"y" * 300_001)   # A changed file is looked at again
+    assert index.pending() == [(raw, "DISC_B")]
+
+def test_off_does_not_hash(backlog, tmp_cfg, monkeypatch):
+    scheduler, index, raw = backlog
+    monkeypatch.setattr(tmp_cfg, "duplicate_action", "off")
+    calls = _count_hashes(monkeypatch)
+    assert reprocess.queue_raw_file(scheduler, raw, "DISC_B", index) is True
+    assert calls == []
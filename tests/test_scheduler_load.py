@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import placement
+import scheduler
+from config import cfg
+from job_store import JobStore
+from scheduler import EncodeScheduler, ForeignLoad
+
+@pytest.fixture
+def sched(tmp_cfg, monkeypatch):
+    monkeypatch.setattr(cfg, "adaptive_concurrency", False)   # Steps driven by the test
+    monkeypatch.setattr(cfg, "encoder_lanes", {"x265": 4})
+    monkeypatch.setattr(cfg, "foreign_cpu_load", 0.25)
+    monkeypatch.setattr(cfg, "load_high_samples", 3)
+    monkeypatch.setattr(scheduler.utils, "console", lambda msg: None)
+    return EncodeScheduler(JobStore(tmp_cfg.job_database))
+
+def test_single_high_reading_does_not_shrink(sched):
+    sched.adjust_lanes(0.9, high_samples=1)
+    sched.adjust_lanes(0.9, high_samples=2)
+    assert sched.lanes[0].limit == 4
+    sched.adjust_lanes(0.9, high_samples=3)
+    assert sched.lanes[0].limit == 3
+
+def test_grows_back_only_below_the_idle_margin(sched):
+    sched.lanes[0].limit = 2
+    sched.adjust_lanes(0.20, high_samples=0)   # Below the limit, but within the margin
+    assert sched.lanes[0].limit == 2
+    sched.adjust_lanes(0.05, high_samples=0)
+    assert sched.lanes[0].limit == 3
+
+def _fake_cpu(monkeypatch, host, encoders):
+    monkeypatch.setattr(scheduler, "host_cpu_times", lambda: host[0])
+    monkeypatch.setattr(scheduler, "process_cpu_seconds", lambda pid: encoders.get(pid))
+    monkeypatch.setattr(placement.manager, "encoder_pids", lambda: list(encoders))
+
+def test_encoder_cpu_is_not_foreign_load(monkeypatch):
+    host, encoders = [(100.0, 1000.0)], {42: 50.0}
+    _fake_cpu(monkeypatch, host, encoders)
+    sampler = ForeignLoad()
+    assert sampler.sample() is None   # First call only sets the baseline
+
+    # 8 cores x 10 s: the encoder used 75 of the 78 busy seconds
+    host[0] = (178.0, 1080.0)
+    encoders[42] = 125.0
+    assert sampler.sample() == pytest.approx(3 / 80)
+
+    # Other programs busy while the encoder keeps going
+    host[0] = (258.0, 1160.0)
+    encoders[42] = 165.0
+    assert sampler.sample() == pytest.approx(40 / 80)
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="needs /proc")
+def test_process_cpu_seconds_reads_a_busy_child():
+    child = subprocess.Popen([sys.executable, "-c", "import time\nt = time.time()\nwhile time.time() - t < 0.5: pass"])
+    try:
+        time.sleep(0.3)
+        assert scheduler.process_cpu_seconds(child.pid) > 0.05
+        busy, total = scheduler.host_cpu_times()
+        assert 0 < busy < total
+    finally:
+        child.wait()
@@ -0,0 +1,64 @@
+import pytest
+
+import disc_ops
+import streams
+from config import cfg
+
+SCAN = "\n".join([
+    'TINFO:0,9,0,"1:00:00"',
+    'TINFO:0,10,0,"10.0 GB"',
+    'TINFO:0,27,0,"title_t00.mkv"',
+    'SINFO:0,0,1,6201,"Video"',
+    'SINFO:0,0,5,0,"V_MPEG4/ISO/AVC"',
+    'SINFO:0,1,1,6202,"Audio"',
+    'SINFO:0,1,5,0,"A_TRUEHD"',
+    'SINFO:0,1,6,0,"TrueHD"',
+    'SINFO:0,1,3,0,"eng"',
+    'SINFO:0,1,14,0,"8"',
+    'SINFO:0,2,1,6202,"Audio"',
+    'SINFO:0,2,5,0,"A_AC3"',
+    'SINFO:0,2,6,0,"AC3"',
+    'SINFO:0,2,3,0,"fra"',
+    'SINFO:0,2,14,0,"6"',
+    'SINFO:0,3,1,6203,"Subtitles"',
+    'SINFO:0,3,3,0,"fra"',
+])
+
+@pytest.fixture
+def title(tmp_cfg, monkeypatch):
+    monkeypatch.setattr(cfg, "min_title_length", 0)
+    return disc_ops.parse_disc_titles(SCAN, "DISC")[0]
+
+def test_parse_sinfo():
+    table = streams.parse_sinfo(SCAN)
+    assert [(s["Index"], s["Type"], s["Language"]) for s in table[0]] == [
+        (0, "Video", ""), (1, "Audio", "eng"), (2, "Audio", "fra"), (3, "Subtitles", "fra"),
+    ]
+    assert table[0][1]["Channels"] == 8
+
+def test_scan_attaches_streams(title):
+    assert [s["Type"] for s in title["Streams"]] == ["Video", "Audio", "Audio", "Subtitles"]
+
+def test_defaults_rip_everything(title, tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(disc_ops.utils, "run_stream_log", lambda binary, args, *a, **k: calls.append(args) or 1)
+    with pytest.raises(RuntimeError):
+        disc_ops.rip_title("makemkvcon", "D:", tmp_path / "DISC", title, "DISC", tmp_path / "log.txt")
+
+    # No selection profile and no ripped stream list: all streams, legacy audio arguments
+    assert not any(arg.startswith("--profile") for arg in calls[0])
+    assert "RippedStreams" not in title
+    assert streams.audio_args(title)[0] == "--all-audio"
+
+def test_opt_in_keeps_all_languages_and_subtitles_by_default(title):
+    plan = streams.rip_plan(title)
+    assert plan["streams"] == [0, 1, 2, 3]
+    assert "+sel:subtitle" in plan["selection"].split(",")
+
+def test_opt_in_language_filter(title, monkeypatch):
+    monkeypatch.setattr(cfg, "audio_languages", ["eng"])
+    monkeypatch.setattr(cfg, "subtitle_languages", [])
+    plan = streams.rip_plan(title)
+    assert plan["streams"] == [0, 1]
+    title["RippedStreams"] = plan["streams"]
+    assert streams.audio_args(title)[:2] == ["--audio", "1"]
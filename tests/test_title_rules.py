@@ -0,0 +1,12 @@
+import pytest
+
+import title_rules
+
+def test_known_settings_pass(tmp_cfg):
+    title_rules.check_settings()
+
+@pytest.mark.parametrize("name, value", [("selection_mode", "automatic"), ("default_title_rule", "longst")])
+def test_unknown_settings_are_rejected_at_startup(tmp_cfg, monkeypatch, name, value):
+    monkeypatch.setattr(tmp_cfg, name, value)
+    with pytest.raises(ValueError, match=name):
+        title_rules.check_settings()
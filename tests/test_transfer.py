@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+import encoding
+import job_store
+import transfer
+import utils
+from job_store import JobStore
+from scheduler import EncodeScheduler
+
+@pytest.fixture
+def scratch(tmp_cfg, tmp_path, monkeypatch):
+    monkeypatch.setattr(tmp_cfg, "scratch_directory", tmp_path / "scratch")
+    monkeypatch.setattr(tmp_cfg, "transfer_max_attempts", 1)
+    monkeypatch.setattr(tmp_cfg, "transfer_retry_seconds", 0)
+    monkeypatch.setattr(tmp_cfg, "keep_raw_files", False)
+    monkeypatch.setattr(utils, "console", lambda message: None)
+    return tmp_cfg
+
+def _encoded_job(scheduler, tmp_path):
+    raw = tmp_path / "raw" / "DISC" / "title_t00.mkv"
+    raw.parent.mkdir(parents=True)
+    raw.write_bytes(b"mkv")
+    scheduler.put((raw, "DISC", tmp_path / "log.txt"))
+    job = scheduler.get()
+    source = encoding.output_path(job, tmp_path / "scratch")
+    source.parent.mkdir(parents=True)
+    source.write_bytes(b"mp4")
+    scheduler.set_state(job, job_store.TRANSFERRING)
+    scheduler.task_done(job)
+    return job, raw, source
+
+def test_failed_copy_is_retried_on_next_start_without_reencoding(scratch, tmp_path, monkeypatch):
+    scheduler = EncodeScheduler(JobStore(scratch.job_database))
+    stage = transfer.TransferStage(scheduler)
+    job, raw, source = _encoded_job(scheduler, tmp_path)
+
+    def unreachable(source, target):
+        raise OSError("network path not found")
+    with monkeypatch.context() as m:
+        m.setattr(transfer, "copy_file", unreachable)
+        stage.transfer(job)
+
+    assert job.state == job_store.TRANSFER_FAILED
+    assert raw.exists() and source.exists()
+    assert scheduler.put((raw, "DISC", tmp_path / "log.txt")) is None   # Not queued for a second encode
+
+    # Next start: the copy is made from the kept scratch file and the raw file goes
+    store = JobStore(scratch.job_database)
+    assert [j.id for j in store.jobs((job_store.TRANSFERRING,))] == [job.id]
+    transfer.TransferStage(EncodeScheduler(store))
+    target = encoding.output_path(job, scratch.encoded_directory)
+    deadline = time.monotonic() + 10
+    while store.jobs((job_store.RAW_DELETED,)) == [] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert target.read_bytes() == b"mp4"
+    assert not raw.exists() and not source.exists()
+    assert store.jobs((job_store.QUEUED, job_store.ENCODING)) == []
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+import tuner
+from config import cfg
+from tuner import PresetTuner
+
+TITLE = {
+    "Seconds": 3600,
+    "Streams": [{"Type": "Video", "CodecId": "V_MPEG4/ISO/AVC", "VideoSize": "1920x1080",
+                 "FrameRate": "23.976 (24000/1001)"}],
+}
+
+@pytest.fixture
+def tuning(tmp_cfg, tmp_path, monkeypatch):
+    monkeypatch.setattr(cfg, "auto_tune", True)
+    monkeypatch.setattr(cfg, "tune_cache_dir", tmp_path / "tune_cache")
+    monkeypatch.setattr(cfg, "tune_sample_seconds", 10)
+    monkeypatch.setattr(cfg, "tune_sample_windows", 2)
+    monkeypatch.setattr(cfg, "tune_candidates", {"x264": [
+        {"preset": "fast", "quality": "22"}, {"preset": "slow", "quality": "22"},
+    ]})
+    probes = []
+    monkeypatch.setattr(tuner, "probe_source", lambda *a: probes.append(a) or None)
+    return probes
+
+def _runner(paths, barrier=None):
+    def run_sample(settings, start, duration, output):
+        if barrier: barrier.wait(timeout=5)
+        paths.append(output)
+        output.write_bytes(b"x" * 1000)
+        return 0
+    return run_sample
+
+def test_source_class_from_title_needs_no_scan(tuning, tmp_path):
+    source = tuner.source_from_title(TITLE, "SHOW_S1_D1")
+    assert (source.width, source.height, source.codec, source.resolution) == (1920, 1080, "h264", "hd")
+    assert source.fps == pytest.approx(23.976)
+
+    settings = PresetTuner("hb").settings_for(tmp_path / "title_t00.mkv", "SHOW_S1_D1", TITLE, "x264",
+                                              _runner([]), tmp_path / "log.txt")
+    assert settings is not None
+    assert tuning == []   # No HandBrake scan for a ripped title
+
+def test_cached_class_skips_trials(tuning, tmp_path):
+    t = PresetTuner("hb")
+    t.settings_for(tmp_path / "a.mkv", "SHOW_S1_D1", TITLE, "x264", _runner([]), tmp_path / "log.txt")
+    again = []
+    t.settings_for(tmp_path / "a.mkv", "SHOW_S1_D2", TITLE, "x264", _runner(again), tmp_path / "log.txt")
+    assert again == []
+
+def test_concurrent_tuning_runs_use_separate_sample_files(tuning, tmp_path):
+    # Same raw name on two discs of different classes (separate locks), tuned at the same time
+    other = dict(TITLE, Streams=[dict(TITLE["Streams"][0], VideoSize="720x480")])
+    barrier = threading.Barrier(2)
+    paths, results = [], []
+    t = PresetTuner("hb")
+    threads = [
+        threading.Thread(target=lambda info, label: results.append(t.settings_for(
+            tmp_path / "title_t00.mkv", label, info, "x264", _runner(paths, barrier), tmp_path / "log.txt")),
+            args=args)
+        for args in ((TITLE, "MOVIE_A"), (other, "MOVIE_B"))
+    ]
+    for th in threads: th.start()
+    for th in threads: th.join(timeout=10)
+
+    assert len(results) == 2 and None not in results
+    assert len(set(paths)) == len(paths)
+    assert len({p.parent for p in paths}) == 2
+    assert not any(p.parent.exists() for p in paths)
@@ -0,0 +1,111 @@
+# title_rules.py
+import fnmatch
+import json
+import statistics
+from typing import Dict, List, Tuple
+
+from config import cfg
+import utils
+import disc_ops
+
+def parse_selection(selection: str, valid_ids: list, all_ids: list = None) -> list:
+    """all_ids is what 'all' expands to (defaults to valid_ids); explicit numbers may pick any valid id."""
+    s = selection.lower().replace(" ", "")
+    if s == "all": return list(valid_ids if all_ids is None else all_ids)
+    if not s: return []
+    res = set()
+    for part in s.split(','):
+        if '-' in part:
+            try:
+                start, end = map(int, part.split('-'))
+                res.update(range(start, end + 1))
+            except ValueError: pass
+        elif part.isdigit():
+            res.add(int(part))
+    return sorted(list(res.intersection(valid_ids)))
+
+def _candidates(titles: List[Dict], rule: Dict) -> List[Dict]:
+    """Titles a rule may pick from: no aggregates, within the rule's length bounds."""
+    low, high = rule.get("min_seconds", 0), rule.get("max_seconds")
+    return [
+        t for t in titles
+        if not t.get("AggregateOf") and t["Seconds"] >= low and (high is None or t["Seconds"] <= high)
+    ]
+
+def longest(titles: List[Dict], rule: Dict) -> Tuple[List[int], str]:
+    pool = _candidates(titles, rule)
+    if not pool: return [], "longest: no candidates"
+    # Equal lengths: prefer the bigger playlist (e.g. the one with the extra audio tracks)
+    best = max(pool, key=lambda t: (t["Seconds"], disc_ops.parse_size(t.get("Size", ""))))
+    return [best["ID"]], f"longest title ({best['Length']})"
+
+def episodes(titles: List[Dict], rule: Dict) -> Tuple[List[int], str]:
+    pool = _candidates(titles, rule)
+    if not pool: return [], "episodes: no candidates"
+    tolerance = rule.get("tolerance", cfg.episode_tolerance)
+    median = statistics.median(t["Seconds"] for t in pool)
+    chosen = [t["ID"] for t in pool if abs(t["Seconds"] - median) <= median * tolerance]
+    return chosen, f"{len(chosen)} title(s) within {tolerance:.0%} of the {median / 60:.0f} min median"
+
+def all_titles(titles: List[Dict], rule: Dict) -> Tuple[List[int], str]:
+    pool = _candidates(titles, rule)
+    return [t["ID"] for t in pool], f"all {len(pool)} title(s)"
+
+def nothing(titles: List[Dict], rule: Dict) -> Tuple[List[int], str]:
+    return [], "rule says skip"
+
+def auto(titles: List[Dict], rule: Dict) -> Tuple[List[int], str]:
+    """TV disc (a cluster of similar-length titles) -> episodes, otherwise -> longest."""
+    chosen, why = episodes(titles, rule)
+    if len(chosen) >= rule.get("min_episodes", cfg.min_episode_titles):
+        return chosen, f"episodes: {why}"
+    return longest(titles, rule)
+
+RULES = {"auto": auto, "longest": longest, "episodes": episodes, "all": all_titles, "none": nothing}
+
+_SELECTION_MODES = ("prompt", "auto")
+
+def check_settings() -> None:
+    """Validates cfg.selection_mode and cfg.default_title_rule. Raises ValueError for unknown values."""
+    if cfg.selection_mode not in _SELECTION_MODES:
+        raise ValueError(f"selection_mode must be one of {', '.join(_SELECTION_MODES)}, not {cfg.selection_mode!r}")
+    if cfg.default_title_rule not in RULES:
+        raise ValueError(f"default_title_rule must be one of {', '.join(RULES)}, not {cfg.default_title_rule!r}")
+
+def load_rules() -> List[Dict]:
+    """
+    Per-label overrides from cfg.title_rules_path, a JSON list checked top to bottom:
+      [{"pattern": "FRIENDS_S*", "rule": "episodes", "tolerance": 0.15},
+       {"pattern": "*_EXTRAS", "rule": "none"},
+       {"pattern": "LOTR_*", "select": "0,2"}]
+    The file is re-read for every disc, so edits apply without a restart.
+    """
+    path = cfg.title_rules_path
+    if path is None or not path.exists(): return []
+    try:
+        rules = json.loads(path.read_text(encoding="utf-8"))
+        return [r for r in rules if isinstance(r, dict) and "pattern" in r]
+    except (OSError, ValueError) as e:
+        utils.console(f"WARNING: Could not read title rules {path}: {e}")
+        return []
+
+def rule_for(disc_label: str) -> Dict:
+    for rule in load_rules():
+        if fnmatch.fnmatch(disc_label.upper(), str(rule["pattern"]).upper()):
+            return rule
+    return {"pattern": "*", "rule": cfg.default_title_rule}
+
+def select_titles(disc_label: str, titles: List[Dict]) -> Tuple[List[int], str]:
+    """Returns (chosen title IDs, human-readable reason) for a disc without asking anyone."""
+    rule = rule_for(disc_label)
+    if "select" in rule:
+        valid_ids = [t["ID"] for t in titles]
+        all_ids = [t["ID"] for t in titles if not t.get("AggregateOf")]
+        return parse_selection(str(rule["select"]), valid_ids, all_ids), f"rule {rule['pattern']}: select {rule['select']}"
+
+    name = rule.get("rule", cfg.default_title_rule)
+    if name not in RULES:
+        utils.console(f"WARNING: Unknown title rule '{name}' for {disc_label}, using '{cfg.default_title_rule}'")
+        name = cfg.default_title_rule
+    chosen, why = RULES[name](titles, rule)
+    return chosen, f"rule {rule['pattern']} ({name}): {why}"
@@ -0,0 +1,152 @@
+# transfer.py
+import hashlib
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from config import cfg
+import utils
+import job_store
+import metrics
+import encoding
+import fingerprint
+from job_store import Job
+
+class TransferError(RuntimeError):
+    """A copy arrived incomplete or corrupted."""
+
+def copy_file(source: Path, target: Path) -> int:
+    """
+    Copies source to target with large unbuffered reads/writes, verifies the copy
+    (size, or SHA-256 re-read with cfg.transfer_verify = "sha256") and only then
+    renames it into place, so target never exists half-written. Returns the size.
+    """
+    part = target.with_name(target.name + ".part")
+    digest = hashlib.sha256() if cfg.transfer_verify == "sha256" else None
+    buf = bytearray(max(1, cfg.transfer_buffer_mb) * 1024**2)
+    view = memoryview(buf)
+    try:
+        with open(source, "rb", buffering=0) as src, open(part, "wb", buffering=0) as dst:
+            while True:
+                n = src.readinto(buf)
+                if not n: break
+                written = 0
+                while written < n:
+                    written += dst.write(view[written:n])
+                if digest: digest.update(view[:n])
+            os.fsync(dst.fileno())
+
+        size = source.stat().st_size
+        if part.stat().st_size != size:
+            raise TransferError(f"size mismatch ({part.stat().st_size} of {size} bytes arrived)")
+        if digest and _sha256(part, view) != digest.hexdigest():
+            raise TransferError("SHA-256 of the copy does not match the source")
+        os.replace(part, target)
+        return size
+    except BaseException:
+        try: part.unlink()
+        except OSError: pass
+        raise
+
+def _sha256(path: Path, view: memoryview) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(view)
+            if not n: break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+class TransferStage:
+    """
+    Second half of the two-phase output path: encodes verified in cfg.scratch_directory
+    (job state 'transferring') are copied to cfg.encoded_directory by
+    cfg.transfer_workers threads, so slow archive writes never hold an encoder.
+    A job becomes 'verified' and its raw file is deleted only after its copy is confirmed.
+    Transfers interrupted by a restart are picked up again from the job store.
+    """
+
+    def __init__(self, scheduler):
+        self.queue = scheduler
+        self._jobs: "queue.Queue[Job]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.active = 0
+        for i in range(max(1, cfg.transfer_workers)):
+            threading.Thread(target=self._run, daemon=True, name=f"transfer-{i}").start()
+        for job in scheduler.store.jobs((job_store.TRANSFERRING,)):
+            self.submit(job)
+
+    def submit(self, job: Job) -> None:
+        self._jobs.put(job)
+
+    def status(self) -> str:
+        return f"{self.active} copying, {self._jobs.qsize()} waiting"
+
+    def _run(self) -> None:
+        while True:
+            job = self._jobs.get()
+            with self._lock: self.active += 1
+            try:
+                self.transfer(job)
+            except Exception as e:
+                utils.console(f"TRANSFER CRASH on {job.input_path.name}: {e}")
+                self.queue.set_state(job, job_store.FAILED, f"transfer: {e}")
+            finally:
+                with self._lock: self.active -= 1
+
+    def transfer(self, job: Job) -> None:
+        target = encoding.output_path(job, cfg.encoded_directory)
+        source: Optional[Path] = encoding.output_path(job, cfg.scratch_directory) if cfg.scratch_directory else None
+
+        if source is None or not source.exists():
+            if target.exists() and source is not None:
+                # Renamed into place, then interrupted before the job was updated
+                self.finish(job)
+            else:
+                utils.console(f"Scratch copy of {job.input_path.name} is gone, re-encoding")
+                utils.append_log_line(job.log_path, f"XFER MISSING {source}")
+                self.queue.set_state(job, job_store.QUEUED, "scratch copy missing")
+            return
+
+        utils.log_event(job.log_path, "XFER START", target.name, job=job.id, source=source, target=target)
+        for attempt in range(1, cfg.transfer_max_attempts + 1):
+            started = time.monotonic()
+            try:
+                with metrics.registry.span("transfer", attempt=attempt, **metrics.title_key(job)) as span:
+                    utils.ensure_directory(target.parent)
+                    size = copy_file(source, target)
+                    span["bytes"] = size
+            except (OSError, TransferError) as e:
+                utils.console(f"Transfer of {target.name} failed (attempt {attempt}/{cfg.transfer_max_attempts}): {e}")
+                utils.log_event(job.log_path, "XFER FAIL", str(e), job=job.id, attempt=attempt, error=str(e))
+                if attempt == cfg.transfer_max_attempts:
+                    # Scratch copy and raw file are both kept; the next start (main.py or reprocess.py) copies again
+                    utils.console(f"Giving up on {target.name} for now; the copy is retried on the next start")
+                    self.queue.set_state(job, job_store.TRANSFER_FAILED, f"transfer: {e}")
+                    return
+                time.sleep(cfg.transfer_retry_seconds)
+                continue
+
+            seconds = time.monotonic() - started
+            rate = size / seconds / 1024**2 if seconds > 0 else 0.0
+            utils.console(f"Archived: {target.name} ({size / 1024**3:.1f} GB at {rate:.0f} MB/s)")
+            utils.log_event(job.log_path, "XFER SUCCESS", target.name, job=job.id, bytes=size,
+                            seconds=round(seconds, 1), verify=cfg.transfer_verify)
+            try: source.unlink()
+            except OSError: pass
+            self.finish(job)
+            return
+
+    def finish(self, job: Job) -> None:
+        # Held as claimed, so an idle encode worker doesn't pick up the 'verified' job for cleanup too
+        store = self.queue.store
+        store.claim(job)
+        try:
+            fingerprint.remember(store, job, encoding.output_path(job, cfg.encoded_directory))
+            self.queue.set_state(job, job_store.VERIFIED)
+            encoding.cleanup_raw(self.queue, job)
+        finally:
+            store.task_done(job)
@@ -0,0 +1,188 @@
+# tuner.py
+import json
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import cfg
+import utils
+from disk_cache import DiskCache
+
+_JSON_MARKER = "JSON Title Set:"
+_SIZE_LINE_RE = re.compile(r"\+ size: (\d+)x(\d+).*?([\d.]+) fps")
+_VIDEO_SIZE_RE = re.compile(r"^(\d+)x(\d+)")
+_FRAME_RATE_RE = re.compile(r"^\s*([\d.]+)")
+
+# Matroska video codec ids -> the codec names HandBrake's scan reports, so both give the same class key
+_MKV_VIDEO_CODECS = {
+    "V_MPEG2": "mpeg2video", "V_MPEG4/ISO/AVC": "h264", "V_MPEGH/ISO/HEVC": "hevc", "V_MS/VFW/WVC1": "vc1",
+}
+
+# run_sample(settings, start_seconds, duration_seconds, output_path) -> HandBrake exit code
+SampleRunner = Callable[[Dict[str, str], int, int, Path], int]
+
+@dataclass
+class SourceClass:
+    width: int
+    height: int
+    codec: str
+    fps: float
+    label_pattern: str
+    seconds: int = 0
+
+    @property
+    def resolution(self) -> str:
+        if self.width > 2000 or self.height > 1100: return "uhd"
+        if self.height >= 700: return "hd"
+        return "sd"
+
+    def key(self, encoder: str) -> str:
+        return f"{encoder}|{self.codec}|{self.width}x{self.height}|{self.label_pattern}"
+
+def label_pattern(disc_label: str) -> str:
+    """'FRIENDS_S1_D2' -> 'FRIENDS_S#_D#', so every disc of a set shares one profile."""
+    return re.sub(r"\d+", "#", disc_label.upper())
+
+def parse_scan(output: str, disc_label: str) -> Optional[SourceClass]:
+    """Reads resolution, codec and frame rate of the first title from HandBrakeCLI --json --scan output."""
+    marker = output.find(_JSON_MARKER)
+    if marker >= 0:
+        try:
+            data, _ = json.JSONDecoder().raw_decode(output[marker + len(_JSON_MARKER):].lstrip())
+            title = data["TitleList"][0]
+            rate = title.get("FrameRate", {})
+            length = title.get("Duration", {})
+            return SourceClass(
+                title["Geometry"]["Width"], title["Geometry"]["Height"],
+                str(title.get("VideoCodec", "unknown")).lower(),
+                rate["Num"] / rate["Den"] if rate.get("Den") else 0.0,
+                label_pattern(disc_label),
+                length.get("Hours", 0) * 3600 + length.get("Minutes", 0) * 60 + length.get("Seconds", 0),
+            )
+        except (ValueError, KeyError, IndexError, TypeError):
+            pass
+
+    # Older builds without --json: plain text scan summary (codec unknown)
+    match = _SIZE_LINE_RE.search(output)
+    if match:
+        return SourceClass(int(match.group(1)), int(match.group(2)), "unknown",
+                           float(match.group(3)), label_pattern(disc_label))
+    return None
+
+def source_from_title(title_info: Optional[Dict], disc_label: str) -> Optional[SourceClass]:
+    """The source class from the disc scan's video stream, so ripped titles need no HandBrake scan."""
+    video = next((s for s in (title_info or {}).get("Streams", []) if s["Type"] == "Video"), None)
+    if video is None or video.get("CodecId") not in _MKV_VIDEO_CODECS: return None
+    size = _VIDEO_SIZE_RE.match(video.get("VideoSize", ""))
+    if not size: return None
+    rate = _FRAME_RATE_RE.match(video.get("FrameRate", ""))
+    return SourceClass(int(size.group(1)), int(size.group(2)), _MKV_VIDEO_CODECS[video["CodecId"]],
+                       float(rate.group(1)) if rate else 0.0, label_pattern(disc_label),
+                       title_info.get("Seconds", 0))
+
+def probe_source(hb_bin: str, input_path: Path, disc_label: str) -> Optional[SourceClass]:
+    try:
+        result = subprocess.run(
+            [hb_bin, "--json", "--scan", "-t", "1", "-i", str(input_path)],
+            text=True, capture_output=True, check=False, timeout=300
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return parse_scan((result.stdout or "") + (result.stderr or ""), disc_label)
+
+def sample_windows(total_seconds: int) -> List[Tuple[int, int]]:
+    """Evenly spread (start, duration) windows, clear of the opening and closing credits."""
+    length, count = cfg.tune_sample_seconds, cfg.tune_sample_windows
+    if count < 1 or total_seconds < length * (count + 2): return []
+    return [(total_seconds * (i + 1) // (count + 1) - length // 2, length) for i in range(count)]
+
+class PresetTuner:
+    """
+    Picks preset/quality per source class by trial-encoding short samples.
+    Each candidate in cfg.tune_candidates[encoder] encodes the same sample windows;
+    the fastest one whose output bitrate fits cfg.tune_max_mbps for the source's
+    resolution wins (or the smallest, if none fit). Winners are cached on disk,
+    so later discs of the same class skip the trial encodes.
+    """
+
+    def __init__(self, hb_bin: str):
+        self.hb_bin = hb_bin
+        self._cache = DiskCache(cfg.tune_cache_dir, cfg.tune_cache_max_entries)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def settings_for(self, input_path: Path, disc_label: str, title_info: Optional[Dict], encoder: str,
+                     run_sample: SampleRunner, log_path: Path) -> Optional[Dict[str, str]]:
+        """
+        Returns {'preset', 'quality'} for this source, or None to use the configured defaults.
+        The source class comes from title_info's stream table when there is one; only
+        reprocessed files (no title_info) need a HandBrake scan.
+        """
+        candidates = cfg.tune_candidates.get(encoder, [])
+        if not cfg.auto_tune or len(candidates) < 2: return None
+
+        source = source_from_title(title_info, disc_label) or probe_source(self.hb_bin, input_path, disc_label)
+        if source is None:
+            utils.append_log_line(log_path, f"TUNE SKIP {input_path.name}: source scan failed")
+            return None
+        key = source.key(encoder)
+
+        with self._locks_guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        # Workers holding the same source class wait for the first one's trials
+        with lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached["settings"]
+
+            windows = sample_windows((title_info or {}).get("Seconds") or source.seconds)
+            if not windows: return None
+            utils.console(f"Tuning {encoder} for {key} ({len(candidates)} candidates x {len(windows)} samples)")
+            # Own folder per tuning run: raw names like title_t00 repeat on every disc
+            utils.ensure_directory(cfg.raw_directory / ".tune")
+            scratch = Path(tempfile.mkdtemp(prefix=f"{input_path.stem}.", dir=cfg.raw_directory / ".tune"))
+            try:
+                trials = [self._trial(c, windows, source, run_sample, scratch) for c in candidates]
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+            trials = [t for t in trials if t is not None]
+            if not trials: return None
+
+            budget = cfg.tune_max_mbps.get(source.resolution, 0) * 1_000_000 / 8
+            fitting = [t for t in trials if not budget or t["bytes_per_second"] <= budget]
+            best = max(fitting, key=lambda t: t["fps"]) if fitting else min(trials, key=lambda t: t["bytes_per_second"])
+
+            self._cache.put(key, {"settings": best["settings"], "trials": trials})
+            utils.log_event(log_path, "TUNE RESULT", f"{key}: {best['settings']}", key=key,
+                            settings=best["settings"], trials=trials, within_budget=bool(fitting))
+            return best["settings"]
+
+    def _trial(self, settings: Dict[str, str], windows: List[Tuple[int, int]], source: SourceClass,
+               run_sample: SampleRunner, scratch: Path) -> Optional[Dict]:
+        wall, media, size = 0.0, 0, 0
+        for i, (start, duration) in enumerate(windows):
+            sample = scratch / f"{settings['preset']}.q{settings['quality']}.{i}.mp4"
+            try:
+                started = time.monotonic()
+                if run_sample(settings, start, duration, sample) != 0: return None
+                wall += time.monotonic() - started
+                media += duration
+                size += sample.stat().st_size
+            except OSError:
+                return None
+            finally:
+                try: sample.unlink()
+                except OSError: pass
+
+        speed = media / wall if wall else 0.0
+        return {
+            "settings": dict(settings),
+            "fps": round(speed * (source.fps or 24.0), 1),
+            "bytes_per_second": round(size / media) if media else 0,
+        }
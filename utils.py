@@ -1,34 +1,149 @@
 # utils.py
 import sys
+import json
+import queue
+import atexit
 import shutil
 import threading
 import subprocess
+import time
 import re
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
+
+from config import cfg
+import placement
 
-# Global lock ensures the console and log files don't get garbled
-_LOG_LOCK = threading.Lock()
 _INVALID_FILENAME_CHARS = re.compile(r'[^A-Za-z0-9._ \-]')
+# Progress output is redrawn with '\r', so both count as line ends
+_LINE_SPLIT_RE = re.compile(rb'[\r\n]')
 
 def current_timestamp() -> str:
     return datetime.now().strftime("%H:%M:%S")
 
+# --- Logging pipeline ---
+# Callers only enqueue; a single writer thread owns the console and every log
+# file handle, so worker threads never wait on a lock or on disk I/O to log.
+_CONSOLE = object()  # Record target: stdout
+_FLUSH = object()    # Record target: flush everything, then set the Event payload
+
+class _LogWriter(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True, name="log-writer")
+        self.records: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._handles: "OrderedDict[Path, object]" = OrderedDict()
+        self._dirty = False
+
+    def run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                batch = [self.records.get(timeout=cfg.log_flush_seconds)]
+            except queue.Empty:
+                batch = []
+            # Drain whatever else is waiting so it goes out in one batch
+            while True:
+                try: batch.append(self.records.get_nowait())
+                except queue.Empty: break
+
+            console_lines = []
+            for target, payload in batch:
+                if target is _CONSOLE:
+                    console_lines.append(payload)
+                elif target is _FLUSH:
+                    self._write_console(console_lines)
+                    console_lines = []
+                    self._flush()
+                    payload.set()
+                else:
+                    self._write(target, payload)
+            self._write_console(console_lines)
+
+            if self._dirty and time.monotonic() - last_flush >= cfg.log_flush_seconds:
+                self._flush()
+                last_flush = time.monotonic()
+
+    def _write_console(self, lines: List[str]) -> None:
+        if not lines: return
+        try:
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
+        except Exception: pass
+
+    def _write(self, path: Path, data: bytes) -> None:
+        handle = self._handles.get(path)
+        if handle is None:
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                handle = path.open("ab", buffering=256 * 1024)
+            except OSError:
+                return
+            self._handles[path] = handle
+            # Bounded cache: close the least recently used handle
+            while len(self._handles) > cfg.log_max_open_files:
+                _, old = self._handles.popitem(last=False)
+                try: old.close()
+                except OSError: pass
+        else:
+            self._handles.move_to_end(path)
+        try:
+            handle.write(data)
+            self._dirty = True
+        except (OSError, ValueError):
+            self._handles.pop(path, None)
+
+    def _flush(self) -> None:
+        for handle in self._handles.values():
+            try: handle.flush()
+            except (OSError, ValueError): pass
+        self._dirty = False
+
+_WRITER: Optional[_LogWriter] = None
+_WRITER_START_LOCK = threading.Lock()
+
+def _enqueue(target, payload) -> None:
+    global _WRITER
+    if _WRITER is None:
+        with _WRITER_START_LOCK:
+            if _WRITER is None:
+                writer = _LogWriter()
+                writer.start()
+                _WRITER = writer
+    _WRITER.records.put((target, payload))
+
+def flush_logs(timeout: float = 5.0) -> None:
+    """Blocks until everything logged so far has reached the console and disk."""
+    if _WRITER is None: return
+    done = threading.Event()
+    _WRITER.records.put((_FLUSH, done))
+    done.wait(timeout)
+
+atexit.register(flush_logs)
+
 def console(message: str) -> None:
     """Thread-safe console printing."""
-    with _LOG_LOCK:
-        print(f"[{current_timestamp()}] {message}", flush=True)
+    _enqueue(_CONSOLE, f"[{current_timestamp()}] {message}\n")
 
 def append_log_line(log_path: Path, message: str) -> None:
     """Thread-safe file appending."""
-    with _LOG_LOCK:
-        try:
-            log_path.parent.mkdir(parents=True, exist_ok=True)
-            with log_path.open("a", encoding="utf-8") as log_file:
-                log_file.write(f"[{current_timestamp()}] {message}\n")
-        except OSError:
-            pass 
+    _enqueue(log_path, f"[{current_timestamp()}] {message}\n".encode("utf-8"))
+
+def events_path(log_path: Path) -> Path:
+    """JSONL event stream written next to a human-readable log."""
+    return log_path.with_name(log_path.stem + ".events.jsonl")
+
+def log_event(log_path: Path, event: str, message: str = "", **fields) -> None:
+    """
+    Writes 'EVENT message' to the log and a structured record to its JSONL event stream.
+    Used for the RIP/ENC START, SUCCESS and FAIL milestones.
+    """
+    append_log_line(log_path, f"{event} {message}".rstrip())
+    record: Dict = {"time": datetime.now().isoformat(timespec="milliseconds"), "event": event}
+    if message: record["message"] = message
+    record.update(fields)
+    _enqueue(events_path(log_path), (json.dumps(record, default=str) + "\n").encode("utf-8"))
 
 def ensure_directory(path_like: Path) -> None:
     path_like.mkdir(parents=True, exist_ok=True)
@@ -44,33 +159,70 @@ def resolve_binary(path_cfg: Optional[str], binary_name: str) -> str:
         return system_path
     raise FileNotFoundError(f"Missing executable: {binary_name}")
 
-def run_stream_log(executable: str, args: List[str], log_path: Path, low_priority: bool = False) -> int:
+def run_stream_log(
+    executable: str,
+    args: List[str],
+    log_path: Path,
+    role: Optional[str] = None,
+    on_line: Optional[Callable[[str], None]] = None,
+    watchdog: Optional[Callable[[], bool]] = None,
+    lane: Optional[str] = None,
+) -> int:
     """
     Runs a subprocess and pipes output to a log file.
-    Includes logic to set process priority to 'Below Normal' for encoding.
+    role ('rip' / 'encode') picks the process priority, I/O class and, for
+    encodes, the CPU affinity of the encoder lane (see placement.py).
+    Output is read incrementally: each line (split on \r or \n) is passed to
+    on_line as it arrives. watchdog is polled every second while the process
+    runs; returning True kills the process.
     """
     creation_flags = 0
-    if low_priority and sys.platform == "win32":
+    if role == placement.ENCODE and sys.platform == "win32":
         # Windows: BELOW_NORMAL_PRIORITY_CLASS (0x00004000)
         creation_flags = 0x00004000 
 
-    with _LOG_LOCK:
-        log_file_bin = log_path.open("ab")
-
     try:
-        return subprocess.run(
+        proc = subprocess.Popen(
             [executable] + args, 
-            stdout=log_file_bin, 
+            stdout=subprocess.PIPE, 
             stderr=subprocess.STDOUT, 
-            check=False,
             creationflags=creation_flags 
-        ).returncode
-    except Exception as e:
+        )
+        reader = threading.Thread(target=_pump_output, args=(proc.stdout, log_path, on_line), daemon=True)
+        reader.start()
+
+        placement.manager.started(proc.pid, role, lane)
         try:
-            log_file_bin.write(f"\nCRITICAL SUBPROCESS ERROR: {e}\n".encode())
-        except: pass
+            while True:
+                try:
+                    proc.wait(timeout=1)
+                    break
+                except subprocess.TimeoutExpired:
+                    if watchdog and watchdog():
+                        proc.kill()
+        finally:
+            placement.manager.finished(proc.pid)
+
+        reader.join(timeout=5)
+        return proc.returncode
+    except Exception as e:
+        _enqueue(log_path, f"\nCRITICAL SUBPROCESS ERROR: {e}\n".encode())
         return 1
-    finally:
-        try:
-            log_file_bin.close()
-        except: pass
\ No newline at end of file
+
+def _pump_output(stream, log_path: Path, on_line: Optional[Callable[[str], None]]) -> None:
+    """Copies subprocess output to the log and hands complete lines to on_line."""
+    pending = b""
+    while True:
+        chunk = stream.read1(65536)
+        if not chunk: break
+        _enqueue(log_path, chunk)
+        if on_line is None: continue
+
+        *lines, pending = _LINE_SPLIT_RE.split(pending + chunk)
+        for line in lines:
+            if line:
+                try: on_line(line.decode("utf-8", errors="replace"))
+                except Exception: pass
+    if on_line and pending:
+        try: on_line(pending.decode("utf-8", errors="replace"))
+        except Exception: pass